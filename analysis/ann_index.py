@@ -0,0 +1,215 @@
+"""Approximate nearest-neighbour (IVF) index of the embedding store.
+
+The rows of an embedding store are grouped in lists by a spherical k-means coarse
+quantizer. A query only scores the rows of the lists whose centroids are the most
+similar to it (the probed lists), so searching a corpus of hundreds of thousands of
+embeddings reads and scores a fraction of them. Probing more lists finds more of
+the rows an exact search would find (recall) at the cost of speed.
+
+The index is kept in the folder of the model in the store:
+
+- ivf_centroids.npz: the normalized centroid of every list and the mean of the
+  embeddings, which is subtracted before assigning them to lists (embeddings of a
+  corpus share a large common component that would otherwise put most of them in a
+  few lists).
+- ivf_lists.bin: the list of every row of the store (int32), in row order.
+
+Rows added to the store are assigned to the existing lists the next time the index
+is used. Automatic lists are trained again when the store has grown four times since
+they were trained.
+"""
+import os
+
+import numpy as np
+
+from analysis.embedding_store import EmbeddingStore
+from util.logging_standards import LogCategory
+from util.util import logger
+
+# Rows needed to train the lists; smaller stores are searched exhaustively
+MIN_TRAINING_ROWS = 1000
+# Rows of the store sampled per list to train the centroids
+SAMPLE_ROWS_PER_LIST = 64
+TRAINING_ITERATIONS = 8
+# Rows read from the store at a time
+BATCH_ROWS = 65536
+
+
+def _normalize(embeddings: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+def _cosine(embeddings: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """Cosine similarity of every embedding with a normalized query (without normalizing a copy of the rows)."""
+    norms = np.sqrt(np.einsum('ij,ij->i', embeddings, embeddings))
+    return (embeddings @ query) / np.maximum(norms, 1e-12)
+
+
+def train_centroids(embeddings: np.ndarray, lists: int, iterations: int = TRAINING_ITERATIONS,
+                    seed: int = 0) -> np.ndarray:
+    """Spherical k-means of embeddings.
+
+    Args:
+        embeddings: Matrix with one embedding per row.
+        lists: Number of centroids.
+        iterations: Number of k-means iterations.
+        seed: Seed of the initial centroids (a random sample of the rows).
+
+    Returns:
+        Normalized centroids, one per row.
+    """
+    embeddings = _normalize(np.asarray(embeddings, dtype=np.float32))
+    rng = np.random.default_rng(seed)
+    centroids = embeddings[rng.choice(len(embeddings), lists, replace=False)]
+    for _ in range(iterations):
+        assignments = np.argmax(embeddings @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, embeddings)
+        empty = ~sums.any(axis=1)
+        # Empty lists restart from random rows
+        sums[empty] = embeddings[rng.choice(len(embeddings), int(empty.sum()), replace=False)]
+        centroids = _normalize(sums)
+    return centroids
+
+
+class IVFIndex:
+    """Inverted file index of the rows of an embedding store.
+
+    Args:
+        store: Embedding store of a model.
+        lists: Number of lists; 0 chooses about the square root of the number of rows.
+    """
+
+    def __init__(self, store: EmbeddingStore, lists: int = 0):
+        self.store = store
+        self.lists = lists
+        self.centroids_file = os.path.join(store.folder, 'ivf_centroids.npz')
+        self.lists_file = os.path.join(store.folder, 'ivf_lists.bin')
+        self.centroids = self.mean = None
+        if os.path.exists(self.centroids_file):
+            with np.load(self.centroids_file) as trained:
+                self.centroids, self.mean = trained['centroids'], trained['mean']
+        if self.centroids is not None and os.path.exists(self.lists_file):
+            self.assignments = np.fromfile(self.lists_file, dtype=np.int32)[:len(store)]
+        else:
+            self.assignments = np.empty(0, dtype=np.int32)
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def _centered(self, embeddings: np.ndarray) -> np.ndarray:
+        """Normalized embeddings without the mean of the corpus."""
+        return _normalize(_normalize(np.atleast_2d(embeddings).astype(np.float32)) - self.mean)
+
+    def _assign(self, start: int) -> np.ndarray:
+        """Lists of the rows of the store from start."""
+        assignments = [np.argmax(self._centered(self.store.get(np.arange(first, min(first + BATCH_ROWS, len(self.store)))))
+                                 @ self.centroids.T, axis=1).astype(np.int32)
+                       for first in range(start, len(self.store), BATCH_ROWS)]
+        return np.concatenate(assignments) if assignments else np.empty(0, dtype=np.int32)
+
+    def _train(self) -> None:
+        """Train the lists on a sample of the store and assign all its rows."""
+        rows = len(self.store)
+        lists = self.lists or max(1, int(np.sqrt(rows)))
+        rng = np.random.default_rng(0)
+        sample = np.sort(rng.choice(rows, min(rows, lists * SAMPLE_ROWS_PER_LIST), replace=False))
+        embeddings = _normalize(self.store.get(sample))
+        self.mean = embeddings.mean(axis=0)
+        self.centroids = train_centroids(embeddings - self.mean, lists)
+        self.assignments = self._assign(0)
+        np.savez(self.centroids_file, centroids=self.centroids, mean=self.mean)
+        self.assignments.tofile(self.lists_file)
+        logger.info(
+            LogCategory.DATA,
+            "ann_index",
+            "sync",
+            f"Trained {lists} index lists on {len(sample)} of {rows} embeddings of {self.store.model_name}"
+        )
+
+    def sync(self) -> None:
+        """Train the lists or assign the rows added to the store since the last use."""
+        rows = len(self.store)
+        if rows < MIN_TRAINING_ROWS:
+            return
+        # Automatic lists (about the square root of the trained rows) are trained again when the store grows 4x
+        if not self.trained or (self.lists == 0 and rows >= 4 * max(len(self.centroids) ** 2, MIN_TRAINING_ROWS)):
+            self._train()
+        elif len(self.assignments) < rows:
+            new = self._assign(len(self.assignments))
+            # Drop the lists of an interrupted append before appending the new ones
+            with open(self.lists_file, 'r+b' if os.path.exists(self.lists_file) else 'wb') as f:
+                f.truncate(len(self.assignments) * 4)
+                f.seek(0, os.SEEK_END)
+                f.write(new.tobytes())
+            self.assignments = np.concatenate([self.assignments, new])
+
+    def probe(self, query: np.ndarray, probes: int) -> np.ndarray:
+        """Lists whose centroids are the most similar to the query."""
+        similarities = self.centroids @ self._centered(query)[0]
+        probes = min(probes, len(similarities))
+        return np.argpartition(-similarities, probes - 1)[:probes]
+
+    def candidates(self, rows: np.ndarray, query: np.ndarray, probes: int) -> np.ndarray:
+        """Mask of the rows in the lists probed for the query (all rows when the index is not trained).
+
+        Args:
+            rows: Rows of the store.
+            query: Query embedding.
+            probes: Number of lists probed.
+        """
+        self.sync()
+        rows = np.asarray(rows)
+        if not self.trained or probes >= len(self.centroids):
+            return np.ones(len(rows), dtype=bool)
+        probed = np.zeros(len(self.centroids), dtype=bool)
+        probed[self.probe(query, probes)] = True
+        return probed[self.assignments[rows]]
+
+    def search(self, query: np.ndarray, score: float, probes: int):
+        """Rows of the store with a cosine similarity of at least score to the query.
+
+        Args:
+            query: Query embedding.
+            score: Minimum cosine similarity.
+            probes: Number of lists probed (0 for an exact search of every row).
+
+        Returns:
+            Tuple with the rows found and their scores.
+        """
+        self.sync()
+        query = _normalize(np.asarray(query, dtype=np.float32)[None, :])[0]
+        if probes > 0 and self.trained:
+            rows = np.flatnonzero(self.candidates(np.arange(len(self.store)), query, probes))
+        else:
+            rows = np.arange(len(self.store))
+        scores = np.concatenate([_cosine(self.store.get(rows[first:first + BATCH_ROWS]), query)
+                                 for first in range(0, len(rows), BATCH_ROWS)] or [np.empty(0, np.float32)])
+        found = scores >= score
+        return rows[found], scores[found]
+
+    def recall(self, queries: np.ndarray, score: float, probes: int) -> float:
+        """Fraction of the rows found by an exact search that are found probing probes lists.
+
+        Args:
+            queries: Query embeddings, one per row.
+            score: Minimum cosine similarity.
+            probes: Number of lists probed.
+
+        Returns:
+            The recall (1 when the exact search finds no rows).
+        """
+        exact = found = 0
+        for query in np.atleast_2d(queries):
+            exact_rows, _ = self.search(query, score, 0)
+            probed_rows, _ = self.search(query, score, probes)
+            exact += len(exact_rows)
+            found += len(np.intersect1d(exact_rows, probed_rows))
+        return found / exact if exact else 1.0
+
+
+def open_index(store: EmbeddingStore, probes: int):
+    """Index of a store (None when probes is 0, i.e. exhaustive search, or there is no store)."""
+    return IVFIndex(store) if store is not None and probes > 0 else None
@@ -0,0 +1,292 @@
+"""Persistent store of the embeddings of papers, keyed by model name and text hash.
+
+Every model has its own folder in the store with:
+
+- vectors.bin: the embeddings, one row per text, as a raw float32, float16 or int8 matrix
+  read through a memory map, so only the rows that are used are loaded.
+- scales.bin: for int8 stores, the float32 scale of every row (row = scale * int8 values).
+- hashes.bin: the 64-bit hash of the text of every row (int64), in row order.
+- meta.json: the model name, the dimension and the data type of the rows.
+
+Rows are only appended, so the texts of a survey are encoded once and re-running a
+semantic filter with another description or score only encodes the new query.
+"""
+import json
+import os
+import re
+import time
+from os.path import exists
+
+import numpy as np
+import pandas as pd
+
+from analysis import model_registry
+from util.language import clean_texts, text_hashes
+from util.logging_standards import LogCategory
+from util.util import logger
+
+DEFAULT_STORE_FOLDER = './papers/embeddings'
+SUPPORTED_DTYPES = ['float32', 'float16', 'int8']
+
+
+def quantize(embeddings: np.ndarray, dtype: str):
+    """Embeddings converted to the data type of a store.
+
+    int8 rows are scaled so that their largest absolute value is 127, keeping the
+    direction of every embedding (cosine similarities change by well under 1%).
+
+    Args:
+        embeddings: Matrix with one embedding per row.
+        dtype: 'float32', 'float16' or 'int8'.
+
+    Returns:
+        Tuple with the converted rows and the float32 scale of every row (None when
+        dtype is not int8).
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if np.dtype(dtype) != np.int8:
+        return embeddings.astype(dtype), None
+    scales = np.abs(embeddings).max(axis=1) / 127
+    scales[scales == 0] = 1.0
+    values = np.clip(np.rint(embeddings / scales[:, None]), -127, 127).astype(np.int8)
+    return values, scales.astype(np.float32)
+
+
+def dequantize(values: np.ndarray, scales: np.ndarray = None) -> np.ndarray:
+    """float32 embeddings of rows converted with quantize."""
+    embeddings = np.asarray(values, dtype=np.float32)
+    if scales is not None:
+        embeddings *= np.asarray(scales, dtype=np.float32)[:, None]
+    return embeddings
+
+
+def encode_texts(texts: list, model_name: str, show_progress_bar: bool = False, workers: int = 1,
+                 batch_size: int = 32) -> np.ndarray:
+    """Encode texts with a model of the model registry and log the throughput.
+
+    With more than one worker, texts are fed in chunks of batches to a pool of worker
+    processes holding the model (see model_registry.get_pool). Inputs of at most one
+    batch (e.g. a query) are encoded in the calling process.
+
+    Args:
+        texts: List of texts.
+        model_name: Name of the SentenceTransformer model.
+        show_progress_bar: Whether the model shows a progress bar while encoding.
+        workers: Number of encoding processes.
+        batch_size: Texts encoded at a time by a process.
+
+    Returns:
+        float32 matrix with one row per text.
+    """
+    start = time.perf_counter()
+    model = model_registry.get_model(model_name)
+    if workers > 1 and len(texts) > batch_size:
+        pool = model_registry.get_pool(model_name, workers)
+        start = time.perf_counter()
+        # Chunks of several batches keep every worker busy without many queue round trips
+        embeddings = model.encode(texts, pool=pool, batch_size=batch_size, show_progress_bar=show_progress_bar,
+                                  chunk_size=max(batch_size, min(8 * batch_size, -(-len(texts) // workers))))
+    else:
+        workers = 1
+        embeddings = model.encode(texts, batch_size=batch_size, convert_to_numpy=True,
+                                  show_progress_bar=show_progress_bar)
+    seconds = time.perf_counter() - start
+    if len(texts) > batch_size:
+        logger.info(
+            LogCategory.DATA,
+            "embedding_store",
+            "encode_texts",
+            f"Encoded {len(texts)} texts with {model_name} in {seconds:.1f}s "
+            f"({len(texts) / max(seconds, 1e-9):.0f} texts/s, {workers} process{'es' if workers > 1 else ''})"
+        )
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+def _model_folder(folder: str, model_name: str) -> str:
+    """Folder of the embeddings of a model (the model name made safe for file names)."""
+    return os.path.join(folder, re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name))
+
+
+class EmbeddingStore:
+    """Embeddings of one model stored on disk.
+
+    Args:
+        folder: Folder of the store (one sub-folder per model).
+        model_name: Name of the model that produced the embeddings.
+        dtype: Data type of new stores ('float32', 'float16' or 'int8'); existing stores keep theirs.
+        workers: Number of processes encoding the texts that are not in the store.
+        batch_size: Texts encoded at a time by a process.
+    """
+
+    def __init__(self, folder: str, model_name: str, dtype: str = 'float32', workers: int = 1, batch_size: int = 32):
+        if dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"Unsupported embedding dtype '{dtype}', expected one of {SUPPORTED_DTYPES}")
+        self.folder = _model_folder(folder, model_name)
+        self.model_name = model_name
+        self.dtype = np.dtype(dtype)
+        self.dimension = None
+        self.workers = workers
+        self.batch_size = batch_size
+        self.vectors_file = os.path.join(self.folder, 'vectors.bin')
+        self.hashes_file = os.path.join(self.folder, 'hashes.bin')
+        self.scales_file = os.path.join(self.folder, 'scales.bin')
+        self.meta_file = os.path.join(self.folder, 'meta.json')
+        self._load()
+
+    def _load(self) -> None:
+        """Read the index of the store and map its vectors."""
+        self.vectors = None
+        self.scales = None
+        self.index = pd.Index(np.empty(0, dtype=np.int64))
+        if not exists(self.meta_file):
+            return
+        with open(self.meta_file, encoding='utf-8') as f:
+            meta = json.load(f)
+        self.dtype = np.dtype(meta['dtype'])
+        self.dimension = int(meta['dimension'])
+        hashes = np.fromfile(self.hashes_file, dtype=np.int64) if exists(self.hashes_file) else np.empty(0, np.int64)
+        row_bytes = self.dimension * self.dtype.itemsize
+        vector_rows = os.path.getsize(self.vectors_file) // row_bytes if exists(self.vectors_file) else 0
+        # Rows of an interrupted append are ignored
+        rows = min(len(hashes), vector_rows)
+        if self.quantized:
+            rows = min(rows, os.path.getsize(self.scales_file) // 4 if exists(self.scales_file) else 0)
+        self.index = pd.Index(hashes[:rows])
+        if rows > 0:
+            self._map(rows)
+
+    @property
+    def quantized(self) -> bool:
+        """Whether the rows are int8 with a scale per row."""
+        return self.dtype == np.int8
+
+    def _map(self, rows: int) -> None:
+        """Map the first rows of the vectors (and scales) files."""
+        self.vectors = np.memmap(self.vectors_file, dtype=self.dtype, mode='r', shape=(rows, self.dimension))
+        if self.quantized:
+            self.scales = np.memmap(self.scales_file, dtype=np.float32, mode='r', shape=(rows,))
+
+    def __len__(self):
+        return len(self.index)
+
+    def lookup(self, hashes: np.ndarray) -> np.ndarray:
+        """Rows of the texts with the given hashes (-1 for texts not in the store)."""
+        if len(self.index) == 0:
+            return np.full(len(hashes), -1, dtype=np.int64)
+        return self.index.get_indexer(hashes)
+
+    def get(self, rows: np.ndarray) -> np.ndarray:
+        """Embeddings of rows of the store as float32."""
+        if len(rows) == 0:
+            return np.empty((0, self.dimension or 0), dtype=np.float32)
+        rows = np.asarray(rows)
+        return dequantize(self.vectors[rows], self.scales[rows] if self.quantized else None)
+
+    def add(self, hashes: np.ndarray, embeddings: np.ndarray) -> None:
+        """Append the embeddings of new texts (texts already in the store are skipped)."""
+        embeddings = np.asarray(embeddings)
+        new = self.lookup(hashes) < 0
+        new &= ~pd.Index(hashes).duplicated()
+        if not new.any():
+            return
+        if self.dimension is None:
+            self.dimension = int(embeddings.shape[1])
+            os.makedirs(self.folder, exist_ok=True)
+            with open(self.meta_file, 'w', encoding='utf-8') as f:
+                json.dump({'model': self.model_name, 'dimension': self.dimension, 'dtype': self.dtype.name}, f)
+        elif embeddings.shape[1] != self.dimension:
+            raise ValueError(f"Embeddings of dimension {embeddings.shape[1]} do not match the store "
+                             f"of {self.model_name} ({self.dimension})")
+        # Drop the rows of an interrupted append so the new rows follow the indexed ones
+        for file_name, row_bytes in [(self.vectors_file, self.dimension * self.dtype.itemsize),
+                                     (self.scales_file, 4), (self.hashes_file, 8)]:
+            if exists(file_name) and os.path.getsize(file_name) != len(self.index) * row_bytes:
+                with open(file_name, 'r+b') as f:
+                    f.truncate(len(self.index) * row_bytes)
+        values, scales = quantize(embeddings[new], self.dtype.name)
+        # Vectors are written before their hashes so an interrupted append leaves no unknown rows
+        with open(self.vectors_file, 'ab') as f:
+            f.write(np.ascontiguousarray(values).tobytes())
+        if scales is not None:
+            with open(self.scales_file, 'ab') as f:
+                f.write(scales.tobytes())
+        with open(self.hashes_file, 'ab') as f:
+            f.write(np.ascontiguousarray(hashes[new], dtype=np.int64).tobytes())
+        self.index = self.index.append(pd.Index(np.asarray(hashes[new], dtype=np.int64)))
+        self._map(len(self.index))
+
+    def rows(self, texts: list, show_progress_bar: bool = False) -> np.ndarray:
+        """Rows of texts in the store, encoding and adding first the texts that are not in it.
+
+        The model is taken from the model registry, and only when some text has to be encoded
+        (see encode_texts).
+
+        Args:
+            texts: List of texts (see clean_texts).
+            show_progress_bar: Whether the model shows a progress bar while encoding.
+
+        Returns:
+            Row of every text.
+        """
+        hashes = text_hashes(texts)
+        rows = self.lookup(hashes)
+        missing = rows < 0
+        if missing.any():
+            # Every distinct missing text is encoded once
+            positions = np.flatnonzero(missing)
+            _, first = np.unique(hashes[missing], return_index=True)
+            first = positions[np.sort(first)]
+            embeddings = encode_texts([texts[position] for position in first], self.model_name,
+                                      show_progress_bar=show_progress_bar, workers=self.workers,
+                                      batch_size=self.batch_size)
+            self.add(hashes[first], embeddings)
+            rows = self.lookup(hashes)
+            logger.info(
+                LogCategory.DATA,
+                "embedding_store",
+                "encode",
+                f"Encoded {len(first)} texts with {self.model_name}, "
+                f"{len(texts) - int(missing.sum())} found in the embedding store"
+            )
+        return rows
+
+    def encode(self, texts: list, show_progress_bar: bool = False) -> np.ndarray:
+        """Embeddings of texts, encoding only the texts that are not in the store (see rows).
+
+        Returns:
+            float32 matrix with one row per text.
+        """
+        return self.get(self.rows(texts, show_progress_bar=show_progress_bar))
+
+
+def open_store(folder: str, model_name: str, dtype: str = 'float32', workers: int = 1, batch_size: int = 32):
+    """Open the store of a model (None when folder is empty, i.e. the store is disabled)."""
+    return EmbeddingStore(folder, model_name, dtype, workers, batch_size) if folder else None
+
+
+def encode(texts, model_name: str = model_registry.DEFAULT_MODEL, store_folder: str = DEFAULT_STORE_FOLDER,
+           dtype: str = 'float32', show_progress_bar: bool = False, store: EmbeddingStore = None,
+           workers: int = 1, batch_size: int = 32) -> np.ndarray:
+    """Embeddings of texts, encoding only the texts that are not in the store.
+
+    Args:
+        texts: Iterable of texts.
+        model_name: Name of the SentenceTransformer model.
+        store_folder: Folder of the embedding store; when empty the texts are always encoded.
+        dtype: Data type of the rows of a new store ('float32', 'float16' or 'int8').
+        show_progress_bar: Whether the model shows a progress bar while encoding.
+        store: Already opened store of the model (e.g. when encoding a corpus in chunks);
+            model_name, store_folder, dtype, workers and batch_size are then ignored.
+        workers: Number of encoding processes (see encode_texts).
+        batch_size: Texts encoded at a time by a process.
+
+    Returns:
+        float32 matrix with one row per text.
+    """
+    texts = clean_texts(texts)
+    if store is None and store_folder:
+        store = EmbeddingStore(store_folder, model_name, dtype, workers, batch_size)
+    if store is not None:
+        return store.encode(texts, show_progress_bar=show_progress_bar)
+    return encode_texts(texts, model_name, show_progress_bar=show_progress_bar, workers=workers,
+                        batch_size=batch_size)
@@ -1,6 +1,9 @@
 import pandas as pd
 from os.path import exists
 from util import util
+from util import near_duplicates
+from analysis import prioritization
+from analysis import screening
 from util.error_standards import (
     ErrorHandler, create_error_context, ErrorSeverity, ErrorCategory,
     get_standard_error_info
@@ -13,7 +16,7 @@ logger = logging.getLogger('logger')
 
 
 # Manual filter by abstract
-def manual_filter_by_abstract(folder_name, next_file, search_date, step):
+def manual_filter_by_abstract(folder_name, next_file, search_date, step, semantic_filters=None):
     try:
         papers_file = './papers/' + folder_name + '/' + str(search_date).replace('-', '_') + '/' + next_file
         file_name = './papers/' + folder_name + '/' + str(search_date).replace('-', '_') + '/' + str(step) + \
@@ -23,73 +26,52 @@ def manual_filter_by_abstract(folder_name, next_file, search_date, step):
         if exists(papers_file):
             try:
                 to_check_papers = pd.read_csv(papers_file)
-                unknown_papers = len(to_check_papers.loc[to_check_papers['status'] == 'unknown'])
+                to_check_papers = merge_near_duplicate_papers(to_check_papers)
+                # Titles as encoded by the semantic filter, for the prioritization of the papers
+                titles = to_check_papers['title']
+                try:
+                    # Data preprocessing with error handling
+                    to_check_papers['title'] = to_check_papers['title'].str.lower()
+                    to_check_papers = to_check_papers.drop_duplicates('title')
+                    to_check_papers['abstract_norm'] = to_check_papers['abstract'].str.lower()
+                    to_check_papers['abstract_norm'] = to_check_papers['abstract_norm'].str.replace(' ', '')
+                    to_check_papers = to_check_papers.drop_duplicates('abstract_norm')
+                    to_check_papers = to_check_papers.drop(columns=['abstract_norm'])
+                except (KeyError, ValueError, TypeError) as e:
+                    print(f"Error during data preprocessing: {type(e).__name__}: {str(e)}")
+                    return next_file, pd.DataFrame()
                 
-                while unknown_papers > 0:
-                    try:
-                        # Data preprocessing with error handling
-                        to_check_papers['title'] = to_check_papers['title'].str.lower()
-                        to_check_papers = to_check_papers.drop_duplicates('title')
-                        to_check_papers['abstract_norm'] = to_check_papers['abstract'].str.lower()
-                        to_check_papers['abstract_norm'] = to_check_papers['abstract_norm'].str.replace(' ', '')
-                        to_check_papers = to_check_papers.drop_duplicates('abstract_norm')
-                        to_check_papers = to_check_papers.drop(columns=['abstract_norm'])
-                        
-                        total_papers = len(to_check_papers)
-                        unknown_papers = len(to_check_papers.loc[to_check_papers['status'] == 'unknown'])
-                        included_papers = len(to_check_papers.loc[to_check_papers['status'] == 'included'])
-                        excluded_papers = len(to_check_papers.loc[to_check_papers['status'] == 'not included'])
-                        progress = round(((total_papers - unknown_papers) / total_papers) * 100, 2)
-                        
-                        print('::: Progress --> ' + str(progress) + '% :::')
-                        print(' ::: Included (' + str(included_papers) + ') ::: Excluded(' + str(excluded_papers) + ') ::: Unknown('
-                              + str(unknown_papers) + ') :::')
-                        
-                        if len(to_check_papers.loc[to_check_papers['status'] == 'unknown']) > 0:
-                            try:
-                                to_check_paper = to_check_papers.loc[to_check_papers['status'] == 'unknown'].sample()
-                                print_paper_info(to_check_paper, file_name)
-                                included, algorithm_type, training_schema, algorithm_goal, architecture = ask_manual_input()
-                                paper_id = to_check_paper['id'].values[0]
-                                
-                                if included == 'included':
-                                    try:
-                                        paper_dict = {'id': (included_papers + 1), 'status': 'unknown', 'doi': to_check_paper['doi'],
-                                                      'publisher': to_check_paper['publisher'], 'database': to_check_paper['database'],
-                                                      'query_name': to_check_paper['query_name'], 'query_value': to_check_paper['query_value'],
-                                                      'url': to_check_paper['url'], 'publication_date': to_check_paper['publication_date'],
-                                                      'title': to_check_paper['title'], 'abstract': to_check_paper['abstract']
-                                                      }
-                                        if 'semantic_score' in to_check_paper:
-                                            paper_dict['semantic_score'] = to_check_paper['semantic_score']
-                                        paper_df = pd.DataFrame.from_dict(paper_dict)
-                                        util.save(file_name, paper_df, fr, 'a+')
-                                    except (KeyError, ValueError, TypeError) as e:
-                                        print(f"Error creating paper dictionary: {type(e).__name__}: {str(e)}")
-                                        continue
-                                    except Exception as ex:
-                                        print(f"Unexpected error creating paper dictionary: {type(ex).__name__}: {str(ex)}")
-                                        continue
-                                
-                                try:
-                                    update_semantic_filtered_papers(to_check_papers, papers_file, paper_id, included)
-                                except Exception as update_ex:
-                                    print(f"Error updating papers file: {type(update_ex).__name__}: {str(update_ex)}")
-                                    continue
-                                    
-                            except (KeyError, ValueError, TypeError, IndexError) as e:
-                                print(f"Error processing individual paper: {type(e).__name__}: {str(e)}")
-                                continue
-                            except Exception as ex:
-                                print(f"Unexpected error processing individual paper: {type(ex).__name__}: {str(ex)}")
-                                continue
+                # Papers likely to be relevant are reviewed first (see the 'screening_priority' performance parameter)
+                prioritizer = prioritization.open_prioritizer(to_check_papers.assign(title=titles), semantic_filters)
+                # Next papers are prepared and decisions saved in the background
+                with screening.ScreeningSession(to_check_papers, papers_file, file_name, 'unknown',
+                                                prioritizer=prioritizer) as session:
+                    while session.pending > 0:
+                        try:
+                            included_papers = session.counts['included']
+                            excluded_papers = session.counts['not included']
+                            progress = round(((session.total - session.pending) / session.total) * 100, 2)
+                            
+                            print('::: Progress --> ' + str(progress) + '% :::')
+                            print(' ::: Included (' + str(included_papers) + ') ::: Excluded(' + str(excluded_papers) + ') ::: Unknown('
+                                  + str(session.pending) + ') :::')
+                            remaining_relevant = session.remaining_relevant()
+                            if remaining_relevant is not None:
+                                print(' ::: Estimated relevant papers among the unknown ones (' + str(round(remaining_relevant, 1)) + ') :::')
+                            
+                            candidate = session.next()
+                            if candidate is None:
+                                break
+                            print_paper_info(candidate.paper, file_name)
+                            included, algorithm_type, training_schema, algorithm_goal, architecture = ask_manual_input()
+                            session.decide(candidate, included)
                                 
-                    except (KeyError, ValueError, TypeError) as e:
-                        print(f"Error during data preprocessing: {type(e).__name__}: {str(e)}")
-                        break
-                    except Exception as ex:
-                        print(f"Unexpected error during data preprocessing: {type(ex).__name__}: {str(ex)}")
-                        break
+                        except (KeyError, ValueError, TypeError, IndexError) as e:
+                            print(f"Error processing individual paper: {type(e).__name__}: {str(e)}")
+                            continue
+                        except Exception as ex:
+                            print(f"Unexpected error processing individual paper: {type(ex).__name__}: {str(ex)}")
+                            break
                         
             except (pd.errors.EmptyDataError, pd.errors.ParserError, FileNotFoundError) as e:
                 context = create_error_context(
@@ -182,6 +164,66 @@ def manual_filter_by_abstract(folder_name, next_file, search_date, step):
         return next_file, pd.DataFrame()
 
 
+def merge_near_duplicate_papers(to_check_papers):
+    # Near duplicates (e.g. preprint and published versions) are only screened once.
+    # Papers already screened are kept over unknown ones so their decision is not lost,
+    # and included papers over excluded ones, so a cluster with both stays included.
+    try:
+        deduplication_parameters = util.get_deduplication_parameters()
+        threshold = deduplication_parameters['near_duplicate_threshold']
+        if threshold <= 0:
+            return to_check_papers
+        priority = (to_check_papers['status'] != 'unknown').astype(int) + \
+            (to_check_papers['status'] == 'included').astype(int)
+        merged_papers, provenance = near_duplicates.merge_near_duplicates(
+            to_check_papers, threshold=threshold, num_perm=deduplication_parameters['num_perm'],
+            shingle_size=deduplication_parameters['shingle_size'], priority=priority)
+        if len(provenance) > 0:
+            logger.info(f"Merged {len(provenance)} near-duplicate papers")
+            print('::: Merged ' + str(len(provenance)) + ' near-duplicate papers :::')
+        return merged_papers
+    except (KeyError, ValueError, TypeError) as e:
+        context = create_error_context(
+            module="manual",
+            function="merge_near_duplicate_papers",
+            operation="near_duplicate_merging",
+            severity=ErrorSeverity.WARNING,
+            category=ErrorCategory.DATA
+        )
+        
+        error_info = get_standard_error_info("data_validation_failed")
+        error_handler = ErrorHandler(logger)
+        error_msg = error_handler.handle_error(
+            error=e,
+            context=context,
+            error_type="NearDuplicateMergingError",
+            error_description=f"Error merging near-duplicate papers: {type(e).__name__}: {str(e)}",
+            recovery_suggestion=error_info["recovery"],
+            next_steps=error_info["next_steps"]
+        )
+        return to_check_papers
+    except Exception as ex:
+        context = create_error_context(
+            module="manual",
+            function="merge_near_duplicate_papers",
+            operation="near_duplicate_merging",
+            severity=ErrorSeverity.WARNING,
+            category=ErrorCategory.DATA
+        )
+        
+        error_info = get_standard_error_info("data_validation_failed")
+        error_handler = ErrorHandler(logger)
+        error_msg = error_handler.handle_error(
+            error=ex,
+            context=context,
+            error_type="NearDuplicateMergingError",
+            error_description=f"Unexpected error merging near-duplicate papers: {type(ex).__name__}: {str(ex)}",
+            recovery_suggestion=error_info["recovery"],
+            next_steps=error_info["next_steps"]
+        )
+        return to_check_papers
+
+
 def print_paper_info(to_check_paper, file_name):
     try:
         print(' :: Results can be found at: ' + file_name + ' ::')
@@ -262,29 +304,6 @@ def ask_manual_input():
         return 'not included', '', '', '', ''  # Return safe defaults
 
 
-def update_semantic_filtered_papers(to_check_papers, papers_file, paper_id, included):
-    try:
-        for index, row in to_check_papers.iterrows():
-            try:
-                if row['id'] == paper_id:
-                    row['status'] = included
-                    to_check_papers.loc[index] = row
-            except (KeyError, ValueError, TypeError) as e:
-                print(f"Error updating row at index {index}: {type(e).__name__}: {str(e)}")
-                continue
-            except Exception as ex:
-                print(f"Unexpected error updating row at index {index}: {type(ex).__name__}: {str(ex)}")
-                continue
-                
-        try:
-            util.save(papers_file, to_check_papers, fr, 'w')
-        except Exception as save_ex:
-            print(f"Error saving updated papers file: {type(save_ex).__name__}: {str(save_ex)}")
-            
-    except Exception as ex:
-        print(f"Unexpected error in update_semantic_filtered_papers: {type(ex).__name__}: {str(ex)}")
-
-
 def manual_filter_by_full_text(folder_name, next_file, search_date, step):
     try:
         papers_file = './papers/' + folder_name + '/' + str(search_date).replace('-', '_') + '/' + next_file
@@ -295,66 +314,32 @@ def manual_filter_by_full_text(folder_name, next_file, search_date, step):
         if exists(papers_file):
             try:
                 filtered_by_abstract = pd.read_csv(papers_file)
-                not_classified = len(filtered_by_abstract.loc[filtered_by_abstract['status'] == 'unknown'])
                 
-                while not_classified > 0:
-                    try:
-                        total_papers = len(filtered_by_abstract)
-                        not_classified = len(filtered_by_abstract.loc[filtered_by_abstract['status'] == 'unknown'])
-                        included_papers = len(filtered_by_abstract.loc[filtered_by_abstract['status'] == 'included'])
-                        excluded = len(filtered_by_abstract.loc[filtered_by_abstract['status'] == 'excluded'])
-                        progress = round(((total_papers - not_classified) / total_papers) * 100, 2)
-                        
-                        print('::: Progress --> ' + str(progress) + '% :::')
-                        print(' ::: Included Papers (' + str(included_papers) + ') ::: ')
-                        print(' ::: Excluded (' + str(excluded) + ') ::: Not Classified(' + str(not_classified) + ') :::')
-                        
-                        if len(filtered_by_abstract.loc[filtered_by_abstract['status'] == 'unknown']) > 0:
-                            try:
-                                to_check_paper = filtered_by_abstract.loc[filtered_by_abstract['status'] == 'unknown'].sample()
-                                print_paper_info_full_paper(to_check_paper, file_name)
-                                t = ask_manual_input_full_paper()
-                                title = to_check_paper['title']
-                                paper_id = to_check_paper['id'].values[0]
-                                
-                                if t == 'included':
-                                    try:
-                                        paper_dict = {'id': (included_papers + 1), 'status': t, 'doi': to_check_paper['doi'],
-                                                      'publisher': to_check_paper['publisher'], 'database': to_check_paper['database'],
-                                                      'query_name': to_check_paper['query_name'], 'query_value': to_check_paper['query_value'],
-                                                      'url': to_check_paper['url'], 'publication_date': to_check_paper['publication_date'],
-                                                      'title': title, 'abstract': to_check_paper['abstract']
-                                                      }
-                                        if 'semantic_score' in to_check_paper:
-                                            paper_dict['semantic_score'] = to_check_paper['semantic_score']
-                                        paper_df = pd.DataFrame.from_dict(paper_dict)
-                                        util.save(file_name, paper_df, fr, 'a+')
-                                    except (KeyError, ValueError, TypeError) as e:
-                                        print(f"Error creating paper dictionary: {type(e).__name__}: {str(e)}")
-                                        continue
-                                    except Exception as ex:
-                                        print(f"Unexpected error creating paper dictionary: {type(ex).__name__}: {str(ex)}")
-                                        continue
+                # Next papers are prepared and decisions saved in the background
+                with screening.ScreeningSession(filtered_by_abstract, papers_file, file_name, 'included') as session:
+                    while session.pending > 0:
+                        try:
+                            included_papers = session.counts['included']
+                            excluded = session.counts['excluded']
+                            progress = round(((session.total - session.pending) / session.total) * 100, 2)
+                            
+                            print('::: Progress --> ' + str(progress) + '% :::')
+                            print(' ::: Included Papers (' + str(included_papers) + ') ::: ')
+                            print(' ::: Excluded (' + str(excluded) + ') ::: Not Classified(' + str(session.pending) + ') :::')
+                            
+                            candidate = session.next()
+                            if candidate is None:
+                                break
+                            print_paper_info_full_paper(candidate.paper, file_name)
+                            t = ask_manual_input_full_paper()
+                            session.decide(candidate, t)
                                 
-                                try:
-                                    update_filtered_papers_by_abstract(filtered_by_abstract, papers_file, paper_id, t)
-                                except Exception as update_ex:
-                                    print(f"Error updating papers file: {type(update_ex).__name__}: {str(update_ex)}")
-                                    continue
-                                    
-                            except (KeyError, ValueError, TypeError, IndexError) as e:
-                                print(f"Error processing individual paper: {type(e).__name__}: {str(e)}")
-                                continue
-                            except Exception as ex:
-                                print(f"Unexpected error processing individual paper: {type(ex).__name__}: {str(ex)}")
-                                continue
-                                
-                    except (KeyError, ValueError, TypeError) as e:
-                        print(f"Error during progress calculation: {type(e).__name__}: {str(e)}")
-                        break
-                    except Exception as ex:
-                        print(f"Unexpected error during progress calculation: {type(ex).__name__}: {str(ex)}")
-                        break
+                        except (KeyError, ValueError, TypeError, IndexError) as e:
+                            print(f"Error processing individual paper: {type(e).__name__}: {str(e)}")
+                            continue
+                        except Exception as ex:
+                            print(f"Unexpected error processing individual paper: {type(ex).__name__}: {str(ex)}")
+                            break
                         
             except (pd.errors.EmptyDataError, pd.errors.ParserError, FileNotFoundError) as e:
                 print(f"Error reading papers file: {type(e).__name__}: {str(e)}")
@@ -444,26 +429,3 @@ def ask_manual_input_full_paper():
     except Exception as ex:
         print(f"Unexpected error in ask_manual_input_full_paper: {type(ex).__name__}: {str(ex)}")
         return 'excluded'  # Return safe default
-
-
-def update_filtered_papers_by_abstract(filtered_papers, papers_file, paper_id, included):
-    try:
-        for index, row in filtered_papers.iterrows():
-            try:
-                if row['id'] == paper_id:
-                    row['status'] = included
-                    filtered_papers.loc[index] = row
-            except (KeyError, ValueError, TypeError) as e:
-                print(f"Error updating row at index {index}: {type(e).__name__}: {str(e)}")
-                continue
-            except Exception as ex:
-                print(f"Unexpected error updating row at index {index}: {type(ex).__name__}: {str(ex)}")
-                continue
-                
-        try:
-            util.save(papers_file, filtered_papers, fr, 'w')
-        except Exception as save_ex:
-            print(f"Error saving updated papers file: {type(save_ex).__name__}: {str(save_ex)}")
-            
-    except Exception as ex:
-        print(f"Unexpected error in update_filtered_papers_by_abstract: {type(ex).__name__}: {str(ex)}")
@@ -0,0 +1,200 @@
+"""Process-wide registry of the sentence embedding models used by the semantic filters.
+
+Loading a SentenceTransformer model (e.g. SPECTER) deserializes hundreds of megabytes
+of weights. The registry loads every model once per process and shares it between
+bert_search, bert_search_relevant_papers and any other caller. A model can be warmed
+up in a background thread (e.g. while papers are still being retrieved); callers
+asking for it in the meantime wait for that load instead of starting another one.
+
+The load time and memory footprint of every model are logged and available from
+get_load_statistics.
+
+On CPU-only machines a model can also encode in a pool of worker processes (one copy
+of the model per worker), started on the first request and stopped at exit.
+"""
+import atexit
+import threading
+import time
+from concurrent.futures import Future
+
+from util import lazy_imports
+from util.logging_standards import LogCategory
+from util.util import logger
+
+DEFAULT_MODEL = 'allenai-specter'
+
+_lock = threading.Lock()
+# Model name -> Future with the loaded model
+_models = {}
+# Model name -> load statistics
+_load_statistics = {}
+# (model name, number of workers) -> multi-process pool
+_pools = {}
+
+
+def _create_model(name: str):
+    """Load a SentenceTransformer model."""
+    return lazy_imports.sentence_transformers().SentenceTransformer(name)
+
+
+def _process_memory_mb():
+    """Resident memory of the process in MB (None when it cannot be read)."""
+    try:
+        import resource
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize() / 2 ** 20
+    except (OSError, ImportError, ValueError, IndexError):
+        return None
+
+
+def _parameters_mb(model):
+    """Size of the weights of a torch model in MB (None for other objects)."""
+    try:
+        return sum(parameter.numel() * parameter.element_size() for parameter in model.parameters()) / 2 ** 20
+    except (AttributeError, TypeError):
+        return None
+
+
+def _load(name: str, future: Future, background: bool) -> None:
+    """Load a model into its future and record its statistics."""
+    memory_before = _process_memory_mb()
+    start = time.perf_counter()
+    try:
+        model = _create_model(name)
+    except Exception as ex:
+        with _lock:
+            # Forget the failed load so the next request tries again
+            if _models.get(name) is future:
+                del _models[name]
+        future.set_exception(ex)
+        return
+    seconds = time.perf_counter() - start
+    memory_after = _process_memory_mb()
+    statistics = {
+        'model': name,
+        'load_seconds': seconds,
+        'parameters_mb': _parameters_mb(model),
+        'memory_increase_mb': None if memory_before is None or memory_after is None else memory_after - memory_before,
+        'background': background,
+    }
+    _load_statistics[name] = statistics
+    future.set_result(model)
+    details = [f"{seconds:.1f}s"]
+    if statistics['parameters_mb'] is not None:
+        details.append(f"{statistics['parameters_mb']:.0f} MB of weights")
+    if statistics['memory_increase_mb'] is not None:
+        details.append(f"process memory +{statistics['memory_increase_mb']:.0f} MB")
+    logger.info(
+        LogCategory.SYSTEM,
+        "model_registry",
+        "get_model",
+        f"Loaded embedding model {name}{' in the background' if background else ''}: {', '.join(details)}"
+    )
+
+
+def _future(name: str, background: bool) -> Future:
+    """Return the future of a model, starting its load when it is not loaded or loading."""
+    with _lock:
+        future = _models.get(name)
+        if future is not None:
+            return future
+        future = Future()
+        _models[name] = future
+    if background:
+        threading.Thread(target=_load, args=(name, future, True), name=f'warmup-{name}', daemon=True).start()
+    else:
+        _load(name, future, False)
+    return future
+
+
+def get_model(name: str = DEFAULT_MODEL):
+    """Return an embedding model, loading it on the first request of the process.
+
+    Args:
+        name: Name or path of the SentenceTransformer model.
+
+    Returns:
+        The shared model instance.
+
+    Raises:
+        Exception: Any error raised while loading the model.
+    """
+    return _future(name, background=False).result()
+
+
+def warmup(name: str = DEFAULT_MODEL) -> Future:
+    """Start loading an embedding model in a background thread.
+
+    Args:
+        name: Name or path of the SentenceTransformer model.
+
+    Returns:
+        Future with the model; get_model waits for it.
+    """
+    return _future(name, background=True)
+
+
+def is_loaded(name: str = DEFAULT_MODEL) -> bool:
+    """Return whether a model is already loaded."""
+    future = _models.get(name)
+    return future is not None and future.done() and future.exception() is None
+
+
+def get_load_statistics(name: str = DEFAULT_MODEL):
+    """Return the load statistics of a model (None when it was not loaded).
+
+    The statistics are load_seconds, parameters_mb (size of the weights),
+    memory_increase_mb (change of the resident memory of the process during the load,
+    approximate when other threads are running) and background.
+    """
+    return _load_statistics.get(name)
+
+
+def get_pool(name: str = DEFAULT_MODEL, workers: int = 2):
+    """Return a pool of worker processes encoding with a model, starting it on the first request.
+
+    Every worker loads its own copy of the model on the CPU; the pool is passed to
+    model.encode(texts, pool=pool) and shared until the end of the process.
+
+    Args:
+        name: Name or path of the SentenceTransformer model.
+        workers: Number of worker processes.
+
+    Returns:
+        The pool of the model.
+    """
+    model = get_model(name)
+    with _lock:
+        pool = _pools.get((name, workers))
+        if pool is None:
+            start = time.perf_counter()
+            pool = model.start_multi_process_pool(['cpu'] * workers)
+            _pools[(name, workers)] = pool
+            logger.info(
+                LogCategory.SYSTEM,
+                "model_registry",
+                "get_pool",
+                f"Started {workers} encoding processes for {name} in {time.perf_counter() - start:.1f}s"
+            )
+    return pool
+
+
+def stop_pools() -> None:
+    """Stop the worker processes of all the pools."""
+    with _lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        lazy_imports.sentence_transformers().SentenceTransformer.stop_multi_process_pool(pool)
+
+
+atexit.register(stop_pools)
+
+
+def clear() -> None:
+    """Stop the pools and forget all loaded models (they are released when no caller holds them)."""
+    stop_pools()
+    with _lock:
+        _models.clear()
+        _load_statistics.clear()
@@ -0,0 +1,222 @@
+"""Prioritization of the papers of a manual review by active learning.
+
+A logistic regression is trained on the decisions made so far and ranks the papers
+waiting for a decision:
+
+- 'relevance': the papers most likely to be included first, so most of the relevant
+  papers are found early in the review.
+- 'uncertainty': the papers the model is least sure about first, which improves the
+  model fastest.
+
+The features of a paper are its embedding in the embedding store when the semantic
+filter encoded all the papers (the text of the semantic filter, title[SEP]abstract,
+with the model of the semantic filters), and the TF-IDF vector of its title and
+abstract otherwise. The model is retrained every 'screening_retrain_every' decisions,
+starting from the previous weights, and ranks the papers at random until there is an
+included and an excluded paper.
+
+The sum of the probabilities of the papers waiting for a decision estimates how many
+relevant papers are left (see remaining_relevant), so the review can stop once it is
+close to 0. The estimate is only as good as the model: it is optimistic early in the
+review and with few included papers.
+"""
+import re
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from analysis import embedding_store
+from analysis import semantic_analyser
+from util import lazy_imports
+from util import util
+from util.language import clean_texts, text_hashes
+from util.logging_standards import LogCategory
+
+STRATEGIES = ['relevance', 'uncertainty', 'random']
+# Strength of the L2 regularization of the weights. The features are unit vectors, and a
+# stronger penalty pulls every probability towards the share of included papers, which
+# inflates the estimate of the relevant papers left
+L2_PENALTY = 0.05
+MAX_ITERATIONS = 100
+_TOKEN = re.compile(r'[a-z0-9]+')
+
+
+def tfidf(texts, min_df: int = 2):
+    """L2-normalized TF-IDF vectors of texts (sublinear term frequency, smoothed IDF).
+
+    Args:
+        texts: Iterable of texts.
+        min_df: Minimum number of texts a term appears in (all terms are kept when no
+            term reaches it, e.g. with a handful of texts).
+
+    Returns:
+        Sparse matrix (scipy.sparse.csr_matrix) with one row per text and one column per term.
+    """
+    sparse = lazy_imports.load_module('scipy.sparse')
+    documents = [Counter(_TOKEN.findall(text.lower())) for text in clean_texts(texts)]
+    frequencies = Counter(term for document in documents for term in document)
+    terms = [term for term, frequency in frequencies.items() if frequency >= min_df] or list(frequencies)
+    vocabulary = {term: column for column, term in enumerate(sorted(terms))}
+    rows, columns, values = [], [], []
+    for row, document in enumerate(documents):
+        for term, count in document.items():
+            column = vocabulary.get(term)
+            if column is not None:
+                rows.append(row)
+                columns.append(column)
+                values.append(1.0 + np.log(count))
+    matrix = sparse.csr_matrix((values, (rows, columns)), shape=(len(documents), len(vocabulary)), dtype=np.float64)
+    document_frequency = np.bincount(matrix.indices, minlength=len(vocabulary))
+    idf = np.log((1 + len(documents)) / (1 + document_frequency)) + 1.0
+    matrix = matrix @ sparse.diags(idf)
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    return sparse.csr_matrix(sparse.diags(1.0 / np.maximum(norms, 1e-12)) @ matrix)
+
+
+def screening_features(papers: pd.DataFrame, semantic_filters=None):
+    """Features of the papers of a review.
+
+    Args:
+        papers: Papers with title and abstract.
+        semantic_filters: Semantic filters of the survey (model of the embeddings).
+
+    Returns:
+        Tuple with the feature matrix (one row per paper) and the name of the features
+        ('embeddings' or 'tf-idf').
+    """
+    performance_parameters = util.get_performance_parameters()
+    store = embedding_store.open_store(performance_parameters['embedding_store_folder'],
+                                       semantic_analyser.get_model_name(semantic_filters or []))
+    if store is not None and len(store) > 0:
+        rows = store.lookup(text_hashes(clean_texts(papers['title'] + '[SEP]' + papers['abstract'])))
+        if len(rows) > 0 and (rows >= 0).all():
+            embeddings = store.get(rows)
+            return embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12), 'embeddings'
+    return tfidf(papers['title'].fillna('') + ' ' + papers['abstract'].fillna('')), 'tf-idf'
+
+
+def _loss(parameters, features, labels, weights):
+    """Weighted mean log-loss of a logistic regression with L2 penalty, and its gradient."""
+    expit = lazy_imports.load_module('scipy.special').expit
+    coefficients, intercept = parameters[:-1], parameters[-1]
+    margins = features @ coefficients + intercept
+    # log(1 + exp(-y m)) with y in {-1, 1}, computed without overflow
+    signs = 2 * labels - 1
+    losses = np.logaddexp(0, -signs * margins)
+    residuals = weights * (expit(margins) - labels)
+    total = weights.sum()
+    loss = (weights @ losses) / total + L2_PENALTY * (coefficients @ coefficients) / (2 * total)
+    gradient = np.empty_like(parameters)
+    gradient[:-1] = (features.T @ residuals) / total + L2_PENALTY * coefficients / total
+    gradient[-1] = residuals.sum() / total
+    return loss, gradient
+
+
+class ScreeningPrioritizer:
+    """Order of the papers of a review, learned from the decisions.
+
+    Args:
+        features: Feature matrix with one row per paper (see screening_features).
+        strategy: 'relevance', 'uncertainty' or 'random'.
+        retrain_every: Decisions between two trainings of the model.
+        seed: Seed of the order before the first training.
+    """
+
+    def __init__(self, features, strategy: str = 'relevance', retrain_every: int = 10, seed=None):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown screening priority '{strategy}', expected one of {STRATEGIES}")
+        self.features = features
+        self.strategy = strategy
+        self.retrain_every = max(1, retrain_every)
+        self.parameters = np.zeros(features.shape[1] + 1)
+        # Rank of every paper in the order before the first training
+        self.random_rank = np.argsort(np.random.default_rng(seed).permutation(features.shape[0]))
+        # Probability of inclusion of every paper (None until the first training)
+        self.probabilities = None
+        # Share of included papers among the decisions of the last training
+        self.included_rate = None
+        self.trained_decisions = 0
+
+    def needs_training(self, decisions: int) -> bool:
+        """Whether the model is out of date after the given number of decisions."""
+        if self.strategy == 'random':
+            return False
+        return self.probabilities is None or decisions - self.trained_decisions >= self.retrain_every
+
+    def train(self, labels: np.ndarray) -> bool:
+        """Train the model on the papers with a decision.
+
+        Args:
+            labels: 1 for included papers, 0 for excluded ones and -1 for papers without
+                decision.
+
+        Returns:
+            Whether the model was trained (it needs an included and an excluded paper).
+        """
+        decided = labels >= 0
+        included = int((labels == 1).sum())
+        if included == 0 or included == int(decided.sum()):
+            return False
+        features = self.features[np.flatnonzero(decided)]
+        targets = labels[decided].astype(np.float64)
+        # Included papers are rare, so both classes weigh the same in the loss
+        weights = np.where(targets == 1, 0.5 / targets.mean(), 0.5 / (1 - targets.mean()))
+        optimize = lazy_imports.load_module('scipy.optimize')
+        result = optimize.minimize(_loss, self.parameters, args=(features, targets, weights), jac=True,
+                                   method='L-BFGS-B', options={'maxiter': MAX_ITERATIONS})
+        margins = self.features @ result.x[:-1] + result.x[-1]
+        probabilities = lazy_imports.load_module('scipy.special').expit(np.asarray(margins, dtype=np.float64).ravel())
+        # The prefetching thread trains the model while the reviewer's thread reads the
+        # estimate, so the rate is set before the probabilities that enable it
+        self.parameters = result.x
+        self.included_rate = float(targets.mean())
+        self.probabilities = probabilities
+        self.trained_decisions = int(decided.sum())
+        return True
+
+    def rank(self, positions: np.ndarray) -> np.ndarray:
+        """Positions of papers in the order they should be reviewed."""
+        positions = np.asarray(positions)
+        if self.probabilities is None or self.strategy == 'random':
+            return positions[np.argsort(self.random_rank[positions], kind='stable')]
+        probabilities = self.probabilities[positions]
+        if self.strategy == 'uncertainty':
+            return positions[np.argsort(np.abs(probabilities - 0.5), kind='stable')]
+        return positions[np.argsort(-probabilities, kind='stable')]
+
+    def remaining_relevant(self, positions: np.ndarray):
+        """Expected number of relevant papers among positions (None before the first training).
+
+        The model is trained with balanced classes, so its probabilities are corrected
+        back to the share of included papers among the decisions before they are added.
+        """
+        if self.probabilities is None:
+            return None
+        probabilities = self.probabilities[np.asarray(positions)]
+        included = probabilities * self.included_rate
+        return float((included / (included + (1 - probabilities) * (1 - self.included_rate))).sum())
+
+
+def open_prioritizer(papers: pd.DataFrame, semantic_filters=None, seed=None):
+    """Prioritizer of a review with the 'screening_priority' and 'screening_retrain_every' performance parameters.
+
+    Returns:
+        The prioritizer, or None when the priority is 'random' or the features cannot
+        be computed (the papers are then reviewed in random order).
+    """
+    performance_parameters = util.get_performance_parameters()
+    strategy = performance_parameters['screening_priority']
+    if strategy == 'random':
+        return None
+    try:
+        features, kind = screening_features(papers, semantic_filters)
+        prioritizer = ScreeningPrioritizer(features, strategy, performance_parameters['screening_retrain_every'],
+                                           seed=seed)
+    except Exception as ex:
+        util.logger.warning(LogCategory.DATA, "prioritization", "open_prioritizer",
+                            f"Papers reviewed in random order: {type(ex).__name__}: {str(ex)}")
+        return None
+    util.logger.info(LogCategory.DATA, "prioritization", "open_prioritizer",
+                     f"Papers prioritized by {strategy} with {kind} features")
+    return prioritizer
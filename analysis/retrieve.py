@@ -1,6 +1,10 @@
 import pandas as pd
 import re
 from util import util
+from util import search_history
+from util import term_index
+from util import lazy_imports
+from util.keyword_matcher import KeywordMatcher, keyword_terms, lemmatize_word
 from util.error_standards import (
     ErrorHandler, create_error_context, ErrorSeverity, ErrorCategory,
     get_standard_error_info
@@ -18,16 +22,24 @@ not wired into v1. Their files remain in the codebase for v2 enablement.
 """
 from analysis import semantic_analyser
 from os.path import exists
-from gensim.utils import simple_preprocess
-from gensim.parsing.preprocessing import strip_tags
-from nltk.stem.wordnet import WordNetLemmatizer
-from nltk.tokenize import WhitespaceTokenizer
 import logging
+import multiprocessing
+import threading
+import time
+import datetime
+from concurrent.futures import ProcessPoolExecutor
 
 fr = 'utf-8'
-lemma = WordNetLemmatizer()
-w_tokenizer = WhitespaceTokenizer()
 logger = logging.getLogger('sals_pipeline')
+# Clients of every database, in the order get_papers requests them
+DATABASE_CLIENTS = {
+    'arxiv': ArxivClient,
+    'springer': SpringerClient,
+    'ieeexplore': IeeeXploreClient,
+    'scopus': ElsevierClient,
+    'core': CoreClient,
+    'semantic_scholar': SemanticScholarClient,
+}
 
 
 def get_papers(queries, syntactic_filters, synonyms, databases, fields, types, folder_name, dates, start_date, end_date, search_date):
@@ -136,6 +148,70 @@ def get_papers(queries, syntactic_filters, synonyms, databases, fields, types, f
     return True
 
 
+def plan_papers(queries, syntactic_filters, synonyms, databases, fields, types, folder_name, dates, start_date, end_date, search_date) -> pd.DataFrame:
+    """Plan the retrieval of the papers of every query without retrieving them (dry run).
+
+    Every client runs its planning stage: it sends its count requests (or reads them
+    from the response cache of the search date) and counts the requests that would
+    retrieve the papers.
+
+    Returns:
+        DataFrame with the plan of every query and database (see DatabaseClient.plan_papers).
+    """
+    global logger
+    logger = get_current_sals_logger() or logging.getLogger('sals_pipeline')
+    clients = {database: client() for database, client in DATABASE_CLIENTS.items() if database in databases}
+    plans = []
+    for query in queries:
+        query_name = list(query.keys())[0]
+        for database, client in clients.items():
+            logger.info(
+                LogCategory.DATABASE,
+                "retrieve",
+                "plan_papers",
+                f"Planning {database} for query: {query_name}..."
+            )
+            # Semantic Scholar searches over its knowledge graph. Synonyms are not needed in this case.
+            database_synonyms = {} if database == 'semantic_scholar' else synonyms
+            plans.append(client.plan_papers(query, syntactic_filters, database_synonyms, fields, types, dates,
+                                            start_date, end_date, folder_name, search_date))
+    return pd.DataFrame(plans, columns=['database', 'query', 'status', 'expected_papers', 'count_requests',
+                                        'cached_requests', 'requests', 'quota', 'duration'])
+
+
+def summarize_plan(plans: pd.DataFrame) -> pd.DataFrame:
+    """Table of the plan of every database.
+
+    The quota usage counts the count requests sent while planning, which are read
+    from the response cache when the papers are retrieved on the same search date.
+
+    Args:
+        plans: Plans of every query and database (see plan_papers).
+
+    Returns:
+        DataFrame with one row per database: expected papers, count requests (and how
+        many were read from the cache), retrieval requests, quota usage, estimated
+        retrieval time and the status of the plans of its queries.
+    """
+    rows = []
+    for database, group in plans.groupby('database', sort=False):
+        used = int(group['count_requests'].sum() + group['requests'].sum())
+        quota = group['quota'].iloc[0]
+        rows.append({
+            'database': database,
+            'expected_papers': int(group['expected_papers'].sum()),
+            'count_requests': f"{int(group['count_requests'].sum() + group['cached_requests'].sum())} "
+                              f"({int(group['cached_requests'].sum())} cached)",
+            'requests': int(group['requests'].sum()),
+            'quota_usage': f"{used}/{int(quota)} ({100 * used / quota:.0f}%)" if pd.notna(quota) and quota else '-',
+            'duration': str(datetime.timedelta(seconds=int(group['duration'].sum()))),
+            'status': ', '.join(f"{status} ({count})" if count > 1 else status
+                                for status, count in group['status'].value_counts(sort=False).items()),
+        })
+    return pd.DataFrame(rows, columns=['database', 'expected_papers', 'count_requests', 'requests', 'quota_usage',
+                                       'duration', 'status'])
+
+
 def snowballing(folder_name, search_date, step, dates, start_date, end_date, semantic_filters, removed_papers):
     global logger
     logger = get_current_sals_logger() or logging.getLogger('sals_pipeline')
@@ -235,404 +311,49 @@ def snowballing(folder_name, search_date, step, dates, start_date, end_date, sem
         return ''
 
 
-def preprocess(queries, databases, folder_name, search_date, date_filter, start_date, end_date, step):
+def preprocess(queries, databases, folder_name, search_date, date_filter, start_date, end_date, step, workers=None):
     global logger
     logger = get_current_sals_logger() or logging.getLogger('sals_pipeline')
     preprocessed_file_name = './papers/' + folder_name + '/' + str(search_date).replace('-', '_') + '/' + str(step) + \
                              '_preprocessed_papers.csv'
+    # Repeated papers removed from the preprocessed papers, with the paper kept in their place
+    provenance_file_name = preprocessed_file_name.replace('.csv', '_provenance.csv')
     if not exists(preprocessed_file_name):
-        papers = pd.DataFrame()
+        if workers is None:
+            workers = util.get_performance_parameters()['preprocess_workers']
+        raw_files = []
         for query in queries:
             for database in databases:
                 query_name = list(query.keys())[0]
                 file_name = './papers/' + folder_name + '/' + str(search_date).replace('-', '_') + '/raw_papers/' + \
                             query_name.lower().replace(' ', '_') + '_' + database + '.csv'
-                if exists(file_name):
-                    logger.info(
-                        LogCategory.FILE,
-                        "retrieve",
-                        "preprocess",
-                        f"Processing file: {file_name}"
-                    )
-                    try:
-                        df = pd.read_csv(file_name)
-                    except (pd.errors.EmptyDataError, pd.errors.ParserError) as e:
-                        context = create_error_context(
-                            module="retrieve",
-                            function="preprocess",
-                            operation="file_reading",
-                            severity=ErrorSeverity.WARNING,
-                            category=ErrorCategory.FILE
-                        )
-                        
-                        error_info = get_standard_error_info("file_not_found")
-                        error_handler = ErrorHandler(logger)
-                        error_msg = error_handler.handle_error(
-                            error=e,
-                            context=context,
-                            error_type="FileReadingError",
-                            error_description=f"Error reading file {file_name} for {database} database: {type(e).__name__}: {str(e)}",
-                            recovery_suggestion=error_info["recovery"],
-                            next_steps=error_info["next_steps"]
-                        )
-                        continue
-                    except Exception as ex:
-                        context = create_error_context(
-                            module="retrieve",
-                            function="preprocess",
-                            operation="file_reading",
-                            severity=ErrorSeverity.WARNING,
-                            category=ErrorCategory.FILE
-                        )
-                        
-                        error_info = get_standard_error_info("file_not_found")
-                        error_handler = ErrorHandler(logger)
-                        error_msg = error_handler.handle_error(
-                            error=ex,
-                            context=context,
-                            error_type="FileReadingError",
-                            error_description=f"Unexpected error reading file {file_name} for {database} database: {type(ex).__name__}: {str(ex)}",
-                            recovery_suggestion=error_info["recovery"],
-                            next_steps=error_info["next_steps"]
-                        )
-                        continue
-                    if database == 'ieeexplore':
-                        try:
-                            df = df.drop_duplicates('doi')
-                            dates = df['publication_date']
-                            df['publication_date'] = parse_dates(dates)
-                            papers_ieee = pd.DataFrame(
-                                {
-                                    'doi': df['doi'], 'type': df['content_type'], 'query_name': df['query_name'],
-                                    'query_value': df['query_value'], 'publication': df['publication_title'],
-                                    'publisher': df['publisher'], 'publication_date': df['publication_date'],
-                                    'database': df['database'], 'title': df['title'], 'url': df['html_url'],
-                                    'abstract': df['abstract']
-                                }
-                            )
-                            papers = pd.concat([papers, papers_ieee])
-                        except (KeyError, ValueError, TypeError) as e:
-                            context = create_error_context(
-                                module="retrieve",
-                                function="preprocess",
-                                operation="ieee_data_processing",
-                                severity=ErrorSeverity.WARNING,
-                                category=ErrorCategory.DATA
-                            )
-                            
-                            error_info = get_standard_error_info("data_validation_failed")
-                            error_handler = ErrorHandler(logger)
-                            error_msg = error_handler.handle_error(
-                                error=e,
-                                context=context,
-                                error_type="IEEEDataProcessingError",
-                                error_description=f"Error processing IEEE Xplore data: {type(e).__name__}: {str(e)}",
-                                recovery_suggestion=error_info["recovery"],
-                                next_steps=error_info["next_steps"]
-                            )
-                            continue
-                        except Exception as ex:
-                            context = create_error_context(
-                                module="retrieve",
-                                function="preprocess",
-                                operation="ieee_data_processing",
-                                severity=ErrorSeverity.WARNING,
-                                category=ErrorCategory.DATA
-                            )
-                            
-                            error_info = get_standard_error_info("data_validation_failed")
-                            error_handler = ErrorHandler(logger)
-                            error_msg = error_handler.handle_error(
-                                error=ex,
-                                context=context,
-                                error_type="IEEEDataProcessingError",
-                                error_description=f"Unexpected error processing IEEE Xplore data: {type(ex).__name__}: {str(ex)}",
-                                recovery_suggestion=error_info["recovery"],
-                                next_steps=error_info["next_steps"]
-                            )
-                            continue
-                    if database == 'springer':
-                        try:
-                            df = df.drop_duplicates('doi')
-                            dates = df['publicationDate']
-                            df['publication_date'] = parse_dates(dates)
-                            papers_springer = pd.DataFrame(
-                                {
-                                    'doi': df['doi'], 'type': df['contentType'], 'query_name': df['query_name'],
-                                    'query_value': df['query_value'], 'publication': df['publicationName'],
-                                    'publisher': df['publisher'], 'publication_date': df['publication_date'],
-                                    'database': df['database'], 'title': df['title'], 'url': df['url'],
-                                    'abstract': df['abstract']
-                                }
-                            )
-                            papers = pd.concat([papers, papers_springer])
-                        except (KeyError, ValueError, TypeError) as e:
-                            context = create_error_context(
-                                module="retrieve",
-                                function="preprocess",
-                                operation="springer_data_processing",
-                                severity=ErrorSeverity.WARNING,
-                                category=ErrorCategory.DATA
-                            )
-                            
-                            error_info = get_standard_error_info("data_validation_failed")
-                            error_handler = ErrorHandler(logger)
-                            error_msg = error_handler.handle_error(
-                                error=e,
-                                context=context,
-                                error_type="SpringerDataProcessingError",
-                                error_description=f"Error processing Springer data: {type(e).__name__}: {str(e)}",
-                                recovery_suggestion=error_info["recovery"],
-                                next_steps=error_info["next_steps"]
-                            )
-                            continue
-                        except Exception as ex:
-                            context = create_error_context(
-                                module="retrieve",
-                                function="preprocess",
-                                operation="springer_data_processing",
-                                severity=ErrorSeverity.WARNING,
-                                category=ErrorCategory.DATA
-                            )
-                            
-                            error_info = get_standard_error_info("data_validation_failed")
-                            error_handler = ErrorHandler(logger)
-                            error_msg = error_handler.handle_error(
-                                error=ex,
-                                context=context,
-                                error_type="SpringerDataProcessingError",
-                                error_description=f"Unexpected error processing Springer data: {type(ex).__name__}: {str(ex)}",
-                                recovery_suggestion=error_info["recovery"],
-                                next_steps=error_info["next_steps"]
-                            )
-                            continue
-                    if database == 'arxiv':
-                        try:
-                            df = df.drop_duplicates('id')
-                            dates = df['published']
-                            df['publication_date'] = parse_dates(dates)
-                            papers_arxiv = pd.DataFrame(
-                                {
-                                    'doi': df['id'], 'type': df['database'], 'query_name': df['query_name'],
-                                    'query_value': df['query_value'], 'publication': df['database'],
-                                    'publisher': df['database'], 'publication_date': df['publication_date'],
-                                    'database': df['database'], 'title': df['title'], 'url': df['id'],
-                                    'abstract': df['summary']
-                                }
-                            )
-                            papers = pd.concat([papers, papers_arxiv])
-                        except (KeyError, ValueError, TypeError) as e:
-                            context = create_error_context(
-                                module="retrieve",
-                                function="preprocess",
-                                operation="arxiv_data_processing",
-                                severity=ErrorSeverity.WARNING,
-                                category=ErrorCategory.DATA
-                            )
-                            
-                            error_info = get_standard_error_info("data_validation_failed")
-                            error_handler = ErrorHandler(logger)
-                            error_msg = error_handler.handle_error(
-                                error=e,
-                                context=context,
-                                error_type="ArxivDataProcessingError",
-                                error_description=f"Error processing arXiv data: {type(e).__name__}: {str(e)}",
-                                recovery_suggestion=error_info["recovery"],
-                                next_steps=error_info["next_steps"]
-                            )
-                            continue
-                        except Exception as ex:
-                            context = create_error_context(
-                                module="retrieve",
-                                function="preprocess",
-                                operation="arxiv_data_processing",
-                                severity=ErrorSeverity.WARNING,
-                                category=ErrorCategory.DATA
-                            )
-                            
-                            error_info = get_standard_error_info("data_validation_failed")
-                            error_handler = ErrorHandler(logger)
-                            error_msg = error_handler.handle_error(
-                                error=ex,
-                                context=context,
-                                error_type="ArxivDataProcessingError",
-                                error_description=f"Unexpected error processing arXiv data: {type(ex).__name__}: {str(ex)}",
-                                recovery_suggestion=error_info["recovery"],
-                                next_steps=error_info["next_steps"]
-                            )
-                            continue
-                    if database == 'scopus':
-                        try:
-                            df = df.drop_duplicates('id')
-                            papers_scopus = pd.DataFrame(
-                                {
-                                    'doi': df['id'], 'type': df['type'], 'query_name': df['query_name'],
-                                    'query_value': df['query_value'], 'publication': df['publication'],
-                                    'publisher': df['publisher'], 'publication_date': df['publication_date'],
-                                    'database': df['database'], 'title': df['title'], 'url': df['url'],
-                                    'abstract': df['abstract']
-                                }
-                            )
-                            papers = pd.concat([papers, papers_scopus])
-                        except (KeyError, ValueError, TypeError) as e:
-                            context = create_error_context(
-                                module="retrieve",
-                                function="preprocess",
-                                operation="scopus_data_processing",
-                                severity=ErrorSeverity.WARNING,
-                                category=ErrorCategory.DATA
-                            )
-                            
-                            error_info = get_standard_error_info("data_validation_failed")
-                            error_handler = ErrorHandler(logger)
-                            error_msg = error_handler.handle_error(
-                                error=e,
-                                context=context,
-                                error_type="ScopusDataProcessingError",
-                                error_description=f"Error processing Scopus data: {type(e).__name__}: {str(e)}",
-                                recovery_suggestion=error_info["recovery"],
-                                next_steps=error_info["next_steps"]
-                            )
-                            continue
-                        except Exception as ex:
-                            context = create_error_context(
-                                module="retrieve",
-                                function="preprocess",
-                                operation="scopus_data_processing",
-                                severity=ErrorSeverity.WARNING,
-                                category=ErrorCategory.DATA
-                            )
-                            
-                            error_info = get_standard_error_info("data_validation_failed")
-                            error_handler = ErrorHandler(logger)
-                            error_msg = error_handler.handle_error(
-                                error=ex,
-                                context=context,
-                                error_type="ScopusDataProcessingError",
-                                error_description=f"Unexpected error processing Scopus data: {type(ex).__name__}: {str(ex)}",
-                                recovery_suggestion=error_info["recovery"],
-                                next_steps=error_info["next_steps"]
-                            )
-                            continue
-                    if database == 'core':
-                        try:
-                            df = df.drop_duplicates('id')
-                            dates = df['publication_date']
-                            df['publication_date'] = parse_dates(dates)
-                            df['id'] = get_ids(df, database)
-                            papers_core = pd.DataFrame(
-                                {
-                                    'doi': df['id'], 'type': df['database'], 'query_name': df['query_name'],
-                                    'query_value': df['query_value'], 'publication': df['publication'],
-                                    'publisher': df['database'], 'publication_date': df['publication_date'],
-                                    'database': df['database'], 'title': df['title'], 'url': df['url'],
-                                    'abstract': df['abstract']
-                                }
-                            )
-                            papers_core['database'] = database
-                            papers_core['publication'] = database
-                            papers = pd.concat([papers, papers_core])
-                        except (KeyError, ValueError, TypeError) as e:
-                            context = create_error_context(
-                                module="retrieve",
-                                function="preprocess",
-                                operation="core_data_processing",
-                                severity=ErrorSeverity.WARNING,
-                                category=ErrorCategory.DATA
-                            )
-                            
-                            error_info = get_standard_error_info("data_validation_failed")
-                            error_handler = ErrorHandler(logger)
-                            error_msg = error_handler.handle_error(
-                                error=e,
-                                context=context,
-                                error_type="CoreDataProcessingError",
-                                error_description=f"Error processing CORE data: {type(e).__name__}: {str(e)}",
-                                recovery_suggestion=error_info["recovery"],
-                                next_steps=error_info["next_steps"]
-                            )
-                            continue
-                        except Exception as ex:
-                            context = create_error_context(
-                                module="retrieve",
-                                function="preprocess",
-                                operation="core_data_processing",
-                                severity=ErrorSeverity.WARNING,
-                                category=ErrorCategory.DATA
-                            )
-                            
-                            error_info = get_standard_error_info("data_validation_failed")
-                            error_handler = ErrorHandler(logger)
-                            error_msg = error_handler.handle_error(
-                                error=ex,
-                                context=context,
-                                error_type="CoreDataProcessingError",
-                                error_description=f"Unexpected error processing CORE data: {type(ex).__name__}: {str(ex)}",
-                                recovery_suggestion=error_info["recovery"],
-                                next_steps=error_info["next_steps"]
-                            )
-                            continue
-                    if database == 'semantic_scholar':
-                        try:
-                            df = df.drop_duplicates('paperId')
-                            df_dates = df['year']
-                            dates = []
-                            for df_date in df_dates:
-                                df_date = str(df_date).split('.')[0]
-                                dates.append(df_date)
-                            df['publication_date'] = parse_dates(dates)
-                            df['id'] = get_ids(df, database)
-                            papers_semantic = pd.DataFrame(
-                                {
-                                    'doi': df['id'], 'type': df['database'], 'query_name': df['query_name'],
-                                    'query_value': df['query_value'], 'publication': df['database'],
-                                    'publisher': df['venue'], 'publication_date': df['publication_date'],
-                                    'database': df['database'], 'title': df['title'], 'url': df['url'],
-                                    'abstract': df['abstract']
-                                }
-                            )
-                            papers = pd.concat([papers, papers_semantic])
-                        except (KeyError, ValueError, TypeError) as e:
-                            context = create_error_context(
-                                module="retrieve",
-                                function="preprocess",
-                                operation="semantic_scholar_data_processing",
-                                severity=ErrorSeverity.WARNING,
-                                category=ErrorCategory.DATA
-                            )
-                            
-                            error_info = get_standard_error_info("data_validation_failed")
-                            error_handler = ErrorHandler(logger)
-                            error_msg = error_handler.handle_error(
-                                error=e,
-                                context=context,
-                                error_type="SemanticScholarDataProcessingError",
-                                error_description=f"Error processing Semantic Scholar data: {type(e).__name__}: {str(e)}",
-                                recovery_suggestion=error_info["recovery"],
-                                next_steps=error_info["next_steps"]
-                            )
-                            continue
-                        except Exception as ex:
-                            context = create_error_context(
-                                module="retrieve",
-                                function="preprocess",
-                                operation="semantic_scholar_data_processing",
-                                severity=ErrorSeverity.WARNING,
-                                category=ErrorCategory.DATA
-                            )
-                            
-                            error_info = get_standard_error_info("data_validation_failed")
-                            error_handler = ErrorHandler(logger)
-                            error_msg = error_handler.handle_error(
-                                error=ex,
-                                context=context,
-                                error_type="SemanticScholarDataProcessingError",
-                                error_description=f"Unexpected error processing Semantic Scholar data: {type(ex).__name__}: {str(ex)}",
-                                recovery_suggestion=error_info["recovery"],
-                                next_steps=error_info["next_steps"]
-                            )
-                            continue
+                if exists(file_name) and database in RAW_FILE_MAPPERS:
+                    raw_files.append((file_name, database))
+        start = time.perf_counter()
+        frames = []
+        for file_name, database, result, ex in _map_raw_files(raw_files, workers):
+            if ex is not None:
+                _handle_raw_file_error(ex, file_name, database)
+                continue
+            mapped_papers, timings = result
+            logger.info(
+                LogCategory.FILE,
+                "retrieve",
+                "preprocess",
+                f"Processed file: {file_name} ({len(mapped_papers)} papers) - read {timings.get('read', 0.0):.2f}s, "
+                f"dates {timings.get('dates', 0.0):.2f}s, mapping {timings.get('mapping', 0.0):.2f}s"
+            )
+            frames.append(mapped_papers)
+        logger.info(
+            LogCategory.DATA,
+            "retrieve",
+            "preprocess",
+            f"Mapped {len(frames)} raw files with {max(1, workers)} worker(s) in {time.perf_counter() - start:.2f}s"
+        )
         try:
+            if len(frames) == 0:
+                return None
+            papers = pd.concat(frames)
             if len(papers) == 0:
                 return None
             papers['type'] = 'preprocessed'
@@ -653,13 +374,22 @@ def preprocess(queries, databases, folder_name, search_date, date_filter, start_
                 f"Number of papers: {len(papers)}"
             )
             util.save(preprocessed_file_name, papers, fr, 'a+')
+            # Before the cleaning, so papers seen before are not cleaned (e.g. language detection) again
+            if util.get_deduplication_parameters()['cross_run']:
+                logger.info(
+                    LogCategory.DATA,
+                    "retrieve",
+                    "preprocess",
+                    "Removing papers already seen in previous runs of the survey..."
+                )
+                search_history.split_previously_seen(preprocessed_file_name, folder_name, search_date, step)
             logger.info(
                 LogCategory.DATA,
                 "retrieve",
                 "preprocess",
                 "Removing repeated papers by doi, title, and abstract..."
             )
-            util.remove_repeated(preprocessed_file_name)
+            util.remove_repeated(preprocessed_file_name, provenance_file_name)
             logger.info(
                 LogCategory.DATA,
                 "retrieve",
@@ -667,6 +397,8 @@ def preprocess(queries, databases, folder_name, search_date, date_filter, start_
                 "Removing papers not written in English, without title or abstract, surveys, reviews, reports, and theses..."
             )
             util.clean_papers(preprocessed_file_name)
+            if util.get_performance_parameters()['term_index'] and exists(preprocessed_file_name):
+                term_index.build_index(preprocessed_file_name)
         except (KeyError, ValueError, TypeError) as e:
             context = create_error_context(
                 module="retrieve",
@@ -708,6 +440,201 @@ def preprocess(queries, databases, folder_name, search_date, date_filter, start_
     return preprocessed_file_name
 
 
+def _map_raw_files(raw_files, workers):
+    # Yields (file_name, database, (papers, timings), exception) in the order of raw_files.
+    # Files are independent, so with more than one worker they are mapped in a process pool
+    # and merged once by the caller.
+    executor = None
+    if workers > 1 and len(raw_files) > 1:
+        try:
+            # Forking while another thread (e.g. the embedding model warm-up) holds a lock can
+            # deadlock the workers, so they are spawned instead when other threads are running
+            context = multiprocessing.get_context('spawn') if threading.active_count() > 1 else None
+            executor = ProcessPoolExecutor(max_workers=min(workers, len(raw_files)), mp_context=context)
+        except (OSError, NotImplementedError, ValueError) as e:
+            logger.debug(f"Process pool not available, preprocessing sequentially: {type(e).__name__}: {str(e)}")
+            executor = None
+    if executor is None:
+        for file_name, database in raw_files:
+            try:
+                yield file_name, database, _preprocess_raw_file(file_name, database), None
+            except Exception as ex:
+                yield file_name, database, None, ex
+        return
+    with executor:
+        futures = [executor.submit(_preprocess_raw_file, file_name, database) for file_name, database in raw_files]
+        for (file_name, database), future in zip(raw_files, futures):
+            try:
+                yield file_name, database, future.result(), None
+            except Exception as ex:
+                yield file_name, database, None, ex
+
+
+def _preprocess_raw_file(file_name, database):
+    # Worker entry point: reads one raw_papers file and maps it to the preprocessed schema.
+    timings = {}
+    start = time.perf_counter()
+    df = pd.read_csv(file_name)
+    timings['read'] = time.perf_counter() - start
+    start = time.perf_counter()
+    papers = RAW_FILE_MAPPERS[database](df, timings)
+    timings['mapping'] = time.perf_counter() - start - timings.get('dates', 0.0)
+    return papers, timings
+
+
+def _handle_raw_file_error(ex, file_name, database):
+    label, error_prefix = RAW_FILE_LABELS[database]
+    if isinstance(ex, (pd.errors.EmptyDataError, pd.errors.ParserError, FileNotFoundError)):
+        context = create_error_context(
+            module="retrieve",
+            function="preprocess",
+            operation="file_reading",
+            severity=ErrorSeverity.WARNING,
+            category=ErrorCategory.FILE
+        )
+        error_info = get_standard_error_info("file_not_found")
+        error_type = "FileReadingError"
+        error_description = f"Error reading file {file_name} for {database} database: {type(ex).__name__}: {str(ex)}"
+    else:
+        context = create_error_context(
+            module="retrieve",
+            function="preprocess",
+            operation=database + "_data_processing",
+            severity=ErrorSeverity.WARNING,
+            category=ErrorCategory.DATA
+        )
+        error_info = get_standard_error_info("data_validation_failed")
+        error_type = error_prefix + "DataProcessingError"
+        if isinstance(ex, (KeyError, ValueError, TypeError)):
+            error_description = f"Error processing {label} data: {type(ex).__name__}: {str(ex)}"
+        else:
+            error_description = f"Unexpected error processing {label} data: {type(ex).__name__}: {str(ex)}"
+    error_handler = ErrorHandler(logger)
+    error_msg = error_handler.handle_error(
+        error=ex,
+        context=context,
+        error_type=error_type,
+        error_description=error_description,
+        recovery_suggestion=error_info["recovery"],
+        next_steps=error_info["next_steps"]
+    )
+
+
+def _timed_parse_dates(dates, timings):
+    start = time.perf_counter()
+    parsed_dates = parse_dates(dates)
+    timings['dates'] = time.perf_counter() - start
+    return parsed_dates
+
+
+def _map_ieeexplore(df, timings):
+    df = df.drop_duplicates('doi')
+    df['publication_date'] = _timed_parse_dates(df['publication_date'], timings)
+    return pd.DataFrame(
+        {
+            'doi': df['doi'], 'type': df['content_type'], 'query_name': df['query_name'],
+            'query_value': df['query_value'], 'publication': df['publication_title'],
+            'publisher': df['publisher'], 'publication_date': df['publication_date'],
+            'database': df['database'], 'title': df['title'], 'url': df['html_url'],
+            'abstract': df['abstract']
+        }
+    )
+
+
+def _map_springer(df, timings):
+    df = df.drop_duplicates('doi')
+    df['publication_date'] = _timed_parse_dates(df['publicationDate'], timings)
+    return pd.DataFrame(
+        {
+            'doi': df['doi'], 'type': df['contentType'], 'query_name': df['query_name'],
+            'query_value': df['query_value'], 'publication': df['publicationName'],
+            'publisher': df['publisher'], 'publication_date': df['publication_date'],
+            'database': df['database'], 'title': df['title'], 'url': df['url'],
+            'abstract': df['abstract']
+        }
+    )
+
+
+def _map_arxiv(df, timings):
+    df = df.drop_duplicates('id')
+    df['publication_date'] = _timed_parse_dates(df['published'], timings)
+    return pd.DataFrame(
+        {
+            'doi': df['id'], 'type': df['database'], 'query_name': df['query_name'],
+            'query_value': df['query_value'], 'publication': df['database'],
+            'publisher': df['database'], 'publication_date': df['publication_date'],
+            'database': df['database'], 'title': df['title'], 'url': df['id'],
+            'abstract': df['summary']
+        }
+    )
+
+
+def _map_scopus(df, timings):
+    df = df.drop_duplicates('id')
+    return pd.DataFrame(
+        {
+            'doi': df['id'], 'type': df['type'], 'query_name': df['query_name'],
+            'query_value': df['query_value'], 'publication': df['publication'],
+            'publisher': df['publisher'], 'publication_date': df['publication_date'],
+            'database': df['database'], 'title': df['title'], 'url': df['url'],
+            'abstract': df['abstract']
+        }
+    )
+
+
+def _map_core(df, timings):
+    df = df.drop_duplicates('id')
+    df['publication_date'] = _timed_parse_dates(df['publication_date'], timings)
+    df['id'] = get_ids(df, 'core')
+    papers_core = pd.DataFrame(
+        {
+            'doi': df['id'], 'type': df['database'], 'query_name': df['query_name'],
+            'query_value': df['query_value'], 'publication': df['publication'],
+            'publisher': df['database'], 'publication_date': df['publication_date'],
+            'database': df['database'], 'title': df['title'], 'url': df['url'],
+            'abstract': df['abstract']
+        }
+    )
+    papers_core['database'] = 'core'
+    papers_core['publication'] = 'core'
+    return papers_core
+
+
+def _map_semantic_scholar(df, timings):
+    df = df.drop_duplicates('paperId')
+    dates = [str(df_date).split('.')[0] for df_date in df['year']]
+    df['publication_date'] = _timed_parse_dates(dates, timings)
+    df['id'] = get_ids(df, 'semantic_scholar')
+    return pd.DataFrame(
+        {
+            'doi': df['id'], 'type': df['database'], 'query_name': df['query_name'],
+            'query_value': df['query_value'], 'publication': df['database'],
+            'publisher': df['venue'], 'publication_date': df['publication_date'],
+            'database': df['database'], 'title': df['title'], 'url': df['url'],
+            'abstract': df['abstract']
+        }
+    )
+
+
+# Schema mapping from each database raw_papers file to the preprocessed papers format
+RAW_FILE_MAPPERS = {
+    'ieeexplore': _map_ieeexplore,
+    'springer': _map_springer,
+    'arxiv': _map_arxiv,
+    'scopus': _map_scopus,
+    'core': _map_core,
+    'semantic_scholar': _map_semantic_scholar,
+}
+RAW_FILE_LABELS = {
+    'ieeexplore': ('IEEE Xplore', 'IEEE'),
+    'springer': ('Springer', 'Springer'),
+    'arxiv': ('arXiv', 'Arxiv'),
+    'scopus': ('Scopus', 'Scopus'),
+    'core': ('CORE', 'Core'),
+    'semantic_scholar': ('Semantic Scholar', 'SemanticScholar'),
+}
+
+
 def get_ids(df, database):
     try:
         ids = []
@@ -868,8 +795,8 @@ def filter_papers(keywords, synonyms, folder_name, next_file, search_date, step)
         try:
             to_filter = './papers/' + folder_name + '/' + str(search_date).replace('-', '_') + '/' + next_file;
             preprocessed_papers = pd.read_csv(to_filter)
-            preprocessed_papers.dropna(subset=["abstract"], inplace=True)
-            filtered_papers = filter_by_keywords(preprocessed_papers, keywords, synonyms)
+            index = term_index.open_index(to_filter) if util.get_performance_parameters()['term_index'] else None
+            filtered_papers = filter_by_keywords(preprocessed_papers, keywords, synonyms, index)
             if len(filtered_papers) > 0:
                 filtered_papers['type'] = 'filtered'
                 filtered_papers['status'] = 'unknown'
@@ -892,23 +819,16 @@ def filter_papers(keywords, synonyms, folder_name, next_file, search_date, step)
     return syntactic_filtered_file_name
 
 
-def filter_by_keywords(papers, keywords, synonyms):
+def filter_by_keywords(papers, keywords, synonyms, index=None):
     try:
-        papers = papers.dropna(subset=['abstract'])
-        filtered_papers = papers
-        filtered_papers['abstract_lower'] = filtered_papers['abstract'].str.replace('-', ' ')
-        filtered_papers['abstract_lower'] = filtered_papers['abstract_lower'].str.lower()
-        filtered_papers['abstract_lower'] = filtered_papers['abstract_lower'].str.replace('\n', ' ')
-        filtered_papers['abstract_lower'] = filtered_papers['abstract_lower'].apply(lemmatize_text)
-
-        for keyword in keywords:
-            terms = [r'\b' + lemma.lemmatize(keyword.lower()) + r'\b']
-            if keyword in synonyms:
-                synonym_list = synonyms[keyword]
-                for synonym in synonym_list:
-                    terms.append(r'\b' + lemma.lemmatize(synonym.lower()) + r'\b')
-            filtered_papers = filtered_papers[filtered_papers['abstract_lower'].str.contains('|'.join(terms), na=False)]
-        filtered_papers = filtered_papers.drop(['abstract_lower'], axis=1)
+        if index is not None and index.rows == len(papers):
+            # The rows of the term index of the papers file are the rows of papers
+            filtered_papers = papers.iloc[index.filter(keywords, synonyms)].dropna(subset=['abstract'])
+        else:
+            papers = papers.dropna(subset=['abstract'])
+            # Every keyword (or one of its synonyms) must appear in the abstract
+            hits = KeywordMatcher(keyword_terms(keywords, synonyms)).match(papers['abstract'])
+            filtered_papers = papers[hits.all(axis=1)]
         filtered_papers = filtered_papers.drop_duplicates('title')
         filtered_papers['id'] = list(range(1, len(filtered_papers) + 1))
         return filtered_papers
@@ -929,25 +849,9 @@ def filter_by_keywords(papers, keywords, synonyms):
 def filter_by_keywords_springer(papers, keywords, synonyms):
     try:
         papers = papers.dropna(subset=['abstract'])
-        filtered_papers = papers
-        filtered_papers['abstract_lower'] = filtered_papers['abstract'].str.replace('-', ' ')
-        filtered_papers['abstract_lower'] = filtered_papers['abstract_lower'].str.lower()
-        filtered_papers['abstract_lower'] = filtered_papers['abstract_lower'].str.replace('\n', ' ')
-        filtered_papers['abstract_lower'] = filtered_papers['abstract_lower'].apply(lemmatize_text)
-
-        for keyword in keywords:
-            temp_terms = keyword.lower().split(' ')
-            if keyword in synonyms:
-                synonym_list = synonyms[keyword]
-                for synonym in synonym_list:
-                    terms = synonym.lower().split(' ')
-                    for term in terms:
-                        temp_terms.append(term)
-            terms = []
-            for term in temp_terms:
-                terms.append(r'\b' + lemma.lemmatize(term) + r'\b')
-            filtered_papers = filtered_papers[filtered_papers['abstract_lower'].str.contains('|'.join(terms), na=False)]
-        filtered_papers = filtered_papers.drop(['abstract_lower'], axis=1)
+        # Every keyword needs one of its words or the words of its synonyms in the abstract
+        hits = KeywordMatcher(keyword_terms(keywords, synonyms, split_words=True)).match(papers['abstract'])
+        filtered_papers = papers[hits.all(axis=1)]
         filtered_papers = filtered_papers.drop_duplicates('title')
         filtered_papers['id'] = list(range(1, len(filtered_papers) + 1))
         return filtered_papers
@@ -966,12 +870,12 @@ def filter_by_keywords_springer(papers, keywords, synonyms):
 
 
 def tokenize(doc):
-    return simple_preprocess(strip_tags(doc), deacc=True, min_len=2, max_len=15)
+    return lazy_imports.simple_preprocess(lazy_imports.strip_tags(doc), deacc=True, min_len=2, max_len=15)
 
 
 def lemmatize_text(text):
     try:
-        return ' '.join([lemma.lemmatize(word) for word in w_tokenizer.tokenize(text)])
+        return ' '.join([lemmatize_word(word) for word in lazy_imports.whitespace_tokenizer().tokenize(text)])
     except (AttributeError, TypeError, ValueError) as e:
         # Return original text if lemmatization fails
         logger.debug(f"Lemmatization error: {type(e).__name__}: {str(e)}")
@@ -0,0 +1,251 @@
+"""Screening sessions of the manual review steps.
+
+A session keeps the papers of a review in memory and moves the work done between
+two decisions of the reviewer to background threads:
+
+- Prefetching: a thread prepares the next candidates ('screening_prefetch' performance
+  parameter) in a bounded queue, so the next paper is ready as soon as a decision is
+  made.
+- Persistence: another thread saves the decisions. The papers file is rewritten with
+  the statuses of all the decisions made so far, through a temporary file so that an
+  interrupted write does not corrupt it, and the decisions made while it is written
+  are saved together in the next write. Included papers are appended to the file of
+  the step in the order they were decided.
+
+Candidates are taken in random order, as the papers were sampled before, or in the
+order of a prioritizer (see analysis.prioritization). The prioritizer is retrained by
+the prefetching thread every 'screening_retrain_every' decisions, and the candidates
+prepared before are then prepared again in the new order. close() (or leaving the
+with block) waits until every decision is saved.
+"""
+import os
+import queue
+import threading
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from util import util
+from util.logging_standards import LogCategory
+
+fr = 'utf-8'
+UNKNOWN = 'unknown'
+# Columns of the papers appended to the file of the step, in order
+RECORD_COLUMNS = ['id', 'status', 'doi', 'publisher', 'database', 'query_name', 'query_value', 'url',
+                  'publication_date', 'title', 'abstract', 'semantic_score']
+# Marks the end of the items of a queue
+_END = object()
+
+
+class Candidate:
+    """Paper waiting for a decision: its position in the session and its row (one-row DataFrame)."""
+
+    def __init__(self, position: int, paper: pd.DataFrame):
+        self.position = position
+        self.paper = paper
+
+
+class ScreeningSession:
+    """Papers of a manual review step with their decisions.
+
+    Args:
+        papers: Papers of the review, with an id and a status column (UNKNOWN for the
+            papers to review).
+        papers_file: File of the papers, rewritten with the decisions.
+        decisions_file: File of the step, where included papers are appended.
+        included_status: Status of the papers appended to decisions_file (UNKNOWN when
+            they are reviewed again in the next step).
+        prefetch: Candidates prepared in advance (default: 'screening_prefetch'
+            performance parameter).
+        seed: Seed of the random order of the candidates.
+        prioritizer: Optional ScreeningPrioritizer of the papers (random order otherwise).
+    """
+
+    def __init__(self, papers: pd.DataFrame, papers_file: str, decisions_file: str, included_status: str = UNKNOWN,
+                 prefetch: int = None, seed=None, prioritizer=None):
+        if prefetch is None:
+            prefetch = util.get_performance_parameters()['screening_prefetch']
+        self.papers = papers.reset_index(drop=True)
+        self.papers_file = papers_file
+        self.decisions_file = decisions_file
+        self.included_status = included_status
+        self.status = self.papers['status'].to_numpy(dtype=object).copy()
+        self.counts = Counter(self.status)
+        self.order = np.random.default_rng(seed).permutation(np.flatnonzero(self.status == UNKNOWN))
+        self.prioritizer = prioritizer
+        # Candidates given to the reviewer, which are not prepared again
+        self._taken = np.zeros(len(self.status), dtype=bool)
+        self._current = None
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        # Set when the order of the candidates changes (e.g. the prioritizer is out of date)
+        self._reorder = threading.Event()
+        self._candidates = queue.Queue(maxsize=max(1, prefetch))
+        self._decisions = queue.Queue()
+        self._prefetcher = threading.Thread(target=self._prefetch, name='screening-prefetch', daemon=True)
+        self._writer = threading.Thread(target=self._write, name='screening-writer', daemon=True)
+        self._prefetcher.start()
+        self._writer.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def total(self) -> int:
+        return len(self.status)
+
+    @property
+    def pending(self) -> int:
+        return self.counts[UNKNOWN]
+
+    def remaining_relevant(self):
+        """Estimated relevant papers among the pending ones (None without a trained prioritizer)."""
+        if self.prioritizer is None:
+            return None
+        return self.prioritizer.remaining_relevant(np.flatnonzero(self.status == UNKNOWN))
+
+    def _labels(self) -> np.ndarray:
+        with self._lock:
+            status = self.status.copy()
+        return np.where(status == UNKNOWN, -1, np.where(status == 'included', 1, 0))
+
+    def _ranking(self) -> np.ndarray:
+        """Pending positions in the order they are reviewed, retraining the prioritizer when needed."""
+        if self.prioritizer is None:
+            return self.order
+        labels = self._labels()
+        if self.prioritizer.needs_training(int((labels >= 0).sum())):
+            try:
+                self.prioritizer.train(labels)
+            except Exception as ex:
+                util.logger.warning(LogCategory.DATA, "screening", "_ranking",
+                                    f"Prioritizer not retrained: {type(ex).__name__}: {str(ex)}")
+        return self.prioritizer.rank(np.flatnonzero(labels < 0))
+
+    def _prefetch(self):
+        try:
+            while not self._closed.is_set():
+                self._reorder.clear()
+                try:
+                    ranking = self._ranking()
+                except Exception as ex:
+                    # The remaining papers are reviewed in random order
+                    util.logger.warning(LogCategory.DATA, "screening", "_prefetch",
+                                        f"Papers reviewed in random order: {type(ex).__name__}: {str(ex)}")
+                    self.prioritizer = None
+                    ranking = self.order
+                # Candidates prepared in the previous order are prepared again
+                while True:
+                    try:
+                        self._candidates.get_nowait()
+                    except queue.Empty:
+                        break
+                for position in ranking:
+                    if self._closed.is_set() or self._reorder.is_set():
+                        break
+                    if self.status[position] != UNKNOWN or self._taken[position]:
+                        continue
+                    self._put(Candidate(position, self.papers.iloc[[position]]))
+                else:
+                    # Every pending paper is prepared until the order changes
+                    while not self._closed.is_set() and not self._reorder.wait(0.1):
+                        continue
+        except Exception as ex:
+            util.logger.error(LogCategory.DATA, "screening", "_prefetch",
+                              f"Candidates no longer prepared: {type(ex).__name__}: {str(ex)}")
+
+    def _put(self, candidate: Candidate) -> None:
+        # Waits for room in the queue unless the session is closed or the order changes
+        while not self._closed.is_set() and not self._reorder.is_set():
+            try:
+                self._candidates.put(candidate, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def next(self):
+        """Next candidate to review (None when every paper has a decision or prefetching failed)."""
+        if self._current is not None and self.status[self._current.position] == UNKNOWN:
+            # The previous candidate got no decision, so it is prepared again
+            self._taken[self._current.position] = False
+            self._reorder.set()
+        self._current = None
+        while self.pending > 0:
+            try:
+                candidate = self._candidates.get(timeout=0.1)
+            except queue.Empty:
+                if not self._prefetcher.is_alive() and self._candidates.empty():
+                    # Prefetching failed (see _prefetch); the decisions made so far are saved
+                    util.logger.error(LogCategory.DATA, "screening", "next",
+                                      "No more papers can be prepared; the review is stopped. "
+                                      "Run the step again to resume it.")
+                    return None
+                continue
+            if self.status[candidate.position] != UNKNOWN or self._taken[candidate.position]:
+                continue
+            self._taken[candidate.position] = True
+            self._current = candidate
+            return candidate
+        return None
+
+    def decide(self, candidate: Candidate, status: str) -> None:
+        """Record the decision on a candidate; it is saved in the background."""
+        with self._lock:
+            self.status[candidate.position] = status
+            self.counts[UNKNOWN] -= 1
+            self.counts[status] += 1
+            record_id = self.counts[status]
+        record = self.record(candidate.paper, record_id) if status == 'included' else None
+        self._decisions.put(record)
+        if self.prioritizer is not None and \
+                self.prioritizer.needs_training(self.total - self.pending):
+            self._reorder.set()
+
+    def record(self, paper: pd.DataFrame, record_id: int) -> pd.DataFrame:
+        """Row of an included paper in the file of the step."""
+        columns = [column for column in RECORD_COLUMNS if column in paper.columns or column in ['id', 'status']]
+        record = paper.reindex(columns=columns)
+        record['id'] = record_id
+        record['status'] = self.included_status
+        return record
+
+    def _write(self):
+        done = False
+        while not done:
+            decisions = [self._decisions.get()]
+            # Decisions made while the previous ones were saved are saved at once
+            while True:
+                try:
+                    decisions.append(self._decisions.get_nowait())
+                except queue.Empty:
+                    break
+            done = any(decision is _END for decision in decisions)
+            records = [decision for decision in decisions if decision is not _END and decision is not None]
+            if len(decisions) > (1 if done else 0) or records:
+                self._save(records)
+
+    def _save(self, records: list) -> None:
+        try:
+            if records:
+                util.save(self.decisions_file, pd.concat(records), fr, 'a+')
+            with self._lock:
+                status = self.status.copy()
+            temp_file = self.papers_file + '.tmp'
+            util.save(temp_file, self.papers.assign(status=status), fr, 'w')
+            os.replace(temp_file, self.papers_file)
+        except Exception as ex:
+            util.logger.warning(LogCategory.FILE, "screening", "_save",
+                                f"Decisions not saved to {self.papers_file}: {type(ex).__name__}: {str(ex)}")
+
+    def close(self) -> None:
+        """Stop prefetching and wait until every decision is saved."""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._decisions.put(_END)
+        self._writer.join()
+        self._prefetcher.join()
@@ -1,15 +1,20 @@
+import re
+
+import numpy as np
 import pandas as pd
-from sentence_transformers import SentenceTransformer
-from sentence_transformers import util as sentence_util
 from os.path import exists
 from util import util
+from analysis import ann_index
+from analysis import embedding_store
+from analysis import model_registry
 from util.error_standards import (
     ErrorHandler, create_error_context, ErrorSeverity, ErrorCategory,
     get_standard_error_info
 )
+from util.language import clean_texts
 from util.logging_standards import LogCategory
-from tqdm import tqdm
 import logging
+from tqdm import tqdm
 
 fr = 'utf-8'
 logger = logging.getLogger('logger')
@@ -69,57 +74,291 @@ def search(semantic_filters, folder_name, next_file, search_date, step):
         return next_file
 
 
+def get_model_name(semantic_filters):
+    """Return the embedding model of the semantic filters.
+
+    The model is set with a 'model' entry in semantic_filters (e.g. {'model': 'allenai-specter'})
+    and defaults to model_registry.DEFAULT_MODEL.
+    """
+    for keyword in semantic_filters:
+        if isinstance(keyword, dict) and keyword.get('model'):
+            return keyword['model']
+    return model_registry.DEFAULT_MODEL
+
+
+def uses_bert(semantic_filters):
+    """Return whether the semantic filters use the BERT (sentence embedding) search."""
+    return any(isinstance(keyword, dict) and keyword.get('type') == 'bert' for keyword in semantic_filters)
+
+
+# Entries of semantic_filters that are not named descriptions
+SEMANTIC_FILTER_KEYS = ['type', 'description', 'score', 'model', 'combine']
+COMBINATION_RULES = ['any', 'all']
+
+
+def get_descriptions(semantic_filters):
+    """Return the descriptions of the semantic filters and the rule combining them.
+
+    A filter has one 'description' entry or several named descriptions, e.g.
+    {'edge computing': 'Papers about ...'} or {'edge computing': {'description': '...', 'score': 0.8}}.
+    Descriptions without their own score use the 'score' entry (0 by default). The
+    'combine' entry selects papers matching any (default) or all the descriptions.
+
+    Returns:
+        Tuple with the list of descriptions (dicts with name, description, score and the
+        column of their scores, None for a single 'description') and the combination rule.
+
+    Raises:
+        ValueError: If the combination rule is unknown or two descriptions have the same name.
+    """
+    score = 0.0
+    rule = 'any'
+    for keyword in semantic_filters:
+        if isinstance(keyword, dict):
+            score = keyword.get('score', score)
+            rule = keyword.get('combine', rule)
+    if rule not in COMBINATION_RULES:
+        raise ValueError(f"Unknown semantic filter combination '{rule}', expected one of {COMBINATION_RULES}")
+    descriptions = []
+    for keyword in semantic_filters:
+        if not isinstance(keyword, dict):
+            continue
+        for key, value in keyword.items():
+            if key == 'description':
+                descriptions.append({'name': None, 'description': value, 'score': score})
+            elif key not in SEMANTIC_FILTER_KEYS:
+                if isinstance(value, dict):
+                    descriptions.append({'name': str(key), 'description': value.get('description'),
+                                         'score': value.get('score', score)})
+                else:
+                    descriptions.append({'name': str(key), 'description': value, 'score': score})
+    descriptions = [description for description in descriptions if description['description']]
+    names = [description['name'] or 'description' for description in descriptions]
+    if len(set(names)) < len(names):
+        raise ValueError(f"Semantic filter descriptions must have different names: {names}")
+    for description, name in zip(descriptions, names):
+        named = len(descriptions) > 1 or description['name'] is not None
+        description['column'] = 'semantic_score_' + re.sub(r'\W+', '_', name).strip('_') if named else None
+    return descriptions, rule
+
+
+def encode(texts, semantic_filters, show_progress_bar=False, store=None):
+    """Embeddings of texts with the model of the semantic filters.
+
+    Embeddings are read from the embedding store set in the 'embedding_store_folder'
+    performance parameter (or from store, when it is already open) and only the texts
+    that are not stored yet are encoded, by 'embedding_workers' processes in batches of
+    'embedding_batch_size' texts.
+    """
+    performance_parameters = util.get_performance_parameters()
+    return embedding_store.encode(texts, get_model_name(semantic_filters),
+                                  store_folder=performance_parameters['embedding_store_folder'],
+                                  dtype=performance_parameters['embedding_store_dtype'],
+                                  show_progress_bar=show_progress_bar, store=store,
+                                  workers=performance_parameters['embedding_workers'],
+                                  batch_size=performance_parameters['embedding_batch_size'])
+
+
+def _normalize(embeddings):
+    """Embeddings scaled to unit length (zero vectors stay zero)."""
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+def mean_cosine_similarity(candidates, references):
+    """Mean cosine similarity of every candidate embedding to all the reference embeddings.
+
+    The mean of the cosine similarities of a candidate to the references is the dot
+    product of the normalized candidate with the mean of the normalized references, so
+    the candidate x reference similarity matrix is reduced with one matrix-vector product.
+
+    Args:
+        candidates: Matrix with one embedding per candidate paper.
+        references: Matrix with one embedding per reference (e.g. selected) paper.
+
+    Returns:
+        Array with the score of every candidate (0 when there are no references).
+    """
+    candidates = np.asarray(candidates, dtype=np.float32)
+    references = np.asarray(references, dtype=np.float32)
+    if len(candidates) == 0 or len(references) == 0:
+        return np.zeros(len(candidates), dtype=np.float32)
+    return _normalize(candidates) @ _normalize(references).mean(axis=0)
+
+
+def open_search(semantic_filters):
+    """Embedding store and index used to score texts with the model of the semantic filters.
+
+    Returns:
+        Tuple with the store (None when the 'embedding_store_folder' performance parameter
+        is empty), the index of the store (None unless 'semantic_index_probes' is set) and
+        the number of lists probed.
+    """
+    performance_parameters = util.get_performance_parameters()
+    store = embedding_store.open_store(performance_parameters['embedding_store_folder'],
+                                       get_model_name(semantic_filters),
+                                       performance_parameters['embedding_store_dtype'],
+                                       performance_parameters['embedding_workers'],
+                                       performance_parameters['embedding_batch_size'])
+    probes = performance_parameters['semantic_index_probes']
+    return store, ann_index.open_index(store, probes), probes
+
+
+def search_parameters(semantic_filters) -> dict:
+    """Parameters the papers found by the semantic filters depend on (key of the pipeline step).
+
+    The dtype of the embedding store and the lists probed by its index change the
+    scores (quantization, approximate search), so they are part of it.
+    """
+    performance_parameters = util.get_performance_parameters()
+    return {'semantic_filters': semantic_filters,
+            'embedding_store_dtype': performance_parameters['embedding_store_dtype'],
+            'semantic_index_probes': performance_parameters['semantic_index_probes']}
+
+
+def score_texts(texts, query_embeddings, semantic_filters, store=None, index=None, probes=0, show_progress_bar=False):
+    """Cosine similarity of texts with normalized query embeddings.
+
+    A query can also be the mean of normalized embeddings (mean cosine similarity).
+    With an index, only the texts in the lists probed for some query are read from the
+    store and scored; the other texts score 0.
+
+    Args:
+        texts: Texts to score.
+        query_embeddings: Query embedding, or matrix with one query embedding per row.
+        semantic_filters: Semantic filters (model of the embeddings).
+        store: Embedding store (see open_search).
+        index: Index of the store (see open_search).
+        probes: Number of lists probed in the index for every query.
+        show_progress_bar: Whether the model shows a progress bar while encoding.
+
+    Returns:
+        Array with the score of every text, or matrix with a column per query when
+        query_embeddings is a matrix.
+    """
+    query_embeddings = np.asarray(query_embeddings, dtype=np.float32)
+    if index is None:
+        return _normalize(encode(texts, semantic_filters, show_progress_bar=show_progress_bar, store=store)) \
+            @ query_embeddings.T
+    rows = store.rows(clean_texts(texts), show_progress_bar=show_progress_bar)
+    candidates = np.zeros(len(rows), dtype=bool)
+    for query_embedding in np.atleast_2d(query_embeddings):
+        candidates |= index.candidates(rows, query_embedding, probes)
+    scores = np.zeros((len(rows), len(query_embeddings)) if query_embeddings.ndim == 2 else len(rows),
+                      dtype=np.float32)
+    scores[candidates] = _normalize(store.get(rows[candidates])) @ query_embeddings.T
+    return scores
+
+
+def select_hits(papers, corpus_ids, hit_scores, score):
+    """Assign the scores of the search hits to the papers and select the papers above score.
+
+    Args:
+        papers: DataFrame with the searched papers; its 'semantic_score' column is set
+            (0 for papers without a hit).
+        corpus_ids: Position in papers of every hit.
+        hit_scores: Score of every hit.
+        score: Minimum score of the selected papers.
+
+    Returns:
+        The hits with a score of at least score, from the highest to the lowest score.
+    """
+    corpus_ids = np.asarray(corpus_ids, dtype=np.int64)
+    scores = np.zeros(len(papers), dtype=float)
+    scores[corpus_ids] = hit_scores
+    hit = np.zeros(len(papers), dtype=bool)
+    hit[corpus_ids] = True
+    papers['semantic_score'] = scores
+    above = np.flatnonzero(hit & (scores >= score))
+    return papers.iloc[above[np.argsort(-scores[above], kind='stable')]]
+
+
+def select_matches(papers, scores, descriptions, rule='any'):
+    """Select the papers matching the descriptions of a semantic filter.
+
+    Args:
+        papers: DataFrame with the scored papers; its 'semantic_score' column is set to the
+            best score of every paper and the column of every named description to its scores.
+        scores: Matrix with the score of every paper (rows) for every description (columns).
+        descriptions: Descriptions (see get_descriptions).
+        rule: 'any' to select the papers reaching the score of some description, 'all' to
+            select the papers reaching the scores of all of them.
+
+    Returns:
+        The selected papers, from the highest to the lowest semantic_score.
+    """
+    scores = np.asarray(scores).reshape(len(papers), len(descriptions))
+    for description, description_scores in zip(descriptions, scores.T):
+        if description['column']:
+            papers[description['column']] = description_scores
+    matches = scores >= np.array([description['score'] for description in descriptions], dtype=float)
+    selected = np.flatnonzero(matches.any(axis=1) if rule == 'any' else matches.all(axis=1))
+    return select_hits(papers, selected, scores.max(axis=1)[selected], -np.inf)
+
+
+def filter_chunks(papers_chunks, descriptions, semantic_filters, rule='any'):
+    """Semantic filter of papers read in chunks, keeping only the matching papers of every chunk.
+
+    Every chunk is encoded (through the embedding store), scored against all the
+    descriptions with one matrix product and reduced to its matches (see select_matches)
+    before the next chunk is read, so the memory used does not grow with the number of
+    papers but with the chunk size and the number of matches. With an index (see
+    open_search), only the papers in the probed lists are scored.
+
+    Args:
+        papers_chunks: Iterable of DataFrames with the title and abstract of the papers
+            (e.g. pd.read_csv with chunksize).
+        descriptions: Descriptions the papers are compared with (see get_descriptions).
+        semantic_filters: Semantic filters (model of the embeddings).
+        rule: Combination rule of the descriptions ('any' or 'all').
+
+    Returns:
+        The matching papers (with 'concatenated', 'semantic_score' and per-description
+        score columns), from the highest to the lowest score.
+    """
+    store, index, probes = open_search(semantic_filters)
+    query_embeddings = _normalize(encode([description['description'] for description in descriptions],
+                                         semantic_filters, store=store))
+    found_chunks = []
+    for papers in tqdm(papers_chunks, unit='chunk', desc='Semantic filter'):
+        papers['concatenated'] = (papers['title'] + '[SEP]' + papers['abstract'])
+        scores = score_texts(papers['concatenated'].values, query_embeddings, semantic_filters, store, index, probes)
+        found_chunks.append(select_matches(papers, scores, descriptions, rule))
+    if len(found_chunks) == 0:
+        return pd.DataFrame()
+    found_papers = pd.concat(found_chunks)
+    return found_papers.iloc[np.argsort(-found_papers['semantic_score'].values, kind='stable')]
+
+
 def bert_search(semantic_filters, folder_name, next_file, search_date, step):
     semantic_filtered_file_name = './papers/' + folder_name + '/' + str(search_date).replace('-', '_') + '/' \
                                   + str(step) + '_semantic_filtered_papers.csv'
     if not exists(semantic_filtered_file_name):
         try:
             papers_file = './papers/' + folder_name + '/' + str(search_date).replace('-', '_') + '/' + next_file
-            papers = pd.read_csv(papers_file)
+            chunk_size = util.get_performance_parameters()['semantic_chunk_size']
+            papers_chunks = pd.read_csv(papers_file, chunksize=chunk_size)
             found_papers = pd.DataFrame()
             
-            # Initialize BERT model with error handling
             try:
-                model = SentenceTransformer('allenai-specter')
-            except Exception as model_ex:
-                context = create_error_context(
-                    module="semantic_analyser",
-                    function="bert_search",
-                    operation="bert_model_loading",
-                    severity=ErrorSeverity.WARNING,
-                    category=ErrorCategory.SYSTEM
-                )
+                descriptions, rule = get_descriptions(semantic_filters)
+                
+                if not descriptions:
+                    logger.warning(
+                        LogCategory.CONFIGURATION,
+                        "semantic_analyser",
+                        "bert_search",
+                        "No description found in semantic filters. Skipping semantic filtering."
+                    )
+                    return next_file
                 
-                error_info = get_standard_error_info("data_validation_failed")
-                error_handler = ErrorHandler(logger)
-                error_msg = error_handler.handle_error(
-                    error=model_ex,
-                    context=context,
-                    error_type="BERTModelLoadingError",
-                    error_description=f"Error loading BERT model: {type(model_ex).__name__}: {str(model_ex)}",
-                    recovery_suggestion=error_info["recovery"],
-                    next_steps=error_info["next_steps"]
-                )
-                return next_file
-            
-            try:
-                papers['concatenated'] = (papers['title'] + '[SEP]' + papers['abstract'])
-                papers['semantic_score'] = 0.0
-                papers_array = papers['concatenated'].values
-                logger.info(
-                    LogCategory.DATA,
-                    "semantic_analyser",
-                    "bert_search",
-                    "Creating the embeddings for the preprocessed papers..."
-                )
-                encoded_papers = model.encode(papers_array, convert_to_tensor=True, show_progress_bar=True)
             except (KeyError, ValueError, TypeError) as e:
                 context = create_error_context(
                     module="semantic_analyser",
                     function="bert_search",
-                    operation="paper_preparation",
+                    operation="semantic_search_configuration",
                     severity=ErrorSeverity.WARNING,
-                    category=ErrorCategory.DATA
+                    category=ErrorCategory.CONFIGURATION
                 )
                 
                 error_info = get_standard_error_info("data_validation_failed")
@@ -127,8 +366,8 @@ def bert_search(semantic_filters, folder_name, next_file, search_date, step):
                 error_msg = error_handler.handle_error(
                     error=e,
                     context=context,
-                    error_type="PaperPreparationError",
-                    error_description=f"Error preparing papers for BERT processing: {type(e).__name__}: {str(e)}",
+                    error_type="SemanticSearchConfigurationError",
+                    error_description=f"Error in semantic search configuration: {type(e).__name__}: {str(e)}",
                     recovery_suggestion=error_info["recovery"],
                     next_steps=error_info["next_steps"]
                 )
@@ -155,38 +394,20 @@ def bert_search(semantic_filters, folder_name, next_file, search_date, step):
                 return next_file
             
             try:
-                queries = []
-                score = 0.0
-                for keyword in semantic_filters:
-                    if 'description' in keyword:
-                        description = keyword['description']
-                    if 'score' in keyword:
-                        score = keyword['score']
-                
-                if 'description' not in locals() or not description:
-                    logger.warning(
-                        LogCategory.CONFIGURATION,
-                        "semantic_analyser",
-                        "bert_search",
-                        "No description found in semantic filters. Skipping semantic filtering."
-                    )
-                    return next_file
-                
                 logger.info(
                     LogCategory.DATA,
                     "semantic_analyser",
                     "bert_search",
-                    "Abstracts semantic matching..."
+                    f"Abstracts semantic matching with {len(descriptions)} description(s) in chunks of {chunk_size} papers..."
                 )
-                query_embedding = model.encode(description, convert_to_tensor=True)
-                hits = sentence_util.semantic_search(query_embedding, encoded_papers, top_k=len(papers_array))
+                found_papers = filter_chunks(papers_chunks, descriptions, semantic_filters, rule)
             except (KeyError, ValueError, TypeError) as e:
                 context = create_error_context(
                     module="semantic_analyser",
                     function="bert_search",
-                    operation="semantic_search_configuration",
+                    operation="semantic_search",
                     severity=ErrorSeverity.WARNING,
-                    category=ErrorCategory.CONFIGURATION
+                    category=ErrorCategory.DATA
                 )
                 
                 error_info = get_standard_error_info("data_validation_failed")
@@ -194,8 +415,8 @@ def bert_search(semantic_filters, folder_name, next_file, search_date, step):
                 error_msg = error_handler.handle_error(
                     error=e,
                     context=context,
-                    error_type="SemanticSearchConfigurationError",
-                    error_description=f"Error in semantic search configuration: {type(e).__name__}: {str(e)}",
+                    error_type="SemanticSearchError",
+                    error_description=f"Error in semantic search: {type(e).__name__}: {str(e)}",
                     recovery_suggestion=error_info["recovery"],
                     next_steps=error_info["next_steps"]
                 )
@@ -221,29 +442,6 @@ def bert_search(semantic_filters, folder_name, next_file, search_date, step):
                 )
                 return next_file
             
-            try:
-                for hit in hits[0]:
-                    if hit['score'] >= score:
-                        paper_array = papers_array[hit['corpus_id']]
-                        if len(found_papers) == 0:
-                            papers.loc[papers['concatenated'] == paper_array, 'semantic_score'] = hit['score']
-                            found_papers = papers[papers['concatenated'] == paper_array]
-                        else:
-                            papers.loc[papers['concatenated'] == paper_array, 'semantic_score'] = hit['score']
-                            found_papers = pd.concat([found_papers, papers[papers['concatenated'] == paper_array]])
-            except (KeyError, ValueError, TypeError, IndexError) as e:
-                # User-friendly message explaining what's happening
-                logger.info("Error processing semantic search results. Skipping semantic filtering. Please see the log file for details.")
-                # Detailed logging for debugging
-                logger.debug(f"Result processing error: {type(e).__name__}: {str(e)}")
-                return next_file
-            except Exception as ex:
-                # User-friendly message explaining what's happening
-                logger.info("Unexpected error processing semantic search results. Skipping semantic filtering. Please see the log file for details.")
-                # Detailed logging for debugging
-                logger.error(f"Unexpected result processing error: {type(ex).__name__}: {str(ex)}")
-                return next_file
-            
             try:
                 if len(found_papers) > 0:
                     columns_to_drop = ['concatenated']
@@ -363,21 +561,13 @@ def get_relevant_papers(folder_name, search_date, step, semantic_filters, citati
 
 def bert_search_relevant_papers(semantic_filters, original_papers, selected_papers):
     try:
-        # Initialize BERT model with error handling
-        try:
-            model = SentenceTransformer('allenai-specter')
-        except Exception as model_ex:
-            # User-friendly message explaining what's happening
-            logger.info("Error loading BERT model for relevant papers search. Returning empty DataFrame. Please see the log file for details.")
-            # Detailed logging for debugging
-            logger.error(f"BERT model loading error in relevant papers search: {type(model_ex).__name__}: {str(model_ex)}")
-            return pd.DataFrame()
-        
         try:
             selected_papers['concatenated'] = (selected_papers['title'] + '[SEP]' + selected_papers['abstract'])
             selected_papers_array = selected_papers['concatenated'].values
             logger.info("# Creating the embeddings for the selected papers...")
-            encoded_selected_papers = model.encode(selected_papers_array, convert_to_tensor=True, show_progress_bar=True)
+            store, index, probes = open_search(semantic_filters)
+            encoded_selected_papers = encode(selected_papers_array, semantic_filters, show_progress_bar=True,
+                                             store=store)
         except (KeyError, ValueError, TypeError) as e:
             # User-friendly message explaining what's happening
             logger.info("Error preparing selected papers for BERT processing. Returning empty DataFrame. Please see the log file for details.")
@@ -413,27 +603,12 @@ def bert_search_relevant_papers(semantic_filters, original_papers, selected_pape
         
         try:
             logger.info("# Semantic comparison of " + str(len(original_papers)) + " preprocessed papers...")
-            pbar = tqdm(total=len(original_papers))
-            for index, original_paper in original_papers.iterrows():
-                try:
-                    concatenated = original_paper['concatenated']
-                    concatenated_embedding = model.encode(concatenated, convert_to_tensor=True)
-                    hits = sentence_util.semantic_search(encoded_selected_papers, concatenated_embedding)
-                    avg_score = 0.0
-                    for hit in hits:
-                        avg_score = avg_score + hit[0]['score']
-                    avg_score = avg_score/len(hits)
-                    original_papers.loc[index, 'semantic_score'] = avg_score
-                except (KeyError, ValueError, TypeError, IndexError) as e:
-                    # Skip individual papers that can't be processed
-                    logger.debug(f"Error processing individual paper at index {index}: {type(e).__name__}: {str(e)}")
-                    continue
-                except Exception as ex:
-                    # Skip individual papers with unexpected errors
-                    logger.debug(f"Unexpected error processing individual paper at index {index}: {type(ex).__name__}: {str(ex)}")
-                    continue
-                pbar.update(1)
-            pbar.close()
+            if len(encoded_selected_papers) > 0:
+                # The mean cosine similarity to the selected papers is the similarity to their mean direction
+                original_papers['semantic_score'] = score_texts(original_papers['concatenated'].values,
+                                                                _normalize(encoded_selected_papers).mean(axis=0),
+                                                                semantic_filters, store, index, probes,
+                                                                show_progress_bar=True)
         except Exception as ex:
             # User-friendly message explaining what's happening
             logger.info("Error during semantic comparison. Returning empty DataFrame. Please see the log file for details.")
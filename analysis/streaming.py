@@ -0,0 +1,225 @@
+"""Streaming retrieval of papers, overlapped with preprocessing and embedding.
+
+With the 'streaming' performance parameter, step 0 of the pipeline runs as stages
+connected by bounded queues (of 'stream_queue_size' items) instead of retrieving all
+the papers before preprocessing them:
+
+    retrieval -> preparation -> language detection -> embedding
+
+- Retrieval: one thread per database (their rate limits are independent) requests the
+  papers of every query. Every raw file a client saves (one per query and database)
+  is put in the queue as soon as it is written.
+- Preparation: the raw file is mapped to the preprocessed schema, filtered by dates,
+  deduplicated against the papers of the previous files (util.dedup.DeduplicationIndex)
+  and cleaned of papers without title or abstract, surveys and theses.
+- Language detection: the abstracts are identified with the cache of the
+  'language_cache_file' performance parameter.
+- Embedding: when the semantic filters use BERT, the English papers are encoded into
+  the embedding store ('embedding_store_folder').
+
+The stages fill the content-addressed caches of the later steps. Step 1 then
+preprocesses the raw files as usual and finds the language of every abstract in the
+cache, and the semantic filter finds the embeddings in the store, so the outputs are
+the same as without streaming while the expensive work of these steps runs during
+the retrieval. A full queue blocks the stage feeding it, so slow stages hold back the
+retrieval instead of accumulating papers in memory.
+"""
+import queue
+import threading
+import time
+from os.path import exists
+
+import numpy as np
+
+from analysis import embedding_store
+from analysis import retrieve
+from analysis import semantic_analyser
+from util import dedup
+from util import language
+from util import util
+from util.error_standards import (
+    ErrorHandler, create_error_context, ErrorSeverity, ErrorCategory,
+    get_standard_error_info
+)
+from util.logging_standards import LogCategory
+
+# Marks the end of the items of a queue
+_END = object()
+
+
+def raw_file_name(folder_name, search_date, query_name, database) -> str:
+    """File where a client saves the raw papers of a query (see BaseClient._generate_file_name)."""
+    return './papers/' + folder_name + '/' + str(search_date).replace('-', '_') + '/raw_papers/' + \
+        query_name.lower().replace(' ', '_') + '_' + database + '.csv'
+
+
+def _handle_stage_error(ex, function, operation, description):
+    context = create_error_context(
+        module="streaming",
+        function=function,
+        operation=operation,
+        severity=ErrorSeverity.WARNING,
+        category=ErrorCategory.DATA
+    )
+    error_info = get_standard_error_info("data_validation_failed")
+    error_handler = ErrorHandler(util.logger)
+    error_handler.handle_error(
+        error=ex,
+        context=context,
+        error_type="StreamingStageError",
+        error_description=f"{description}: {type(ex).__name__}: {str(ex)}",
+        recovery_suggestion=error_info["recovery"],
+        next_steps=error_info["next_steps"]
+    )
+
+
+def _retrieve(database, queries, syntactic_filters, synonyms, fields, types, folder_name, dates, start_date,
+              end_date, search_date, outbox):
+    """Retrieval stage of a database: puts every raw file of its queries in outbox."""
+    client = retrieve.DATABASE_CLIENTS[database]()
+    label = retrieve.RAW_FILE_LABELS[database][0]
+    # Semantic Scholar searches over its knowledge graph. Synonyms are not needed in this case.
+    database_synonyms = {} if database == 'semantic_scholar' else synonyms
+    for query in queries:
+        query_name = list(query.keys())[0]
+        util.logger.info(LogCategory.DATABASE, "streaming", "stream_papers",
+                         f"Requesting {label} for query: {query_name}...")
+        try:
+            client.get_papers(query, syntactic_filters, database_synonyms, fields, types, dates, start_date,
+                              end_date, folder_name, search_date)
+        except Exception as ex:
+            _handle_stage_error(ex, "stream_papers", "query_processing",
+                                f"Error requesting {label} for query {query_name}")
+        file_name = raw_file_name(folder_name, search_date, query_name, database)
+        if exists(file_name):
+            outbox.put((file_name, database))
+
+
+class _Preparation:
+    """Preparation stage: raw files to the new, complete papers that are not surveys or theses."""
+
+    def __init__(self, date_filter, start_date, end_date):
+        self.date_filter = date_filter
+        self.start_date = start_date
+        self.end_date = end_date
+        self.index = dedup.DeduplicationIndex()
+        self.records = 0
+
+    def __call__(self, item):
+        file_name, database = item
+        papers, _ = retrieve._preprocess_raw_file(file_name, database)
+        if self.date_filter:
+            papers = retrieve.filter_papers_by_dates(papers, self.start_date, self.end_date)
+        papers = dedup.drop_incomplete(papers, ['title', 'abstract'])
+        # Labels unique across files, as the index identifies records by label
+        papers.index = np.arange(self.records, self.records + len(papers))
+        self.records += len(papers)
+        keep, _ = self.index.add(papers)
+        papers = papers[keep]
+        # Same filters as util.clean_papers before the language detection
+        papers = papers.loc[~papers['title'].str.contains('survey|review|progress', case=False)]
+        return papers.loc[~papers['abstract'].str.contains(r'(?<!\w)thesis(?!\w)', case=False)]
+
+
+def _detect_language(papers):
+    """Language stage: English papers, with their verdicts added to the language cache."""
+    performance_parameters = util.get_performance_parameters()
+    english = language.is_english(
+        papers['abstract'].tolist(),
+        batch_size=performance_parameters['language_batch_size'],
+        n_process=performance_parameters['language_n_process'],
+        backend=performance_parameters['language_backend'],
+        cache_file=performance_parameters['language_cache_file']
+    )
+    return papers[english]
+
+
+class _Embedding:
+    """Embedding stage: adds the texts compared by the semantic filter to the embedding store."""
+
+    def __init__(self, store):
+        self.store = store
+
+    def __call__(self, papers):
+        texts = papers['title'] + '[SEP]' + papers['abstract']
+        self.store.rows(language.clean_texts(texts.values))
+        return None
+
+
+def _run_stage(name, function, inbox, outbox, timings, counts):
+    """Apply function to the items of inbox until its end, putting the non-empty results in outbox."""
+    while True:
+        item = inbox.get()
+        if item is _END:
+            break
+        start = time.perf_counter()
+        try:
+            result = function(item)
+        except Exception as ex:
+            _handle_stage_error(ex, "stream_papers", name, f"Error in the {name} stage of the stream")
+            result = None
+        timings[name] += time.perf_counter() - start
+        counts[name] += 1
+        if outbox is not None and result is not None and len(result) > 0:
+            outbox.put(result)
+    if outbox is not None:
+        outbox.put(_END)
+
+
+def stream_papers(queries, syntactic_filters, synonyms, databases, fields, types, folder_name, dates, start_date,
+                  end_date, search_date, semantic_filters=None, queue_size=None):
+    """Retrieve the papers of every query and database while preparing them for steps 1 and 2.
+
+    Takes the arguments of retrieve.get_papers and saves the same raw files (see the
+    module docstring for the stages).
+
+    Args:
+        semantic_filters: Semantic filters of the survey; the papers are encoded when they
+            use BERT and the embedding store is enabled.
+        queue_size: Maximum items in every queue (default: 'stream_queue_size'
+            performance parameter).
+
+    Returns:
+        True once every stage finished.
+    """
+    performance_parameters = util.get_performance_parameters()
+    if queue_size is None:
+        queue_size = performance_parameters['stream_queue_size']
+    stages = [('preparation', _Preparation(dates, start_date, end_date)), ('language', _detect_language)]
+    if semantic_filters and semantic_analyser.uses_bert(semantic_filters):
+        store = embedding_store.open_store(performance_parameters['embedding_store_folder'],
+                                           semantic_analyser.get_model_name(semantic_filters),
+                                           performance_parameters['embedding_store_dtype'],
+                                           performance_parameters['embedding_workers'],
+                                           performance_parameters['embedding_batch_size'])
+        if store is not None:
+            stages.append(('embedding', _Embedding(store)))
+    queues = [queue.Queue(maxsize=max(1, queue_size)) for _ in range(len(stages) + 1)]
+    timings = {name: 0.0 for name, _ in stages}
+    counts = {name: 0 for name, _ in stages}
+    start = time.perf_counter()
+    workers = []
+    for position, (name, function) in enumerate(stages):
+        outbox = queues[position + 1] if position + 1 < len(stages) else None
+        workers.append(threading.Thread(target=_run_stage, name='stream-' + name, daemon=True,
+                                        args=(name, function, queues[position], outbox, timings, counts)))
+    retrievers = [threading.Thread(target=_retrieve, name='stream-' + database, daemon=True,
+                                   args=(database, queries, syntactic_filters, synonyms, fields, types, folder_name,
+                                         dates, start_date, end_date, search_date, queues[0]))
+                  for database in databases if database in retrieve.DATABASE_CLIENTS]
+    for thread in workers + retrievers:
+        thread.start()
+    for thread in retrievers:
+        thread.join()
+    retrieval_time = time.perf_counter() - start
+    queues[0].put(_END)
+    for thread in workers:
+        thread.join()
+    util.logger.info(
+        LogCategory.PIPELINE,
+        "streaming",
+        "stream_papers",
+        f"Streamed {counts['preparation']} raw files in {time.perf_counter() - start:.2f}s "
+        f"(retrieval {retrieval_time:.2f}s, " + ', '.join(f"{name} {timings[name]:.2f}s" for name, _ in stages) + ")"
+    )
+    return True
@@ -9,9 +9,14 @@ from requests.models import Response
 import re
 import logging
 
+from util import boolean_query
+from util import query_planner
+
 
 file_handler = ''
 logger = logging.getLogger('sals_pipeline')
+# Seconds waited before every request
+REQUEST_DELAY = 1
 
 
 class Generic:
@@ -27,7 +32,7 @@ class Generic:
         except Exception:
             file_handler = ''
         request_result = None
-        time.sleep(1)
+        time.sleep(REQUEST_DELAY)
         headers['Content-type'] = 'application/json'
         headers['Accept'] = 'application/json'
         if method == 'post':
@@ -113,23 +118,10 @@ class Generic:
         return request_result
 
     def default_query(self, parameters):
-        query = parameters['query'].replace('(', '%28').replace(')', '%29').replace("'", "")
-        words = re.split(' <AND> | <OR> ', query)
-        for word in words:
-            word = word.replace('%29', '').replace('%28', '')
-            synonyms = parameters['synonyms']
-            query_parameter = ''
-            if word in synonyms.keys():
-                word_synonyms = synonyms[word]
-                query_parameter = query_parameter + '<field>:%22' + word + '%22'
-                for synonym in word_synonyms:
-                    query_parameter = query_parameter + '+OR+<field>:%22' + synonym + '%22'
-                query_parameter = '%28' + query_parameter + '%29'
-                query = query.replace(word, query_parameter)
-            else:
-                query_parameter = query_parameter + '<field>:%22' + word + '%22'
-                query = query.replace(word, query_parameter)
-        query = query.replace(' <AND> ', '+AND+').replace(' <OR> ', '+OR+').replace(' ', '+')
+        # Terms with synonyms are expanded by the compiled query; nested groups are URL-encoded parentheses
+        query = boolean_query.compile_query(parameters['query'], parameters['synonyms'])
+        query = query.render(lambda term: '<field>:%22' + term.replace(' ', '+') + '%22', '+AND+', '+OR+',
+                             '%28', '%29')
         query = '%28' + query + '%29'
 
         if 'fields' in parameters:
@@ -141,31 +133,16 @@ class Generic:
         return query
 
     def ieeexplore_query(self, parameters):
-        query = parameters['query'].replace("\'", '')
-        words = re.split(' <AND> | <OR> ', query)
-        for word in words:
-            word = word.replace(')', '').replace('(', '')
-            synonyms = parameters['synonyms']
-            query_parameter = ''
-            if word in synonyms.keys():
-                word_synonyms = synonyms[word]
-                query_parameter = query_parameter + '"' + word + '"'
-                for synonym in word_synonyms:
-                    query_parameter = query_parameter + 'OR"' + synonym + '"'
-                query_parameter = '(' + query_parameter + ')'
-                query = query.replace(word, query_parameter)
-            else:
-                query_parameter = query_parameter + '"' + word + '"'
-                query = query.replace(word, query_parameter)
-        query = query.replace(' <AND> ', 'AND').replace(' <OR> ', 'OR')
-        first_term = query.split('AND')[0]
-        first_term = first_term.replace('(', '').replace(')', '')
-        words_first_term = first_term.split('OR')
-        queries = []
-        for word in words_first_term:
-            q = query.replace('(' + first_term + ')', word)
-            queries.append(q)
-        return queries
+        # The whole query, split by the planner only when it has more terms than one request accepts
+        query = boolean_query.compile_query(parameters['query'], parameters['synonyms'])
+        return [planned.render(lambda term: '"' + term + '"', 'AND', 'OR')
+                for planned in query_planner.plan_queries(query, 'ieeexplore')]
+
+    def semantic_scholar_query(self, parameters):
+        # Plain text queries (the API has no boolean syntax), planned by the query planner
+        query = boolean_query.compile_query(parameters['query'], parameters['synonyms'])
+        return ['+'.join(term.replace(' ', '+') for term in planned.terms)
+                for planned in query_planner.plan_queries(query, 'semantic_scholar')]
 
     def elsevier_query(self, parameters):
         domains = []
@@ -195,24 +172,9 @@ class Generic:
         return query
 
     def core_query(self, parameters):
-        query = parameters['query'].replace("'", "")
-        words = re.split(' <AND> | <OR> ', query)
-        for word in words:
-            word = word.replace('(', '').replace(')', '')
-            synonyms = parameters['synonyms']
-            query_parameter = ''
-            if word in synonyms.keys():
-                word_synonyms = synonyms[word]
-                query_parameter = query_parameter + ' ' + word + ' '
-                for synonym in word_synonyms:
-                    query_parameter = query_parameter + ' OR ' + synonym + ' '
-                query_parameter = '(' + query_parameter + ')'
-                query = query.replace(word, query_parameter)
-            else:
-                query_parameter = query_parameter + ' ' + word + ' '
-                query_parameter = '(' + query_parameter + ')'
-                query = query.replace(word, query_parameter)
-        query = query.replace(' <AND> ', ' AND ').replace(' <OR> ', ' OR ')
+        query = boolean_query.compile_query(parameters['query'], parameters['synonyms'])
+        # Terms of several words are grouped so that the operators apply to the whole term
+        query = query.render(lambda term: '(' + term + ')' if ' ' in term else term, ' AND ', ' OR ')
         query = '<field>:(' + query + ')'
 
         if 'fields' in parameters:
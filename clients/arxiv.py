@@ -61,7 +61,7 @@ class ArxivClient(DatabaseClient):
         
         # Create initial request to get total count
         request = self._create_request(parameters)
-        raw_papers = self._retry_request(self.client.request, request, 'get', {}, {})
+        raw_papers = self._count_request(self.client.request, request, 'get', {}, {})
         expected_papers = self._get_expected_papers(raw_papers)
         
         self.logger.info(f"Expected papers from arxiv: {expected_papers}...")
@@ -72,6 +72,9 @@ class ArxivClient(DatabaseClient):
         if mod > 0:
             times = times + 1
             
+        if self.dry_run:
+            return self._record_plan(expected_papers, self._pages(expected_papers))
+            
         # Execute requests
         papers = self._execute_requests(query, parameters, times, expected_papers, mod)
         return papers
@@ -5,6 +5,8 @@ import time
 from tqdm import tqdm
 from os.path import exists
 from util import util
+from .apis.generic import REQUEST_DELAY
+from util.response_cache import ResponseCache, request_key
 from util.error_standards import ErrorHandler, create_error_context, ErrorSeverity, ErrorCategory, get_standard_error_info
 from util.logging_standards import LogCategory, get_current_sals_logger, get_compat_logger
 
@@ -35,6 +37,10 @@ class DatabaseClient(ABC):
         sals = get_current_sals_logger()
         self.logger = get_compat_logger()
         self.file_handler = ''
+        # Cache of the count requests (see util.response_cache) and plan of a dry run (see plan_papers)
+        self.response_cache = None
+        self.dry_run = False
+        self.plan = None
         
     def get_papers(self, query, syntactic_filters, synonyms, fields, types, dates, start_date, end_date, folder_name, search_date):
         """
@@ -65,6 +71,7 @@ class DatabaseClient(ABC):
         if not self._has_api_access():
             self.logger.info(LogCategory.DATABASE, "base_client", "get_papers", "API key access not provided. Skipping this client...")
             return
+        self._open_response_cache(folder_name, search_date)
             
         # Execute the paper retrieval workflow
         try:
@@ -112,9 +119,76 @@ class DatabaseClient(ABC):
             error_info = get_standard_error_info("unexpected_error")
             ErrorHandler.handle_error(ex, context, error_info, self.logger)
     
+    def plan_papers(self, query, syntactic_filters, synonyms, fields, types, dates, start_date, end_date, folder_name, search_date) -> dict:
+        """
+        Plan the retrieval of a query without retrieving any paper (dry run).
+
+        The planning stage of the client sends its count requests (or reads them from
+        the response cache), and the requests that would retrieve the papers are
+        counted instead of sent.
+
+        Returns:
+            Dictionary with the database, the query name, the status of the plan
+            ('planned', 'over quota', 'retrieved', 'no API access' or 'failed'), the
+            expected papers, the count requests sent and read from the cache, the
+            retrieval requests, the daily quota and the estimated retrieval time in seconds.
+        """
+        query_name = list(query.keys())[0]
+        self.plan = {'database': self.database_name, 'query': query_name, 'status': 'failed', 'expected_papers': 0,
+                     'count_requests': 0, 'cached_requests': 0, 'requests': 0, 'quota': self.quota, 'duration': 0.0}
+        if exists(self._generate_file_name(folder_name, search_date, query_name)):
+            self.plan['status'] = 'retrieved'
+            return self.plan
+        if not self._has_api_access():
+            self.plan['status'] = 'no API access'
+            return self.plan
+        self._open_response_cache(folder_name, search_date)
+        self.dry_run = True
+        try:
+            self._plan_requests(query, syntactic_filters, synonyms, fields, types, dates, start_date, end_date)
+        except Exception as ex:
+            context = create_error_context(
+                "base_client", "plan_papers",
+                ErrorSeverity.WARNING,
+                ErrorCategory.API,
+                f"Error planning the requests of {self.database_name}: {type(ex).__name__}: {str(ex)}"
+            )
+            error_info = get_standard_error_info("unexpected_error")
+            ErrorHandler.handle_error(ex, context, error_info, self.logger)
+        finally:
+            self.dry_run = False
+        # Count requests are read from the response cache when the papers are retrieved
+        self.plan['duration'] = self.plan['requests'] * (self.waiting_time + REQUEST_DELAY)
+        return self.plan
+
+    def _record_plan(self, expected_papers, requests, within_quota: bool = True) -> pd.DataFrame:
+        """Record the retrieval requests of a dry run instead of sending them.
+
+        Returns:
+            Empty DataFrame (no papers are retrieved while planning).
+        """
+        if self.dry_run:
+            self.plan['expected_papers'] = int(expected_papers)
+            self.plan['requests'] = int(requests)
+            self.plan['status'] = 'planned' if within_quota else 'over quota'
+        return pd.DataFrame()
+
+    def _pages(self, expected_papers) -> int:
+        """Number of requests retrieving expected_papers papers."""
+        return -(-max(int(expected_papers), 0) // self.max_papers)
+
     def _generate_file_name(self, folder_name, search_date, query_name):
         """Generate the file name for saving papers."""
         return f'./papers/{folder_name}/{str(search_date).replace("-", "_")}/raw_papers/{query_name.lower().replace(" ", "_")}_{self.database_name}.csv'
+
+    def _open_response_cache(self, folder_name, search_date):
+        """Use the response cache of the search date (disabled when response_cache_hours is 0)."""
+        hours = util.get_performance_parameters()['response_cache_hours']
+        if hours > 0:
+            self.response_cache = ResponseCache(f'./papers/{folder_name}/{str(search_date).replace("-", "_")}/responses/',
+                                                hours * 3600)
+        else:
+            self.response_cache = None
     
     @abstractmethod
     def _has_api_access(self) -> bool:
@@ -175,6 +249,22 @@ class DatabaseClient(ABC):
             return result
         return result
     
+    def _count_request(self, request_func, *args):
+        """Send a count request of the planning stage, or read its response from the response cache."""
+        key = request_key(self.database_name, request_func.__name__, args)
+        if self.response_cache is not None:
+            response = self.response_cache.get(key)
+            if response is not None:
+                if self.dry_run:
+                    self.plan['cached_requests'] += 1
+                return response
+        response = self._retry_request(request_func, *args)
+        if self.dry_run:
+            self.plan['count_requests'] += 1
+        if self.response_cache is not None:
+            self.response_cache.put(key, response)
+        return response
+    
     def _is_successful_response(self, response) -> bool:
         """Check if the API response is successful."""
         if hasattr(response, 'status_code'):
@@ -69,7 +69,7 @@ class CoreClient(DatabaseClient):
         # Create initial request to get total count
         request = self._create_request(parameters, dates, start_date, end_date)
         headers = {'Authorization': 'Bearer ' + self.api_access}
-        raw_papers = self._retry_request(self.client.request, self.api_url, 'post', request, headers)
+        raw_papers = self._count_request(self.client.request, self.api_url, 'post', request, headers)
         expected_papers = self._get_expected_papers(raw_papers)
         
         self.logger.info(LogCategory.DATABASE, "core", "_plan_requests", f"Expected papers from {self.database_name}: {expected_papers}...")
@@ -93,7 +93,7 @@ class CoreClient(DatabaseClient):
                 parameters['query'] = que
                 request = self._create_request(parameters, dates, start_date, end_date)
                 headers = {'Authorization': 'Bearer ' + self.api_access}
-                raw_papers = self._retry_request(self.client.request, self.api_url, 'post', request, headers)
+                raw_papers = self._count_request(self.client.request, self.api_url, 'post', request, headers)
                 expected_papers = self._get_expected_papers(raw_papers)
                 self.logger.info(LogCategory.DATABASE, "core", "_plan_requests", f"Expected papers from {self.database_name} using syntactic filters: {expected_papers}...")
                 times = int(expected_papers / self.max_papers) - 1
@@ -103,10 +103,13 @@ class CoreClient(DatabaseClient):
                 if times >= self.quota:
                     self.logger.info(LogCategory.DATABASE, "core", "_plan_requests", f"The number of expected papers requires {times} requests which exceeds the {self.database_name} quota of {self.quota} requests per day.")
                     self.logger.info(LogCategory.DATABASE, "core", "_plan_requests", "Skipping to next repository. Try to redefine your search queries and syntactic filters. Using dates to limit your search can help in case you are not.")
-                    return pd.DataFrame()
+                    return self._record_plan(expected_papers, self._pages(expected_papers), within_quota=False)
             else:
                 self.logger.info(LogCategory.DATABASE, "core", "_plan_requests", "Skipping to next repository. Please use syntactic filters to avoid this problem. Using dates to limit your search can help in case you are not.")
-                return pd.DataFrame()
+                return self._record_plan(expected_papers, self._pages(expected_papers), within_quota=False)
+        
+        if self.dry_run:
+            return self._record_plan(expected_papers, self._pages(expected_papers))
         
         # Execute requests
         parameters['expected_papers'] = expected_papers
@@ -83,7 +83,7 @@ class ElsevierClient(DatabaseClient):
         while start_year >= start_date.year:
             request = self._create_request(query, parameters, True, start_year, end_year)
             headers = {'X-ELS-APIKey': self.api_access}
-            raw_papers = self._retry_request(self.client.request, request, 'get', {}, headers)
+            raw_papers = self._count_request(self.client.request, request, 'get', {}, headers)
             total_requests = total_requests + 1
             expected_papers_request = self._get_expected_papers(raw_papers)
             if expected_papers_request > 0:
@@ -100,6 +100,8 @@ class ElsevierClient(DatabaseClient):
             
         # Check quota constraints
         if times < self.quota:
+            if self.dry_run:
+                return self._record_plan(expected_papers, self._year_pages(list_years))
             papers = self._execute_requests(query, parameters, list_years)
         else:
             self.logger.info(LogCategory.DATABASE, "elsevier", "_plan_requests", f"The number of expected papers requires {times + total_requests} requests which exceeds the {self.database_name} quota of {self.quota} requests per day.")
@@ -120,7 +122,7 @@ class ElsevierClient(DatabaseClient):
                 while start_year >= start_date.year:
                     request = self._create_request(query, parameters, True, start_year, end_year)
                     headers = {'X-ELS-APIKey': self.api_access}
-                    raw_papers = self._retry_request(self.client.request, request, 'get', {}, headers)
+                    raw_papers = self._count_request(self.client.request, request, 'get', {}, headers)
                     total_requests = total_requests + 1
                     expected_papers_request = self._get_expected_papers(raw_papers)
                     if expected_papers_request > 0:
@@ -135,15 +137,23 @@ class ElsevierClient(DatabaseClient):
                 if mod > 0:
                     times = times + 1
                 if times < self.quota:
+                    if self.dry_run:
+                        return self._record_plan(expected_papers, self._year_pages(list_years))
                     papers = self._execute_requests(query, parameters, list_years)
                 else:
                     self.logger.info(LogCategory.DATABASE, "elsevier", "_plan_requests", f"The number of expected papers requires {times + total_requests} requests which exceeds the {self.database_name} quota of {self.quota} requests per day.")
                     self.logger.info(LogCategory.DATABASE, "elsevier", "_plan_requests", "Skipping to next repository. Try to redefine your search queries and syntactic filters. Using dates to limit your search can help in case you are not.")
+                    self._record_plan(expected_papers, self._year_pages(list_years), within_quota=False)
             else:
                 self.logger.info(LogCategory.DATABASE, "elsevier", "_plan_requests", "Skipping to next repository. Please use syntactic filters to avoid this problem. Using dates to limit your search can help in case you are not.")
+                self._record_plan(expected_papers, self._year_pages(list_years), within_quota=False)
         
         return papers
 
+    def _year_pages(self, list_years):
+        """Number of requests retrieving the papers of every year."""
+        return sum(self._pages(years['expected_papers']) for years in list_years)
+
     def _execute_requests(self, query, parameters, list_years):
         """Execute the planned requests to retrieve papers."""
         current_request = 0
@@ -6,6 +6,7 @@ import json
 import pandas as pd
 from os.path import exists
 from util import util
+from util import query_planner
 from tqdm import tqdm
 import logging
 from util.error_standards import (
@@ -77,17 +78,24 @@ class IeeeXploreClient(DatabaseClient):
         
         # Create initial requests to get total count
         reqs = self._create_request(parameters)
+        self.logger.info(LogCategory.DATABASE, "ieeexplore", "_plan_requests",
+                         f"Planned {len(reqs)} queries ({query_planner.estimate_requests(len(reqs), len(c_fields), len(c_types))} "
+                         f"count requests)")
         total_requests = 0
         planning_requests = 0
+        total_papers = 0
+        page_requests = 0
         
         # Calculate total requests needed
         for req in reqs:
             for field in c_fields:
                 for p_type in c_types:
-                    raw_papers = self._retry_request(self._request, req, field, p_type, 0)
+                    raw_papers = self._count_request(self._request, req, field, p_type, 0)
                     planning_requests = planning_requests + 1
                     total_requests = total_requests + 1
                     expected_papers = self._get_expected_papers(raw_papers)
+                    total_papers = total_papers + expected_papers
+                    page_requests = page_requests + self._pages(expected_papers)
                     times = int(expected_papers / self.max_papers) - 1
                     mod = int(expected_papers) % self.max_papers
                     if mod > 0:
@@ -109,13 +117,17 @@ class IeeeXploreClient(DatabaseClient):
                 
                 # Recalculate with syntactic filters
                 total_requests = 0
+                total_papers = 0
+                page_requests = 0
                 for req in reqs:
                     for field in c_fields:
                         for p_type in c_types:
-                            raw_papers = self._retry_request(self._request, req, field, p_type, 0)
+                            raw_papers = self._count_request(self._request, req, field, p_type, 0)
                             planning_requests = planning_requests + 1
                             total_requests = total_requests + 1
                             expected_papers = self._get_expected_papers(raw_papers)
+                            total_papers = total_papers + expected_papers
+                            page_requests = page_requests + self._pages(expected_papers)
                             times = int(expected_papers / self.max_papers) - 1
                             mod = int(expected_papers) % self.max_papers
                             if mod > 0:
@@ -125,10 +137,13 @@ class IeeeXploreClient(DatabaseClient):
                 if total_requests >= self.quota:
                     self.logger.info(LogCategory.DATABASE, "ieeexplore", "_plan_requests", f"The number of expected papers requires {total_requests} requests which exceeds the {self.database_name} quota of {self.quota} requests per day.")
                     self.logger.info(LogCategory.DATABASE, "ieeexplore", "_plan_requests", "Skipping to next repository. Try to redefine your search queries and syntactic filters.")
-                    return pd.DataFrame()
+                    return self._record_plan(total_papers, page_requests, within_quota=False)
             else:
                 self.logger.info(LogCategory.DATABASE, "ieeexplore", "_plan_requests", "Skipping to next repository. Please use syntactic filters to avoid this problem.")
-                return pd.DataFrame()
+                return self._record_plan(total_papers, page_requests, within_quota=False)
+        
+        if self.dry_run:
+            return self._record_plan(total_papers, page_requests)
         
         # Execute requests
         papers = self._execute_requests(query, parameters, planning_requests)
@@ -150,7 +165,7 @@ class IeeeXploreClient(DatabaseClient):
             for field in fields:
                 for p_type in types:
                     current_request = current_request + 1
-                    raw_papers = self._retry_request(self._request, req, field, p_type, 0)
+                    raw_papers = self._count_request(self._request, req, field, p_type, 0)
                     total_requests = total_requests + 1
                     expected_papers = self._get_expected_papers(raw_papers)
                     times = int(expected_papers / self.max_papers) - 1
@@ -5,6 +5,7 @@ from .apis.generic import Generic
 from .base_client import DatabaseClient
 from os.path import exists
 from util import util
+from util import query_planner
 from tqdm import tqdm
 import logging
 import datetime
@@ -76,17 +77,31 @@ class SemanticScholarClient(DatabaseClient):
         papers = pd.DataFrame()
         requests = self._create_request(parameters, dates, start_date, end_date)
         planned_requests = []
-        self.logger.info(LogCategory.DATABASE, "semantic_scholar", "_plan_requests", "Planning queries...")
-        for request in tqdm(requests):
+        # Papers of every planned request (the first page of each is the response of its count request)
+        planned_totals = []
+        self.logger.info(LogCategory.DATABASE, "semantic_scholar", "_plan_requests",
+                         f"Planning {len(requests)} queries (at least "
+                         f"{query_planner.estimate_requests(len(requests))} count requests)...")
+        pending = list(requests)
+        pbar = tqdm(total=len(pending))
+        while pending:
+            request = pending.pop(0)
+            pbar.update(1)
             req = self.api_url.replace('<query>', request['query']).replace('<offset>', str(self.start)).replace('<max_papers>', str(self.max_papers))
             headers = {}
             if len(self.api_access) > 0:
                 headers = {'x-api-key': self.api_access}
-            raw_papers = self._retry_request(self.client.request, req, 'get', {}, headers)
+            raw_papers = self._count_request(self.client.request, req, 'get', {}, headers)
             papers_request, next_paper, total = self._process_raw_papers(query, raw_papers, False)
             if total > 0:
                 if total < self.offset_limit:
                     planned_requests.append(request['query'])
+                    planned_totals.append(total)
+                elif request['end_year'] > request['initial_year']:
+                    # Too many papers for the whole period: one request per year instead
+                    years = self._year_requests(request['text'], request['initial_year'], request['end_year'])
+                    pending = years + pending
+                    pbar.total += len(years)
                 else:
                     que = ''
                     syntactic_filters = parameters['syntactic_filters']
@@ -97,43 +112,46 @@ class SemanticScholarClient(DatabaseClient):
                         que = que.replace(' <AND>last', '')
                     else:
                         que = parameters['query']
-                    parameters_syn = parameters
+                    parameters_syn = dict(parameters)
                     parameters_syn['query'] = que
                     start_d = datetime.datetime(request['initial_year'], 1, 1)
                     end_d = datetime.datetime(request['end_year'], 1, 1)
                     requests_syn = self._create_request(parameters_syn, dates, start_d, end_d)
+                    request_total = total
                     for request_syn in requests_syn:
                         req = self.api_url.replace('<query>', request_syn['query']).replace('<offset>', str(self.start)).replace(
                             '<max_papers>', str(self.max_papers))
                         headers = {}
                         if len(self.api_access) > 0:
                             headers = {'x-api-key': self.api_access}
-                        raw_papers = self._retry_request(self.client.request, req, 'get', {}, headers)
+                        raw_papers = self._count_request(self.client.request, req, 'get', {}, headers)
                         papers_request, next_paper, total = self._process_raw_papers(query, raw_papers, False)
                         if total > 0:
                             if total < self.offset_limit:
                                 planned_requests.append(request_syn['query'])
+                                planned_totals.append(total)
                             else:
                                 planned_requests.append(request['query'])
+                                planned_totals.append(request_total)
+        pbar.close()
+        if self.dry_run:
+            return self._record_plan(sum(planned_totals), sum(self._pages(min(total, self.offset_limit)) - 1
+                                                              for total in planned_totals))
         papers = self._request_papers(query, planned_requests)
         return papers
     
     def _create_request(self, parameters, dates, start_date, end_date):
-        """Create request parameters for Semantic Scholar."""
+        """Create request parameters for Semantic Scholar, one per planned query for the whole period."""
         queries = []
-        queries_temp = self.client.ieeexplore_query(parameters)
-        for query_temp in queries_temp:
-            query_temp = query_temp.replace('(', '').replace('OR', '+').replace('AND', '+').replace('"', '').replace(')', '') \
-                .replace(' ', '+')
-            query = query_temp + '<dates>'
-            initial_year = start_date.year
-            final_year = end_date.year
-            while initial_year <= final_year:
-                query = query.replace('<dates>', '&year=' + str(initial_year) + '-' + str(initial_year+1))
-                queries.append({'query': query, 'initial_year': initial_year, 'end_year': initial_year+1})
-                query = query_temp + '<dates>'
-                initial_year = initial_year + 1
+        for query_text in self.client.semantic_scholar_query(parameters):
+            queries.append({'query': query_text + '&year=' + str(start_date.year) + '-' + str(end_date.year),
+                            'text': query_text, 'initial_year': start_date.year, 'end_year': end_date.year})
         return queries
+
+    def _year_requests(self, query_text, initial_year, end_year):
+        """Create one request per year of a period."""
+        return [{'query': query_text + '&year=' + str(year), 'text': query_text, 'initial_year': year, 'end_year': year}
+                for year in range(initial_year, end_year + 1)]
     
     def _request_papers(self, query, requests):
         """Request papers from Semantic Scholar API."""
@@ -146,7 +164,7 @@ class SemanticScholarClient(DatabaseClient):
             headers = {}
             if len(self.api_access) > 0:
                 headers = {'x-api-key': self.api_access}
-            raw_papers = self._retry_request(self.client.request, req, 'get', {}, headers)
+            raw_papers = self._count_request(self.client.request, req, 'get', {}, headers)
             papers_request, next_paper, total = self._process_raw_papers(query, raw_papers, True)
             if len(papers) == 0:
                 papers = papers_request
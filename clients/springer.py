@@ -68,7 +68,7 @@ class SpringerClient(DatabaseClient):
         
         # Create initial request to get total count
         request = self._create_request(parameters, dates, start_date, end_date, False)
-        raw_papers = self._retry_request(self.client.request, request, 'get', {}, {})
+        raw_papers = self._count_request(self.client.request, request, 'get', {}, {})
         expected_papers = self._get_expected_papers(raw_papers)
         
         self.logger.info(LogCategory.DATABASE, "springer", "_plan_requests", f"Expected papers from springer: {expected_papers}...")
@@ -85,7 +85,7 @@ class SpringerClient(DatabaseClient):
             if len(syntactic_filters) > 0:
                 self.logger.info(LogCategory.DATABASE, "springer", "_plan_requests", "Trying to reduce the number of requests using syntactic filters.")
                 request = self._create_request(parameters, dates, start_date, end_date, True)
-                raw_papers = self._retry_request(self.client.request, request, 'get', {}, {})
+                raw_papers = self._count_request(self.client.request, request, 'get', {}, {})
                 expected_papers = self._get_expected_papers(raw_papers)
                 self.logger.info(LogCategory.DATABASE, "springer", "_plan_requests", f"Expected papers from {self.database_name} using syntactic filters: {expected_papers}...")
                 times = int(expected_papers / self.max_papers) - 1
@@ -95,10 +95,13 @@ class SpringerClient(DatabaseClient):
                 if times >= self.quota:
                     self.logger.info(LogCategory.DATABASE, "springer", "_plan_requests", f"The number of expected papers requires {times + 1} requests which exceeds the {self.database_name} quota of {self.quota} requests per day.")
                     self.logger.info(LogCategory.DATABASE, "springer", "_plan_requests", "Skipping to next repository. Try to redefine your search queries and syntactic filters. Using dates to limit your search can help in case you are not.")
-                    return pd.DataFrame()
+                    return self._record_plan(expected_papers, self._pages(expected_papers), within_quota=False)
             else:
                 self.logger.info(LogCategory.DATABASE, "springer", "_plan_requests", "Skipping to next repository. Please use syntactic filters to avoid this problem. Using dates to limit your search can help in case you are not.")
-                return pd.DataFrame()
+                return self._record_plan(expected_papers, self._pages(expected_papers), within_quota=False)
+        
+        if self.dry_run:
+            return self._record_plan(expected_papers, self._pages(expected_papers))
         
         # Execute requests
         papers = self._execute_requests(query, parameters, times, dates, start_date, end_date, False)
@@ -7,6 +7,8 @@ standardized error handling and logging patterns.
 """
 
 from util import util
+from util import search_history
+from util.pipeline_cache import PipelineCache
 from util.error_standards import (
     ErrorHandler, create_error_context, ErrorSeverity, ErrorCategory,
     get_standard_error_info
@@ -15,7 +17,9 @@ from util.logging_standards import (
     setup_sals_logger, LogCategory, LogLevel
 )
 from analysis import retrieve
+from analysis import streaming
 from analysis import semantic_analyser
+from analysis import model_registry
 from analysis import manual
 import sys
 import pandas as pd
@@ -151,11 +155,34 @@ def execute_pipeline_step(logger, step: int, operation: str, step_function, *arg
         return None
 
 
-def main(parameters_file: str) -> None:
+def print_plan(logger, plans: pd.DataFrame) -> None:
+    """Print the per-database table of a dry run.
+    
+    Args:
+        logger: Standardized SaLS logger.
+        plans: Plans of every query and database (see retrieve.plan_papers).
+    """
+    summary = retrieve.summarize_plan(plans)
+    logger.info(
+        LogCategory.PIPELINE,
+        "main",
+        "print_plan",
+        "Planned requests per database",
+        extra_info={"plan": summary.to_dict('records')}
+    )
+    print("📋 Planned requests per database (no papers were retrieved):")
+    print(summary.to_string(index=False))
+    print("💡 Durations use the waiting time between the requests of every client. "
+          "Count requests are read from the response cache when the papers are retrieved on the same search date.")
+
+
+def main(parameters_file: str, plan: bool = False) -> None:
     """Main pipeline execution function with standardized error handling.
     
     Args:
         parameters_file: Path to the parameters file.
+        plan: Whether to only plan the requests to the databases (dry run) and print
+            the expected papers, requests, quota usage and duration of every database.
     """
     logger = None
     log_file = None
@@ -252,10 +279,37 @@ def main(parameters_file: str) -> None:
             error_handler.log_and_print(error_msg, print_to_console=True)
             return
         
+        # Dry run: plan the requests to the databases without retrieving papers
+        if plan:
+            plans = execute_pipeline_step(
+                logger, 0, "Planning requests to databases",
+                retrieve.plan_papers,
+                queries, syntactic_filters, synonyms, databases, fields, types,
+                folder_name, dates, start_date, end_date, search_date
+            )
+            if plans is not None:
+                print_plan(logger, plans)
+            return
+        
         # Pipeline execution with standardized error handling
         try:
             step = 0
             next_file = None
+            # Outputs of every step are reused while its inputs and parameters do not change
+            pipeline = PipelineCache('./papers/' + folder_name + '/' + str(search_date).replace('-', '_') + '/',
+                                     util.get_performance_parameters()['step_cache'])
+            
+            # Load the embedding model of the semantic filters while the papers are retrieved
+            if semantic_analyser.uses_bert(semantic_filters) and \
+                    util.get_performance_parameters()['warmup_embedding_model']:
+                model_name = semantic_analyser.get_model_name(semantic_filters)
+                logger.info(
+                    LogCategory.SYSTEM,
+                    "main",
+                    "main",
+                    f"Loading embedding model {model_name} in the background"
+                )
+                model_registry.warmup(model_name)
             
             # Step 0: Retrieve papers
             step = 0
@@ -266,11 +320,23 @@ def main(parameters_file: str) -> None:
                 f"Step {step}: Retrieving papers from databases"
             )
             
-            result = execute_pipeline_step(
+            # In streaming mode, papers are preprocessed and encoded while they are retrieved
+            retrieve_kwargs = {}
+            retrieve_function = retrieve.get_papers
+            if util.get_performance_parameters()['streaming']:
+                retrieve_function = streaming.stream_papers
+                retrieve_kwargs = {'semantic_filters': semantic_filters}
+            result = pipeline.run_step(
+                'retrieve', [],
+                {'queries': queries, 'syntactic_filters': syntactic_filters, 'synonyms': synonyms,
+                 'databases': databases, 'fields': fields, 'types': types, 'dates': dates,
+                 'start_date': start_date, 'end_date': end_date},
+                ['raw_papers'],
+                execute_pipeline_step,
                 logger, step, "Retrieving papers from databases",
-                retrieve.get_papers,
+                retrieve_function,
                 queries, syntactic_filters, synonyms, databases, fields, types, 
-                folder_name, dates, start_date, end_date, search_date
+                folder_name, dates, start_date, end_date, search_date, **retrieve_kwargs
             )
             
             if result is None:
@@ -292,10 +358,18 @@ def main(parameters_file: str) -> None:
                 f"Step {step}: Preprocessing papers"
             )
             
-            file_name = execute_pipeline_step(
+            file_name = pipeline.run_step(
+                'preprocess', ['retrieve'],
+                {'queries': queries, 'databases': databases, 'dates': dates, 'start_date': start_date,
+                 'end_date': end_date, 'deduplication': util.get_deduplication_parameters(),
+                 'language_backend': util.get_performance_parameters()['language_backend']},
+                [f"{step}_preprocessed_papers.csv", f"{step}_preprocessed_papers_terms.npz",
+                 f"{step}_previously_seen_papers.csv", f"{step}_preprocessed_papers_provenance.csv"],
+                execute_pipeline_step,
                 logger, step, "Preprocessing papers",
                 retrieve.preprocess,
-                queries, databases, folder_name, search_date, dates, start_date, end_date, step
+                queries, databases, folder_name, search_date, dates, start_date, end_date, step,
+                reviewed_outputs=[f"{step}_preprocessed_papers.csv"]
             )
             
             if not file_name or file_name == "":
@@ -309,6 +383,7 @@ def main(parameters_file: str) -> None:
                 return
             
             next_file = f"{step}_preprocessed_papers.csv"
+            previous_step = 'preprocess'
             logger.info(
                 LogCategory.FILE,
                 "main",
@@ -326,14 +401,20 @@ def main(parameters_file: str) -> None:
                     f"Step {step}: Semantic filtering by abstract"
                 )
                 
-                file_name = execute_pipeline_step(
+                file_name = pipeline.run_step(
+                    'semantic_filters', ['preprocess'],
+                    semantic_analyser.search_parameters(semantic_filters),
+                    [f"{step}_semantic_filtered_papers.csv"],
+                    execute_pipeline_step,
                     logger, step, "Semantic filtering by abstract",
                     semantic_analyser.search,
-                    semantic_filters, folder_name, next_file, search_date, step
+                    semantic_filters, folder_name, next_file, search_date, step,
+                    reviewed_outputs=[f"{step}_semantic_filtered_papers.csv"]
                 )
                 
                 if file_name and file_name != f"{step-1}_preprocessed_papers.csv":
                     next_file = f"{step}_semantic_filtered_papers.csv"
+                    previous_step = 'semantic_filters'
                     logger.info(
                         LogCategory.FILE,
                         "main",
@@ -359,10 +440,16 @@ def main(parameters_file: str) -> None:
                 f"Step {step}: Manual filtering by abstract"
             )
             
-            result = execute_pipeline_step(
+            # Papers files with the manual decisions on the papers of the run
+            reviewed_files = [next_file]
+            result = pipeline.run_step(
+                'abstract_review', [previous_step], {},
+                [f"{step}_manually_filtered_by_abstract_papers.csv"],
+                execute_pipeline_step,
                 logger, step, "Manual filtering by abstract",
                 manual.manual_filter_by_abstract,
-                folder_name, next_file, search_date, step
+                folder_name, next_file, search_date, step, semantic_filters,
+                kept_outputs=[f"{step}_manually_filtered_by_abstract_papers.csv"]
             )
             
             if result is None:
@@ -376,6 +463,7 @@ def main(parameters_file: str) -> None:
                 return
             
             next_file, removed_papers_abstract = result
+            reviewed_files.append(next_file)
             
             # Step 4: Manual filtering by full text
             step = step + 1
@@ -386,10 +474,14 @@ def main(parameters_file: str) -> None:
                 f"Step {step}: Manual filtering by full text"
             )
             
-            result = execute_pipeline_step(
+            result = pipeline.run_step(
+                'full_text_review', ['abstract_review'], {},
+                [f"{step}_manually_filtered_by_full_text_papers.csv"],
+                execute_pipeline_step,
                 logger, step, "Manual filtering by full text",
                 manual.manual_filter_by_full_text,
-                folder_name, next_file, search_date, step
+                folder_name, next_file, search_date, step,
+                kept_outputs=[f"{step}_manually_filtered_by_full_text_papers.csv"]
             )
             
             if result is None:
@@ -427,10 +519,15 @@ def main(parameters_file: str) -> None:
             
             removed_papers = pd.concat([removed_papers_abstract, removed_papers_full])
             
-            file_name = execute_pipeline_step(
+            file_name = pipeline.run_step(
+                'snowballing', ['abstract_review', 'full_text_review'],
+                {'dates': dates, 'start_date': start_date, 'end_date': end_date, 'semantic_filters': semantic_filters},
+                [f"{step}_snowballing_papers.csv"],
+                execute_pipeline_step,
                 logger, step, "Snowballing process",
                 retrieve.snowballing,
-                folder_name, search_date, step, dates, start_date, end_date, semantic_filters, removed_papers
+                folder_name, search_date, step, dates, start_date, end_date, semantic_filters, removed_papers,
+                reviewed_outputs=[f"{step}_snowballing_papers.csv"]
             )
             
             if file_name:
@@ -461,10 +558,14 @@ def main(parameters_file: str) -> None:
                     f"Step {step}: Manual filtering by abstract for snowballing papers"
                 )
                 
-                result = execute_pipeline_step(
+                result = pipeline.run_step(
+                    'snowballing_abstract_review', ['snowballing'], {},
+                    [f"{step}_manually_filtered_by_abstract_papers.csv"],
+                    execute_pipeline_step,
                     logger, step, "Manual filtering by abstract for snowballing papers",
                     manual.manual_filter_by_abstract,
-                    folder_name, next_file, search_date, step
+                    folder_name, next_file, search_date, step, semantic_filters,
+                    kept_outputs=[f"{step}_manually_filtered_by_abstract_papers.csv"]
                 )
                 
                 if result:
@@ -479,10 +580,14 @@ def main(parameters_file: str) -> None:
                         f"Step {step}: Manual filtering by full text for snowballing papers"
                     )
                     
-                    result = execute_pipeline_step(
+                    result = pipeline.run_step(
+                        'snowballing_full_text_review', ['snowballing_abstract_review'], {},
+                        [f"{step}_manually_filtered_by_full_text_papers.csv"],
+                        execute_pipeline_step,
                         logger, step, "Manual filtering by full text for snowballing papers",
                         manual.manual_filter_by_full_text,
-                        folder_name, next_file, search_date, step
+                        folder_name, next_file, search_date, step,
+                        kept_outputs=[f"{step}_manually_filtered_by_full_text_papers.csv"]
                     )
                     
                     if result:
@@ -501,7 +606,10 @@ def main(parameters_file: str) -> None:
                 f"Step {step}: Merging papers"
             )
             
-            file_name = execute_pipeline_step(
+            file_name = pipeline.run_step(
+                'merge', ['full_text_review'] + (['snowballing_full_text_review'] if merge_step_2 != -1 else []), {},
+                [f"{step}_final_list_papers.csv"],
+                execute_pipeline_step,
                 logger, step, "Merging papers",
                 util.merge_papers,
                 step, merge_step_1, merge_step_2, folder_name, search_date
@@ -518,6 +626,14 @@ def main(parameters_file: str) -> None:
                 print("💡 Pipeline completed but final merge failed. Check output files manually.")
                 return
             
+            # Carry forward decisions of previous runs and record this run (if enabled)
+            if util.get_deduplication_parameters()['cross_run']:
+                execute_pipeline_step(
+                    logger, step, "Updating search history",
+                    search_history.finalize_run,
+                    folder_name, search_date, 1, file_name, reviewed_files
+                )
+            
             # Pipeline completed successfully
             logger.info(
                 LogCategory.PIPELINE,
@@ -561,7 +677,7 @@ def main(parameters_file: str) -> None:
 
 if __name__ == "__main__":
     try:
-        if len(sys.argv) == 2:
+        if len(sys.argv) == 2 or (len(sys.argv) == 3 and sys.argv[2] == '--plan'):
             parameters_file = sys.argv[1]
             
             # Validate parameters file
@@ -569,11 +685,12 @@ if __name__ == "__main__":
                 sys.exit(1)
             
             # Execute main pipeline
-            main(parameters_file)
+            main(parameters_file, plan=len(sys.argv) == 3)
         else:
             print('❌ ERROR: Incorrect number of arguments.')
-            print('💡 Usage: python main.py <parameters_file.yaml>')
+            print('💡 Usage: python main.py <parameters_file.yaml> [--plan]')
             print('📋 Example: python main.py parameters_ar.yaml')
+            print('📋 Plan the requests without retrieving papers: python main.py parameters_ar.yaml --plan')
             sys.exit(1)
             
     except KeyboardInterrupt:
@@ -0,0 +1,724 @@
+#!/usr/bin/env python3
+"""
+Unit tests for SaLS analysis modules.
+
+This module tests the semantic filtering support in analysis/, using small fake
+embedding models instead of downloading SentenceTransformer models.
+"""
+
+import os
+import sys
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# Add the project root to the path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analysis import ann_index
+from analysis import embedding_store
+from analysis import model_registry
+from analysis import semantic_analyser
+from analysis import retrieve
+from analysis import streaming
+from analysis import screening
+from analysis import prioritization
+from analysis import manual
+from util import language
+from util import pipeline_cache
+
+
+class FakeModel:
+    """Bag-of-words embedding model recording the texts it encodes."""
+
+    dimension = 32
+
+    def __init__(self):
+        self.encoded = []
+        self.calls = []
+
+    def encode(self, texts, convert_to_numpy=True, show_progress_bar=False, **kwargs):
+        texts = [texts] if isinstance(texts, str) else list(texts)
+        self.encoded.extend(texts)
+        self.calls.append(kwargs)
+        embeddings = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().replace('[sep]', ' ').split():
+                embeddings[row, sum(map(ord, word)) % self.dimension] += 1.0
+        return embeddings
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    """Use a FakeModel as every embedding model."""
+    model = FakeModel()
+    model_registry.clear()
+    monkeypatch.setattr(model_registry, '_create_model', lambda name: model)
+    yield model
+    model_registry.clear()
+
+
+@pytest.fixture
+def fake_models(monkeypatch):
+    """Replace model loading with a fake loader recording the loaded names."""
+    loaded = []
+    release = threading.Event()
+    release.set()
+
+    def create_model(name):
+        release.wait(5)
+        loaded.append(name)
+        if name == 'missing-model':
+            raise OSError('model not found')
+        return {'name': name}
+
+    model_registry.clear()
+    monkeypatch.setattr(model_registry, '_create_model', create_model)
+    yield loaded, release
+    model_registry.clear()
+
+
+class TestModelRegistry:
+    """Test the process-wide embedding model registry."""
+
+    @pytest.mark.unit
+    def test_model_loaded_once(self, fake_models):
+        """Test that a model is loaded on the first request and shared afterwards."""
+        loaded, _ = fake_models
+
+        first = model_registry.get_model('model-a')
+        second = model_registry.get_model('model-a')
+
+        assert first is second
+        assert loaded == ['model-a']
+        statistics = model_registry.get_load_statistics('model-a')
+        assert statistics['load_seconds'] >= 0
+        assert statistics['background'] is False
+
+    @pytest.mark.unit
+    def test_warmup_shared_with_get_model(self, fake_models):
+        """Test that get_model waits for a background warm-up instead of loading again."""
+        loaded, release = fake_models
+        release.clear()
+
+        future = model_registry.warmup('model-b')
+        assert not model_registry.is_loaded('model-b')
+        release.set()
+        model = model_registry.get_model('model-b')
+
+        assert model is future.result()
+        assert loaded == ['model-b']
+        assert model_registry.get_load_statistics('model-b')['background'] is True
+
+    @pytest.mark.unit
+    def test_failed_load_is_retried(self, fake_models):
+        """Test that a failed load raises and is attempted again on the next request."""
+        loaded, _ = fake_models
+
+        for _ in range(2):
+            with pytest.raises(OSError):
+                model_registry.get_model('missing-model')
+
+        assert loaded == ['missing-model', 'missing-model']
+
+    @pytest.mark.unit
+    def test_model_name_from_semantic_filters(self):
+        """Test that the model is read from the semantic filters."""
+        assert semantic_analyser.get_model_name([{'type': 'bert'}]) == model_registry.DEFAULT_MODEL
+        assert semantic_analyser.get_model_name([{'type': 'bert'}, {'model': 'all-MiniLM-L6-v2'}]) == 'all-MiniLM-L6-v2'
+        assert semantic_analyser.uses_bert([{'type': 'bert'}, {'score': 0.7}])
+        assert not semantic_analyser.uses_bert([{'description': 'edge computing'}])
+
+
+class TestEncodingPool:
+    """Test the encoding of texts in a pool of worker processes."""
+
+    @pytest.mark.unit
+    def test_pool_used_for_large_inputs(self, fake_model, monkeypatch):
+        """Test that texts are sent to the pool of the model when there are several workers."""
+        pools = []
+        monkeypatch.setattr(model_registry, 'get_pool', lambda name, workers: pools.append((name, workers)) or 'pool')
+        texts = [f'paper {i}' for i in range(10)]
+
+        embeddings = embedding_store.encode_texts(texts, 'fake-model', workers=3, batch_size=4)
+        embedding_store.encode_texts(texts[:4], 'fake-model', workers=3, batch_size=4)
+        embedding_store.encode_texts(texts, 'fake-model', workers=1, batch_size=4)
+
+        assert pools == [('fake-model', 3)]
+        assert [call.get('pool') for call in fake_model.calls] == ['pool', None, None]
+        assert all(call['batch_size'] == 4 for call in fake_model.calls)
+        assert embeddings.shape == (10, FakeModel.dimension)
+
+
+class TestEmbeddingStore:
+    """Test the persistent embedding store."""
+
+    @pytest.mark.unit
+    def test_texts_encoded_once(self, fake_model):
+        """Test that stored texts are read from the store instead of encoded again."""
+        texts = ['edge computing', 'fog computing', 'edge computing']
+        with tempfile.TemporaryDirectory() as temp_dir:
+            first = embedding_store.encode(texts, 'fake-model', store_folder=temp_dir)
+            second = embedding_store.encode(texts + ['cloud computing'], 'fake-model', store_folder=temp_dir)
+
+            assert fake_model.encoded == ['edge computing', 'fog computing', 'cloud computing']
+            np.testing.assert_array_equal(first, fake_model.encode(texts))
+            np.testing.assert_array_equal(second[:3], first)
+            assert len(embedding_store.EmbeddingStore(temp_dir, 'fake-model')) == 3
+            assert len(embedding_store.EmbeddingStore(temp_dir, 'other-model')) == 0
+
+    @pytest.mark.unit
+    def test_float16_store_and_interrupted_append(self, fake_model):
+        """Test float16 stores and that rows without a hash are ignored."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            embeddings = embedding_store.encode(['edge computing'], 'fake-model', store_folder=temp_dir, dtype='float16')
+            store = embedding_store.EmbeddingStore(temp_dir, 'fake-model')
+            assert store.dtype == np.float16
+            assert embeddings.dtype == np.float32
+
+            # Vectors written without their hashes (interrupted append)
+            with open(store.vectors_file, 'ab') as f:
+                f.write(np.ones(FakeModel.dimension, dtype=np.float16).tobytes())
+
+            assert len(embedding_store.EmbeddingStore(temp_dir, 'fake-model')) == 1
+            # The next append replaces the rows without a hash
+            second = embedding_store.encode(['fog computing'], 'fake-model', store_folder=temp_dir)
+            store = embedding_store.EmbeddingStore(temp_dir, 'fake-model')
+            assert len(store) == 2
+            np.testing.assert_array_equal(store.get([1]), second)
+
+    @pytest.mark.unit
+    def test_int8_store(self, fake_model):
+        """Test that int8 stores keep the cosine similarities of the embeddings."""
+        rng = np.random.default_rng(0)
+        embeddings = rng.normal(size=(20, FakeModel.dimension)).astype(np.float32)
+        embeddings[3] = 0.0
+        hashes = np.arange(20, dtype=np.int64)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            embedding_store.EmbeddingStore(temp_dir, 'fake-model', dtype='int8').add(hashes, embeddings)
+            store = embedding_store.EmbeddingStore(temp_dir, 'fake-model', dtype='float32')
+
+            assert store.quantized
+            assert os.path.getsize(store.vectors_file) == 20 * FakeModel.dimension
+            stored = store.get(store.lookup(hashes))
+            np.testing.assert_allclose(semantic_analyser.mean_cosine_similarity(stored, embeddings[:1]),
+                                       semantic_analyser.mean_cosine_similarity(embeddings, embeddings[:1]),
+                                       atol=0.01)
+            assert not stored[3].any()
+
+            # Rows without a scale (interrupted append) are ignored
+            with open(store.vectors_file, 'ab') as f:
+                f.write(np.ones(FakeModel.dimension, dtype=np.int8).tobytes())
+            with open(store.hashes_file, 'ab') as f:
+                f.write(np.array([20], dtype=np.int64).tobytes())
+            assert len(embedding_store.EmbeddingStore(temp_dir, 'fake-model')) == 20
+
+    @pytest.mark.unit
+    def test_semantic_filter_rerun_only_encodes_query(self, fake_model, monkeypatch):
+        """Test that changing the description of a semantic filter only encodes the new description."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            monkeypatch.setitem(semantic_analyser.util._performance_parameters, 'embedding_store_folder', temp_dir)
+            papers = ['Edge computing[SEP]Placement of services at the edge', 'Databases[SEP]Query optimization']
+
+            semantic_analyser.encode(papers, [{'type': 'bert'}])
+            semantic_analyser.encode(['edge services'], [{'type': 'bert'}])
+            fake_model.encoded.clear()
+            semantic_analyser.encode(papers, [{'type': 'bert'}])
+            semantic_analyser.encode(['query optimization'], [{'type': 'bert'}])
+
+            assert fake_model.encoded == ['query optimization']
+
+
+def clustered_embeddings(number_rows, clusters=20, dimension=FakeModel.dimension, seed=0):
+    """Embeddings around random directions."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimension)).astype(np.float32)
+    return centers[rng.integers(0, clusters, number_rows)] + 0.3 * rng.normal(size=(number_rows, dimension)).astype(np.float32)
+
+
+class TestANNIndex:
+    """Test the IVF index of the embedding store."""
+
+    @pytest.mark.unit
+    def test_index_built_incrementally_and_persisted(self):
+        """Test that the lists are trained, extended with new rows and read back from disk."""
+        embeddings = clustered_embeddings(3000)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            store = embedding_store.EmbeddingStore(temp_dir, 'fake-model')
+            store.add(np.arange(1500), embeddings[:1500])
+            index = ann_index.IVFIndex(store)
+            index.sync()
+            assert index.trained and len(index.assignments) == 1500
+
+            store.add(np.arange(1500, 3000), embeddings[1500:])
+            index.sync()
+            reopened = ann_index.IVFIndex(embedding_store.EmbeddingStore(temp_dir, 'fake-model'))
+
+            np.testing.assert_array_equal(reopened.centroids, index.centroids)
+            np.testing.assert_array_equal(reopened.assignments, index.assignments)
+            assert len(reopened.assignments) == 3000
+
+    @pytest.mark.unit
+    def test_recall(self):
+        """Test that probing every list is exact and probing a few lists finds most hits."""
+        embeddings = clustered_embeddings(4000)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            store = embedding_store.EmbeddingStore(temp_dir, 'fake-model')
+            store.add(np.arange(len(embeddings)), embeddings)
+            index = ann_index.IVFIndex(store)
+            index.sync()
+            queries = clustered_embeddings(10, seed=0)
+
+            assert index.recall(queries, 0.8, len(index.centroids)) == 1.0
+            assert index.recall(queries, 0.8, 8) > 0.9
+            rows, scores = index.search(queries[0], 0.8, 8)
+            assert len(rows) > 0 and (scores >= 0.8).all()
+
+    @pytest.mark.unit
+    def test_semantic_filter_with_index(self, fake_model, monkeypatch):
+        """Test that the indexed semantic filter finds the exact hits of the probed lists."""
+        words = ['edge', 'cloud', 'placement', 'services', 'latency', 'databases', 'query', 'energy']
+        rng = np.random.default_rng(1)
+        papers = pd.DataFrame({
+            'title': [' '.join(rng.choice(words, 2)) + f' {i}' for i in range(1200)],
+            'abstract': [' '.join(rng.choice(words, 6)) for _ in range(1200)]
+        })
+        with tempfile.TemporaryDirectory() as temp_dir:
+            monkeypatch.setitem(semantic_analyser.util._performance_parameters, 'embedding_store_folder', temp_dir)
+            descriptions, _ = semantic_analyser.get_descriptions([{'description': 'edge services placement'},
+                                                                  {'score': 0.5}])
+            exact = semantic_analyser.filter_chunks([papers.copy()], descriptions, [{'type': 'bert'}])
+            monkeypatch.setitem(semantic_analyser.util._performance_parameters, 'semantic_index_probes', 4)
+            approximate = semantic_analyser.filter_chunks([papers.copy()], descriptions, [{'type': 'bert'}])
+
+            assert 0 < len(approximate) < len(exact)
+            assert set(approximate.index) <= set(exact.index)
+            np.testing.assert_allclose(approximate['semantic_score'], exact.loc[approximate.index, 'semantic_score'],
+                                       rtol=1e-6)
+
+
+class TestRelevantPapers:
+    """Test the semantic comparison of snowballing candidates with the selected papers."""
+
+    @pytest.mark.unit
+    def test_mean_cosine_similarity_matches_similarity_matrix(self):
+        """Test that the scores are the mean of the candidate x selected cosine similarity matrix."""
+        rng = np.random.default_rng(0)
+        candidates = rng.normal(size=(50, 16)).astype(np.float32)
+        references = rng.normal(size=(7, 16)).astype(np.float32)
+        candidates[3] = 0.0
+
+        scores = semantic_analyser.mean_cosine_similarity(candidates, references)
+
+        norms = np.linalg.norm(candidates, axis=1, keepdims=True)
+        similarity = (candidates / np.maximum(norms, 1e-12)) @ (references / np.linalg.norm(references, axis=1, keepdims=True)).T
+        np.testing.assert_allclose(scores, similarity.mean(axis=1), atol=1e-6)
+        assert scores[3] == 0.0
+        assert len(semantic_analyser.mean_cosine_similarity(candidates, references[:0])) == 50
+
+    @pytest.mark.unit
+    def test_relevant_papers_scored_in_batch(self, fake_model, monkeypatch):
+        """Test that candidates are encoded in one batch and filtered by their mean score."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            monkeypatch.setitem(semantic_analyser.util._performance_parameters, 'embedding_store_folder', temp_dir)
+            selected = pd.DataFrame({'title': ['Edge placement'], 'abstract': ['Service placement at the edge']})
+            candidates = pd.DataFrame({
+                'id': [1, 2],
+                'title': ['Edge services', 'Query optimization'],
+                'abstract': ['Placement of services at the edge', 'Cost models of relational databases']
+            }, index=[5, 5])
+
+            found = semantic_analyser.bert_search_relevant_papers([{'type': 'bert'}, {'score': 0.5}], candidates, selected)
+
+            assert list(found['title']) == ['Edge services']
+            assert list(found['id']) == [1]
+            assert len(fake_model.encoded) == 3
+
+
+class TestSemanticFilter:
+    """Test the selection of the papers matching a semantic filter."""
+
+    @pytest.mark.unit
+    def test_step_key_depends_on_scoring_parameters(self, monkeypatch):
+        """Test that changing the dtype of the store or the probed lists runs the semantic filter step again."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            runs = []
+
+            def search():
+                # As the step functions, the papers are only searched when the output file is missing
+                file_name = os.path.join(temp_dir, '2_semantic_filtered_papers.csv')
+                if not os.path.exists(file_name):
+                    runs.append(file_name)
+                    with open(file_name, 'w') as file:
+                        file.write('papers')
+
+            def run_step():
+                pipeline_cache.PipelineCache(temp_dir).run_step(
+                    'semantic_filters', [], semantic_analyser.search_parameters([{'type': 'bert'}]),
+                    ['2_semantic_filtered_papers.csv'], search)
+
+            run_step()
+            run_step()
+            assert len(runs) == 1
+            monkeypatch.setitem(semantic_analyser.util._performance_parameters, 'embedding_store_dtype', 'int8')
+            run_step()
+            assert len(runs) == 2
+            monkeypatch.setitem(semantic_analyser.util._performance_parameters, 'semantic_index_probes', 8)
+            run_step()
+            assert len(runs) == 3
+
+    @pytest.mark.unit
+    def test_select_hits(self):
+        """Test that hits are mapped back by position and selected in descending score order."""
+        papers = pd.DataFrame({'title': ['a', 'b', 'c', 'd']}, index=[10, 11, 11, 12])
+        corpus_ids = [2, 0, 3, 1]
+        hit_scores = [0.9, 0.8, 0.5, 0.2]
+
+        found = semantic_analyser.select_hits(papers, corpus_ids, hit_scores, 0.5)
+
+        assert list(found['title']) == ['c', 'a', 'd']
+        assert list(found['semantic_score']) == [0.9, 0.8, 0.5]
+        assert list(papers['semantic_score']) == [0.8, 0.2, 0.9, 0.5]
+
+    @pytest.mark.unit
+    def test_chunked_filter_matches_single_chunk(self, fake_model, monkeypatch):
+        """Test that filtering papers in small chunks selects the same papers as one chunk."""
+        monkeypatch.setitem(semantic_analyser.util._performance_parameters, 'embedding_store_folder', '')
+        words = ['edge', 'cloud', 'placement', 'services', 'latency', 'databases', 'query', 'energy']
+        rng = np.random.default_rng(0)
+        papers = pd.DataFrame({
+            'title': [' '.join(rng.choice(words, 2)) for _ in range(40)],
+            'abstract': [' '.join(rng.choice(words, 6)) for _ in range(40)]
+        })
+        filters = [{'type': 'bert'}]
+
+        descriptions, _ = semantic_analyser.get_descriptions([{'description': 'edge services placement'}, {'score': 0.3}])
+
+        whole = semantic_analyser.filter_chunks([papers.copy()], descriptions, filters)
+        chunks = [papers.iloc[start:start + 7].copy() for start in range(0, len(papers), 7)]
+        chunked = semantic_analyser.filter_chunks(chunks, descriptions, filters)
+
+        assert 0 < len(chunked) < len(papers)
+        assert list(chunked.index) == list(whole.index)
+        np.testing.assert_allclose(chunked['semantic_score'], whole['semantic_score'], rtol=1e-6)
+        assert (chunked['semantic_score'] >= 0.3).all()
+
+    @pytest.mark.unit
+    def test_named_descriptions(self):
+        """Test that named descriptions are read with their own or the default score."""
+        descriptions, rule = semantic_analyser.get_descriptions([
+            {'type': 'bert'},
+            {'edge computing': 'Papers about edge computing'},
+            {'production ml': {'description': 'Machine learning in production', 'score': 0.8}},
+            {'score': 0.6},
+            {'combine': 'all'}
+        ])
+
+        assert rule == 'all'
+        assert [(d['name'], d['score'], d['column']) for d in descriptions] == [
+            ('edge computing', 0.6, 'semantic_score_edge_computing'),
+            ('production ml', 0.8, 'semantic_score_production_ml')
+        ]
+        single, rule = semantic_analyser.get_descriptions([{'description': 'edge computing'}, {'score': 0.7}])
+        assert rule == 'any'
+        assert single == [{'name': None, 'description': 'edge computing', 'score': 0.7, 'column': None}]
+        with pytest.raises(ValueError):
+            semantic_analyser.get_descriptions([{'description': 'edge computing'}, {'combine': 'most'}])
+
+    @pytest.mark.unit
+    def test_descriptions_scored_in_one_pass(self, fake_model, monkeypatch):
+        """Test that every description has its score column and papers are combined with any/all."""
+        monkeypatch.setitem(semantic_analyser.util._performance_parameters, 'embedding_store_folder', '')
+        papers = pd.DataFrame({
+            'title': ['Edge placement', 'Query optimization', 'Edge query processing'],
+            'abstract': ['placement of services at the edge', 'cost models of databases', 'query processing at the edge']
+        })
+        filters = [{'type': 'bert'}, {'edge': {'description': 'services at the edge', 'score': 0.6}},
+                   {'databases': 'query processing databases'}, {'score': 0.4}]
+        descriptions, _ = semantic_analyser.get_descriptions(filters)
+
+        found_any = semantic_analyser.filter_chunks([papers.copy()], descriptions, filters, 'any')
+        found_all = semantic_analyser.filter_chunks([papers.copy()], descriptions, filters, 'all')
+
+        assert sorted(found_any['title']) == sorted(papers['title'])
+        assert list(found_all['title']) == ['Edge query processing']
+        # The descriptions and papers are encoded once per filter
+        assert len(fake_model.encoded) == 2 * (2 + len(papers))
+        scores = found_any[['semantic_score_edge', 'semantic_score_databases']].values
+        np.testing.assert_allclose(found_any['semantic_score'], scores.max(axis=1))
+
+
+class FakeArxivClient:
+    """Client saving two queries' raw files, with a paper of the first repeated in the second."""
+
+    abstracts = [
+        'We study how services are placed on edge devices to reduce the latency of mobile applications.',
+        'This paper presents a method that schedules deep learning jobs in shared clusters of graphics cards.',
+        'We propose an index for time series databases that answers range queries with fewer disk reads.',
+    ]
+
+    def get_papers(self, query, syntactic_filters, synonyms, fields, types, dates, start_date, end_date,
+                   folder_name, search_date):
+        query_name = list(query.keys())[0]
+        file_name = streaming.raw_file_name(folder_name, search_date, query_name, 'arxiv')
+        rows = range(2) if query_name == 'first' else range(1, 3)
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        pd.DataFrame({
+            'id': [f'http://arxiv.org/abs/{row}' for row in rows], 'published': ['2023-01-01'] * len(rows),
+            'database': ['arxiv'] * len(rows), 'query_name': [query_name] * len(rows),
+            'query_value': [query[query_name]] * len(rows), 'title': [f'Paper {row}' for row in rows],
+            'summary': [self.abstracts[row] for row in rows],
+        }).to_csv(file_name, index=False)
+
+
+class TestStreaming:
+    """Test cases for the streaming retrieval."""
+
+    @pytest.mark.unit
+    def test_streamed_papers_found_in_caches(self, fake_model, monkeypatch):
+        """Test that preprocessing and the semantic filter reuse the work done while streaming."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            monkeypatch.chdir(temp_dir)
+            monkeypatch.setitem(retrieve.DATABASE_CLIENTS, 'arxiv', FakeArxivClient)
+            monkeypatch.setitem(semantic_analyser.util._performance_parameters, 'embedding_store_folder', 'embeddings')
+            monkeypatch.setitem(semantic_analyser.util._performance_parameters, 'language_cache_file', 'verdicts.csv')
+            queries = [{'first': 'edge'}, {'second': 'clusters'}]
+
+            streaming.stream_papers(queries, [], {}, ['arxiv'], [], [], 'survey', False, None, None, '2024-01-01',
+                                    semantic_filters=[{'type': 'bert'}], queue_size=1)
+            # The repeated paper is encoded once
+            assert len(fake_model.encoded) == 3
+
+            fake_model.encoded.clear()
+            detected = []
+            identify = language.NgramLanguageIdentifier.identify
+            monkeypatch.setattr(language.NgramLanguageIdentifier, 'identify',
+                                lambda self, texts, **kwargs: detected.extend(texts) or identify(self, texts, **kwargs))
+            file_name = retrieve.preprocess(queries, ['arxiv'], 'survey', '2024-01-01', False, None, None, 1)
+            papers = pd.read_csv(file_name)
+            semantic_analyser.encode((papers['title'] + '[SEP]' + papers['abstract']).values, [{'type': 'bert'}])
+
+            assert len(papers) == 3
+            assert detected == []
+            assert fake_model.encoded == []
+
+
+class TestPreprocess:
+    """Test cases for the preprocessing of the raw files."""
+
+    @pytest.mark.unit
+    def test_repeated_papers_provenance(self, monkeypatch):
+        """Test that the removed repeated papers are saved next to the preprocessed papers with the kept ones."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            monkeypatch.chdir(temp_dir)
+            queries = [{'first': 'edge'}, {'second': 'clusters'}]
+            for query in queries:
+                FakeArxivClient().get_papers(query, [], {}, [], [], False, None, None, 'survey', '2024-01-01')
+
+            file_name = retrieve.preprocess(queries, ['arxiv'], 'survey', '2024-01-01', False, None, None, 1)
+            provenance = pd.read_csv(file_name.replace('.csv', '_provenance.csv'))
+
+            assert len(pd.read_csv(file_name)) == 3
+            assert len(provenance) == 1
+            removed = provenance.iloc[0]
+            assert (removed['database'], removed['query_name'], removed['title']) == ('arxiv', 'second', 'Paper 1')
+            assert (removed['kept_database'], removed['kept_query_name'], removed['kept_title']) == \
+                ('arxiv', 'first', 'Paper 1')
+            assert removed['matched_on'] == 'doi'
+
+    @pytest.mark.unit
+    def test_parallel_matches_sequential(self, monkeypatch):
+        """Test that mapping the raw files in a process pool gives the same papers and reports failed files."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            monkeypatch.chdir(temp_dir)
+            failed = []
+            monkeypatch.setattr(retrieve, '_handle_raw_file_error',
+                                lambda ex, file_name, database: failed.append((os.path.basename(file_name), type(ex))))
+            queries = [{'first': 'edge'}, {'broken': 'edge'}, {'second': 'clusters'}]
+            outputs = []
+            for search_date, workers in [('2024-01-01', 1), ('2024-02-01', 2)]:
+                for query in [queries[0], queries[2]]:
+                    FakeArxivClient().get_papers(query, [], {}, [], [], False, None, None, 'survey', search_date)
+                # An empty raw file, e.g. left by an interrupted request
+                open(streaming.raw_file_name('survey', search_date, 'broken', 'arxiv'), 'w').close()
+                file_name = retrieve.preprocess(queries, ['arxiv'], 'survey', search_date, False, None, None, 1,
+                                                workers=workers)
+                outputs.append(pd.read_csv(file_name))
+
+            pd.testing.assert_frame_equal(outputs[0], outputs[1])
+            assert len(outputs[0]) == 3
+            assert failed == [('broken_arxiv.csv', pd.errors.EmptyDataError)] * 2
+
+
+def screening_papers(statuses):
+    return pd.DataFrame({
+        'id': range(1, len(statuses) + 1), 'status': statuses, 'doi': [f'10.1/{i}' for i in range(len(statuses))],
+        'publisher': 'arxiv', 'database': 'arxiv', 'query_name': 'q', 'query_value': 'edge', 'url': 'url',
+        'publication_date': '2023-01-01', 'title': [f'paper {i}' for i in range(len(statuses))],
+        'abstract': [f'abstract of paper {i}' for i in range(len(statuses))],
+    })
+
+
+class TestScreening:
+    """Test cases for the screening sessions of the manual review."""
+
+    @pytest.mark.unit
+    def test_decisions_saved_in_background(self):
+        """Test that every decision reaches the papers file and included papers the step file."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            papers_file = os.path.join(temp_dir, 'papers.csv')
+            decisions_file = os.path.join(temp_dir, 'decisions.csv')
+            reviewed = []
+            with screening.ScreeningSession(screening_papers(['included', 'unknown', 'unknown', 'unknown', 'unknown']),
+                                            papers_file, decisions_file, 'unknown', prefetch=2, seed=0) as session:
+                candidate = session.next()
+                while candidate is not None:
+                    reviewed.append(int(candidate.paper['id'].iloc[0]))
+                    session.decide(candidate, 'included' if len(reviewed) % 2 else 'not included')
+                    candidate = session.next()
+
+            assert sorted(reviewed) == [2, 3, 4, 5]
+            assert session.counts['included'] == 3 and session.pending == 0
+            saved = pd.read_csv(papers_file).set_index('id')['status']
+            assert saved[reviewed].tolist() == ['included', 'not included', 'included', 'not included']
+            decisions = pd.read_csv(decisions_file)
+            assert decisions['id'].tolist() == [2, 3]
+            assert decisions['doi'].tolist() == [f'10.1/{reviewed[0] - 1}', f'10.1/{reviewed[2] - 1}']
+            assert (decisions['status'] == 'unknown').all()
+
+    @pytest.mark.unit
+    def test_manual_filter_by_full_text(self, monkeypatch):
+        """Test the full text review with the answers of the reviewer."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            monkeypatch.chdir(temp_dir)
+            os.makedirs('papers/survey/2024_01_01')
+            screening_papers(['unknown'] * 3).to_csv('papers/survey/2024_01_01/3_papers.csv', index=False)
+            answers = iter(['1', '0', '1'])
+            monkeypatch.setattr('builtins.input', lambda prompt='': next(answers))
+
+            next_file, removed = manual.manual_filter_by_full_text('survey', '3_papers.csv', '2024-01-01', 4)
+
+            assert next_file == '4_manually_filtered_by_full_text_papers.csv'
+            assert len(removed) == 1
+            included = pd.read_csv('papers/survey/2024_01_01/' + next_file)
+            assert included['id'].tolist() == [1, 2]
+            assert (included['status'] == 'included').all()
+
+    @pytest.mark.unit
+    def test_near_duplicates_keep_inclusion(self, monkeypatch):
+        """Test that merging near duplicates with conflicting decisions keeps the included one."""
+        monkeypatch.setitem(manual.util._deduplication_parameters, 'near_duplicate_threshold', 0.7)
+        abstract = ('We propose a deep neural network that classifies images of cats with high accuracy '
+                    'by combining convolutional layers with a large labelled data set of pet photos.')
+        for statuses in [['not included', 'included', 'unknown'], ['included', 'not included', 'unknown']]:
+            papers = screening_papers(statuses)
+            papers['doi'] = None
+            papers['title'] = ['Deep learning for cats', 'Deep Learning for Cats', 'Quantum chemistry']
+            papers['abstract'] = [abstract, abstract.replace('We propose', 'This paper presents'),
+                                  'An unrelated abstract about the simulation of small molecules.']
+
+            merged = manual.merge_near_duplicate_papers(papers)
+
+            assert list(merged['status']) == ['included', 'unknown']
+
+    @pytest.mark.unit
+    def test_failing_prioritizer(self):
+        """Test that the review continues in random order when the prioritizer fails to rank the papers."""
+        class FailingPrioritizer:
+            def needs_training(self, decisions):
+                return False
+
+            def rank(self, positions):
+                raise ValueError('rank failed')
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            papers_file = os.path.join(temp_dir, 'papers.csv')
+            reviewed = []
+            with screening.ScreeningSession(screening_papers(['unknown'] * 4), papers_file,
+                                            os.path.join(temp_dir, 'decisions.csv'), prefetch=2, seed=0,
+                                            prioritizer=FailingPrioritizer()) as session:
+                candidate = session.next()
+                while candidate is not None:
+                    reviewed.append(candidate.position)
+                    session.decide(candidate, 'not included')
+                    candidate = session.next()
+
+            assert sorted(reviewed) == [0, 1, 2, 3]
+            assert session.prioritizer is None
+
+    @pytest.mark.unit
+    def test_failed_prefetching_stops_review(self):
+        """Test that next() returns None instead of waiting forever when the candidates cannot be prepared."""
+        class InvalidPrioritizer:
+            def needs_training(self, decisions):
+                return False
+
+            def rank(self, positions):
+                return np.array([len(positions) + 10])
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with screening.ScreeningSession(screening_papers(['unknown'] * 3), os.path.join(temp_dir, 'papers.csv'),
+                                            os.path.join(temp_dir, 'decisions.csv'), prefetch=1, seed=0,
+                                            prioritizer=InvalidPrioritizer()) as session:
+                assert session.next() is None
+                assert session.pending == 3
+
+
+def review_papers(number_papers=300, relevant=20, seed=0):
+    """Papers on random topics, the relevant ones about edge computing."""
+    rng = np.random.default_rng(seed)
+    words = [f'word{i}' for i in range(500)]
+    topic = ['edge', 'computing', 'latency', 'offloading', 'devices', 'placement']
+    abstracts = []
+    for paper in range(number_papers):
+        text = list(rng.choice(words, 30))
+        if paper < relevant:
+            text += list(rng.choice(topic, 4))
+        abstracts.append(' '.join(rng.permutation(text)))
+    order = rng.permutation(number_papers)
+    papers = pd.DataFrame({'id': range(1, number_papers + 1), 'status': 'unknown',
+                           'title': [f'paper {i}' for i in order], 'abstract': [abstracts[i] for i in order]})
+    return papers, order < relevant
+
+
+class TestPrioritization:
+    """Test cases for the active learning prioritization of the manual review."""
+
+    @pytest.mark.unit
+    def test_relevant_papers_reviewed_first(self):
+        """Test that relevant papers are found earlier than in random order and the estimate drops."""
+        papers, relevant = review_papers()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            prioritizer = prioritization.ScreeningPrioritizer(prioritization.tfidf(papers['abstract']), 'relevance',
+                                                              retrain_every=5, seed=0)
+            found = []
+            estimates = []
+            with screening.ScreeningSession(papers, os.path.join(temp_dir, 'papers.csv'),
+                                            os.path.join(temp_dir, 'decisions.csv'), prefetch=2, seed=0,
+                                            prioritizer=prioritizer) as session:
+                for _ in range(100):
+                    candidate = session.next()
+                    found.append(relevant[candidate.position])
+                    session.decide(candidate, 'included' if found[-1] else 'not included')
+                    estimates.append(session.remaining_relevant())
+
+        # 20 relevant papers out of 300: about 7 in the first 100 papers in random order
+        assert sum(found) >= 18
+        assert estimates[-1] is not None and estimates[-1] < 5
+
+    @pytest.mark.unit
+    def test_embeddings_of_semantic_filter_used(self, fake_model, monkeypatch):
+        """Test that the stored embeddings are the features when the semantic filter encoded all the papers."""
+        papers, _ = review_papers(number_papers=10, relevant=2)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            monkeypatch.setitem(semantic_analyser.util._performance_parameters, 'embedding_store_folder', temp_dir)
+            _, kind = prioritization.screening_features(papers, [{'type': 'bert'}])
+            assert kind == 'tf-idf'
+
+            semantic_analyser.encode((papers['title'] + '[SEP]' + papers['abstract']).values, [{'type': 'bert'}])
+            features, kind = prioritization.screening_features(papers, [{'type': 'bert'}])
+            assert kind == 'embeddings'
+            assert features.shape == (10, FakeModel.dimension)
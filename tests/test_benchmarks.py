@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for SaLS data processing.
+
+These tests run on large synthetic data sets and report their timings. They are
+skipped unless the SALS_BENCHMARKS environment variable is set:
+
+    SALS_BENCHMARKS=1 python -m pytest tests/test_benchmarks.py -s
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# Add the project root to the path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analysis import model_registry
+from analysis import semantic_analyser
+from util import near_duplicates
+
+benchmark = pytest.mark.skipif(not os.environ.get('SALS_BENCHMARKS'), reason='Set SALS_BENCHMARKS=1 to run benchmarks')
+
+
+def synthetic_abstracts(number_papers, number_words=150, vocabulary_size=20000, seed=0):
+    """Random abstracts as an array of word indices."""
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, vocabulary_size, (number_papers, number_words))
+
+
+def to_texts(words):
+    vocabulary = np.array([f'word{i}' for i in range(words.max() + 1)])
+    return [' '.join(vocabulary[row]) for row in words]
+
+
+class TestNearDuplicatesBenchmark:
+    """Benchmark of MinHash/LSH near-duplicate detection."""
+
+    @pytest.mark.slow
+    @benchmark
+    def test_near_duplicates_100k(self):
+        """Cluster 100k papers where 10k are edited copies of other papers."""
+        number_papers, number_duplicates = 100000, 10000
+        rng = np.random.default_rng(1)
+        words = synthetic_abstracts(number_papers - number_duplicates)
+        sources = rng.integers(0, len(words), number_duplicates)
+        copies = words[sources].copy()
+        # Replace 3 of the 150 words of every copy
+        for row in copies:
+            row[rng.choice(row.size, 3, replace=False)] = rng.integers(0, 20000, 3)
+        papers = pd.DataFrame({
+            'doi': None,
+            'title': 'title',
+            'abstract': to_texts(np.vstack([words, copies]))
+        })
+
+        start = time.perf_counter()
+        clusters, similarity = near_duplicates.find_near_duplicates(papers, threshold=0.8)
+        elapsed = time.perf_counter() - start
+
+        copies_positions = np.arange(number_papers - number_duplicates, number_papers)
+        recall = np.mean(clusters[copies_positions] == clusters[sources])
+        number_clusters = len(np.unique(clusters))
+        print(f"\nNear duplicates of 100k papers: {elapsed:.1f}s, recall {recall:.3f}, "
+              f"{number_clusters} clusters (expected {number_papers - number_duplicates})")
+        assert recall > 0.9
+        # No distinct papers are merged together
+        assert number_clusters >= number_papers - number_duplicates
+
+
+class TestImportTimeBenchmark:
+    """Benchmark of the start-up time of the pipeline."""
+
+    @pytest.mark.slow
+    @benchmark
+    def test_main_import_time(self):
+        """Import main.py in a fresh interpreter; heavy dependencies are loaded lazily."""
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        timings = []
+        for _ in range(3):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-c', 'import main'], cwd=root, check=True)
+            timings.append(time.perf_counter() - start)
+        baseline_start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'import pandas'], check=True)
+        baseline = time.perf_counter() - baseline_start
+        print(f"\nImport of main.py: {min(timings):.2f}s (pandas alone: {baseline:.2f}s)")
+        # Importing spaCy or sentence-transformers alone takes several seconds
+        assert min(timings) < baseline + 2.0
+
+
+def legacy_select_hits(papers, papers_array, corpus_ids, hit_scores, score):
+    """Selection of the semantic filter hits with one boolean mask per hit (previous implementation)."""
+    found_papers = pd.DataFrame()
+    for corpus_id, hit_score in zip(corpus_ids, hit_scores):
+        if hit_score >= score:
+            paper_array = papers_array[corpus_id]
+            papers.loc[papers['concatenated'] == paper_array, 'semantic_score'] = hit_score
+            if len(found_papers) == 0:
+                found_papers = papers[papers['concatenated'] == paper_array]
+            else:
+                found_papers = pd.concat([found_papers, papers[papers['concatenated'] == paper_array]])
+    return found_papers
+
+
+class TestSemanticFilterBenchmark:
+    """Benchmark of the selection of the papers matching a semantic filter."""
+
+    @pytest.mark.slow
+    @benchmark
+    @pytest.mark.parametrize('number_papers', [10000, 50000])
+    def test_select_hits(self, number_papers):
+        """Compare the vectorized selection with the per-hit boolean masks."""
+        rng = np.random.default_rng(2)
+        papers = pd.DataFrame({'concatenated': to_texts(synthetic_abstracts(number_papers, number_words=20))})
+        papers['semantic_score'] = 0.0
+        hit_scores = np.sort(rng.random(number_papers))[::-1]
+        corpus_ids = rng.permutation(number_papers)
+        score = 0.5
+
+        start = time.perf_counter()
+        found = semantic_analyser.select_hits(papers.copy(), corpus_ids, hit_scores, score)
+        vectorized = time.perf_counter() - start
+
+        # The previous implementation is quadratic: time a sample of hits and extrapolate
+        sample = 200
+        start = time.perf_counter()
+        legacy_found = legacy_select_hits(papers.copy(), papers['concatenated'].values, corpus_ids[:sample],
+                                          hit_scores[:sample], score)
+        legacy = (time.perf_counter() - start) / sample * len(found)
+
+        print(f"\nSelection of {len(found)} of {number_papers} papers: {vectorized * 1000:.1f} ms vectorized, "
+              f"about {legacy:.1f} s with per-hit masks ({legacy / vectorized:.0f}x)")
+        assert list(legacy_found.index) == list(found.index[:sample])
+        np.testing.assert_allclose(legacy_found['semantic_score'], found['semantic_score'].iloc[:sample])
+
+
+class RandomEmbeddingModel:
+    """Embedding model returning random 768-dimensional embeddings (the size of SPECTER's)."""
+
+    def __init__(self):
+        self.rng = np.random.default_rng(3)
+
+    def encode(self, texts, convert_to_numpy=True, show_progress_bar=False, **kwargs):
+        return self.rng.standard_normal((len(texts), 768), dtype=np.float32)
+
+
+class TestChunkedSemanticFilterBenchmark:
+    """Benchmark of the peak memory of the semantic filter."""
+
+    @pytest.mark.slow
+    @benchmark
+    def test_chunked_semantic_filter_memory(self, monkeypatch):
+        """Compare the peak memory of filtering 100k papers in chunks and in one chunk."""
+        model_registry.clear()
+        monkeypatch.setattr(model_registry, '_create_model', lambda name: RandomEmbeddingModel())
+        monkeypatch.setitem(semantic_analyser.util._performance_parameters, 'embedding_store_folder', '')
+        number_papers = 100000
+        texts = to_texts(synthetic_abstracts(number_papers, number_words=30))
+        filters = [{'type': 'bert'}]
+        with tempfile.TemporaryDirectory() as temp_dir:
+            papers_file = os.path.join(temp_dir, 'papers.csv')
+            pd.DataFrame({'title': 'title', 'abstract': texts}).to_csv(papers_file, index=False)
+            del texts
+
+            peaks = {}
+            for chunk_size in [4096, number_papers]:
+                tracemalloc.start()
+                start = time.perf_counter()
+                found = semantic_analyser.filter_chunks(pd.read_csv(papers_file, chunksize=chunk_size),
+                                                        'edge computing', 0.1, filters)
+                seconds = time.perf_counter() - start
+                peaks[chunk_size] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+                tracemalloc.stop()
+                print(f"\nSemantic filter of {number_papers} papers in chunks of {chunk_size}: "
+                      f"{len(found)} found, peak {peaks[chunk_size]:.0f} MB, {seconds:.1f}s")
+        model_registry.clear()
+        # The embeddings of 100k papers alone take 300 MB
+        assert peaks[4096] < peaks[number_papers] / 4
+
+
+def synthetic_embeddings(number_papers, dimension=768, topics=50, noise=1.0, seed=4):
+    """Embeddings with a shared component and topic structure, like those of a survey corpus."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((topics, dimension)).astype(np.float32)
+    shared = rng.standard_normal(dimension).astype(np.float32) * 2
+    return (shared + centers[rng.integers(0, topics, number_papers)]
+            + noise * rng.standard_normal((number_papers, dimension)).astype(np.float32))
+
+
+class TestReducedPrecisionBenchmark:
+    """Benchmark of the embedding store data types."""
+
+    @pytest.mark.slow
+    @benchmark
+    def test_reduced_precision_scores(self):
+        """Compare the scores, size and scoring time of float16 and int8 stores with float32."""
+        from analysis import embedding_store
+
+        number_papers = 50000
+        embeddings = synthetic_embeddings(number_papers + 20)
+        papers, queries = embeddings[:number_papers], embeddings[number_papers:]
+        hashes = np.arange(number_papers, dtype=np.int64)
+        queries = semantic_analyser._normalize(queries)
+        scores = {}
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for dtype in embedding_store.SUPPORTED_DTYPES:
+                embedding_store.EmbeddingStore(temp_dir, dtype, dtype=dtype).add(hashes, papers)
+                store = embedding_store.EmbeddingStore(temp_dir, dtype)
+                size = sum(os.path.getsize(file_name) for file_name in [store.vectors_file, store.scales_file]
+                           if os.path.exists(file_name)) / 2 ** 20
+                start = time.perf_counter()
+                scores[dtype] = semantic_analyser._normalize(store.get(np.arange(number_papers))) @ queries.T
+                seconds = time.perf_counter() - start
+                deviation = np.abs(scores[dtype] - scores['float32'])
+                changed = ((scores[dtype] >= 0.7) != (scores['float32'] >= 0.7)).sum()
+                print(f"\n{dtype}: {size:.0f} MB, scoring {number_papers} papers against {len(queries)} "
+                      f"descriptions in {seconds * 1000:.0f} ms, score deviation max {deviation.max():.5f} "
+                      f"mean {deviation.mean():.6f}, {changed} of {deviation.size} selections changed at 0.7")
+                assert deviation.max() < 0.01
+
+
+class TestANNIndexBenchmark:
+    """Benchmark of the IVF index of the embedding store."""
+
+    @pytest.mark.slow
+    @benchmark
+    def test_ivf_recall_and_speed(self):
+        """Compare the search time and recall of the IVF index with an exact search of 200k embeddings."""
+        from analysis import ann_index
+        from analysis import embedding_store
+
+        number_papers = 200000
+        embeddings = synthetic_embeddings(number_papers + 5, topics=2000, noise=1.4)
+        papers, queries = embeddings[:number_papers], embeddings[number_papers:]
+        # Score of the 0.02% most similar papers of every query (about half of its topic)
+        score = np.quantile(semantic_analyser._normalize(papers) @ semantic_analyser._normalize(queries).T, 0.9998)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            store = embedding_store.EmbeddingStore(temp_dir, 'synthetic', dtype='float16')
+            store.add(np.arange(number_papers, dtype=np.int64), papers)
+            index = ann_index.IVFIndex(store)
+            start = time.perf_counter()
+            index.sync()
+            print(f"\nTraining {len(index.centroids)} lists on {number_papers} embeddings: "
+                  f"{time.perf_counter() - start:.1f}s")
+            recalls = {}
+            for probes in [0, 8, 32, 128]:
+                start = time.perf_counter()
+                for query in queries:
+                    index.search(query, score, probes)
+                seconds = (time.perf_counter() - start) / len(queries)
+                recalls[probes] = index.recall(queries, score, probes) if probes else 1.0
+                print(f"{probes or 'all'} lists probed: {seconds * 1000:.0f} ms per query, recall {recalls[probes]:.3f}")
+            assert recalls[128] > 0.9
+
+
+def plural_lemma(word):
+    """Stand-in for the WordNet lemmatizer (which needs the WordNet corpus)."""
+    return word[:-1] if word.endswith('s') else word
+
+
+def legacy_keyword_filter(abstracts, keyword_terms, lemmatize=plural_lemma):
+    """Keyword filter lemmatizing every word and scanning with one regex per keyword (previous implementation)."""
+    lowered = abstracts.str.replace('-', ' ').str.lower().str.replace('\n', ' ')
+    lowered = lowered.apply(lambda text: ' '.join(lemmatize(word) for word in text.split()))
+    for terms in keyword_terms.values():
+        pattern = '|'.join(r'\b' + lemmatize(term.lower()) + r'\b' for term in terms)
+        lowered = lowered[lowered.str.contains(pattern, na=False)]
+    return abstracts.index.isin(lowered.index)
+
+
+class TestKeywordMatcherBenchmark:
+    """Benchmark of the syntactic filter matcher."""
+
+    @pytest.mark.slow
+    @benchmark
+    def test_keyword_matcher_30k(self):
+        """Compare the n-gram matcher with lemmatization and per-keyword regex scans on 30k abstracts."""
+        from util import keyword_matcher
+
+        abstracts = pd.Series(to_texts(synthetic_abstracts(30000, vocabulary_size=5000)))
+        terms = {f'keyword {k}': [f'word{k * 7 + s}' for s in range(6)] + [f'word{k} word{k + 1}'] for k in range(10)}
+
+        start = time.perf_counter()
+        legacy = legacy_keyword_filter(abstracts, terms)
+        legacy_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        hits = keyword_matcher.KeywordMatcher(terms, lemmatize=lru_cache(maxsize=None)(plural_lemma)).match(abstracts)
+        seconds = time.perf_counter() - start
+
+        print(f"\nKeyword filter of {len(abstracts)} abstracts with {len(terms)} keywords: "
+              f"{seconds:.2f}s with the matcher (hit bitmap of all keywords), {legacy_seconds:.2f}s with regex scans")
+        np.testing.assert_array_equal(hits.all(axis=1), legacy)
+
+
+class TestTermIndexBenchmark:
+    """Benchmark of re-filtering papers with the term index."""
+
+    @pytest.mark.slow
+    @benchmark
+    def test_term_index_30k(self):
+        """Compare filtering 30k abstracts with the term index and with the keyword matcher."""
+        from util import keyword_matcher, term_index
+
+        abstracts = pd.Series(to_texts(synthetic_abstracts(30000, vocabulary_size=5000)))
+        terms = {f'keyword {k}': [f'word{k * 7 + s}' for s in range(6)] + [f'word{k} word{k + 1}'] for k in range(3)}
+        keywords = list(terms)
+        synonyms = {keyword: keyword_terms[1:] for keyword, keyword_terms in terms.items()}
+        terms = {keyword: [keyword] + keyword_terms[1:] for keyword, keyword_terms in terms.items()}
+        lemmatize = lru_cache(maxsize=None)(plural_lemma)
+
+        start = time.perf_counter()
+        index = term_index.TermIndex.build(abstracts, lemmatize=lemmatize)
+        build_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        rows = index.filter(keywords, synonyms)
+        query_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        hits = keyword_matcher.KeywordMatcher(terms, lemmatize=lemmatize).match(abstracts)
+        matcher_seconds = time.perf_counter() - start
+
+        print(f"\nKeyword filter of {len(abstracts)} abstracts: {query_seconds * 1000:.1f}ms with the term index "
+              f"(built in {build_seconds:.2f}s, {len(index.postings)} postings), {matcher_seconds:.2f}s with the matcher")
+        np.testing.assert_array_equal(rows, np.flatnonzero(hits.all(axis=1)))
+        assert query_seconds < matcher_seconds
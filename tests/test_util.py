@@ -7,9 +7,11 @@ configuration validation, file operations, and data processing functions.
 """
 
 import pytest
+import numpy as np
 import pandas as pd
 import tempfile
 import os
+import subprocess
 import sys
 from datetime import datetime
 from unittest.mock import patch, MagicMock
@@ -18,6 +20,16 @@ from unittest.mock import patch, MagicMock
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from util import util
+from util import boolean_query
+from util import dedup
+from util import keyword_matcher
+from util import language
+from util import lazy_imports
+from util import near_duplicates
+from util import pipeline_cache
+from util import query_planner
+from util import search_history
+from util import term_index
 
 
 class TestConfigurationValidation:
@@ -160,6 +172,31 @@ class TestConfigurationFallbacks:
         assert updated_config['folder_name'] == 'test'
 
 
+class TestPerformanceParameters:
+    """Test extraction of the optional performance section."""
+    
+    @pytest.mark.unit
+    @pytest.mark.config
+    def test_extract_performance_parameters_defaults(self):
+        """Test that a missing performance section yields the defaults."""
+        performance = util._extract_performance_parameters({'queries': [{'test': 'test'}]})
+        
+        assert performance == util.DEFAULT_PERFORMANCE_PARAMETERS
+    
+    @pytest.mark.unit
+    @pytest.mark.config
+    def test_extract_performance_parameters_invalid_values(self):
+        """Test that valid values are converted and invalid or unknown ones are ignored."""
+        performance = util._extract_performance_parameters({'performance': {'preprocess_workers': '4', 'unknown': 1}})
+        
+        assert performance['preprocess_workers'] == 4
+        assert 'unknown' not in performance
+        
+        performance = util._extract_performance_parameters({'performance': {'preprocess_workers': 'many'}})
+        
+        assert performance['preprocess_workers'] == util.DEFAULT_PERFORMANCE_PARAMETERS['preprocess_workers']
+
+
 class TestQueryProcessing:
     """Test query processing and normalization functions."""
     
@@ -254,6 +291,514 @@ class TestDataProcessing:
         """Test that the main remove_repeated function exists."""
         assert hasattr(util, 'remove_repeated')
         assert callable(util.remove_repeated)
+    
+    @pytest.mark.unit
+    def test_deduplicate_fingerprints_and_provenance(self):
+        """Test deduplication on normalized keys with provenance of the removed papers."""
+        df = pd.DataFrame({
+            'doi': ['10.1/A', '10.1/a ', None, None, '10.2/b'],
+            'title': ['Deep-Learning', 'Other title', 'Deep learning\n', 'Third title', 'Fourth title'],
+            'abstract': ['First abstract', 'Second abstract', 'Third abstract', 'Fourth abstract', 'First  abstract']
+        })
+        
+        papers, provenance = dedup.deduplicate(df)
+        
+        # Missing DOIs are never duplicates of each other
+        assert list(papers.index) == [0, 3]
+        assert list(provenance['record']) == [1, 2, 4]
+        assert list(provenance['kept_record']) == [0, 0, 0]
+        assert list(provenance['matched_on']) == ['doi', 'title', 'abstract']
+    
+    @pytest.mark.unit
+    def test_deduplicate_csv_matches_in_memory(self):
+        """Test that out-of-core deduplication gives the same result as in memory."""
+        df = pd.DataFrame({
+            'doi': ['10.1/a', None, '10.1/a', '10.2/b', None, '10.3/c'],
+            'title': ['A', 'B', 'C', 'B', 'E', 'F'],
+            'abstract': ['a', 'b', 'c', 'd', '', 'a']
+        })
+        papers, provenance = dedup.deduplicate(df, required=['title', 'abstract'])
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            input_file = os.path.join(temp_dir, 'papers.csv')
+            output_file = os.path.join(temp_dir, 'deduplicated.csv')
+            df.to_csv(input_file, index=False)
+            
+            number_papers, chunked_provenance = dedup.deduplicate_csv(input_file, output_file, chunk_size=2,
+                                                                      required=['title', 'abstract'])
+            
+            assert number_papers == len(papers)
+            assert list(pd.read_csv(output_file)['title']) == list(papers['title'])
+            assert list(chunked_provenance['kept_record']) == list(provenance['kept_record'])
+    
+    @pytest.mark.unit
+    def test_merge_near_duplicates_prefers_doi(self):
+        """Test that near duplicates are merged into the record with a DOI."""
+        abstract = ('We propose a deep neural network that classifies images of cats with high accuracy '
+                    'by combining convolutional layers with a large labelled data set of pet photos.')
+        df = pd.DataFrame({
+            'doi': ['http://arxiv.org/abs/2101.00001', '10.1109/ACCESS.2021.1', None],
+            'title': ['Deep learning for cats', 'Deep Learning for Cats', 'Quantum chemistry of molecules'],
+            'abstract': [abstract, abstract.replace('We propose', 'This paper presents'),
+                         'An unrelated abstract about the simulation of small molecules.'],
+            'publisher': ['arxiv', None, 'Elsevier']
+        })
+        
+        papers, provenance = near_duplicates.merge_near_duplicates(df, threshold=0.7)
+        
+        assert list(papers.index) == [1, 2]
+        assert papers.loc[1, 'doi'] == '10.1109/ACCESS.2021.1'
+        # Missing fields are filled in from the merged record
+        assert papers.loc[1, 'publisher'] == 'arxiv'
+        assert list(provenance['record']) == [0]
+
+
+class TestLanguageDetection:
+    """Test batched language detection."""
+    
+    @pytest.mark.unit
+    def test_is_english_batches(self):
+        """Test that English abstracts are kept and other languages or empty abstracts are not."""
+        abstracts = [
+            'This paper presents a novel approach to neural networks for image classification tasks.',
+            'Este artículo presenta un nuevo enfoque de redes neuronales para la clasificación de imágenes.',
+            '',
+            None
+        ]
+        
+        english = language.is_english(abstracts, batch_size=2)
+
+        assert list(english) == [True, False, False, False]
+
+    @pytest.mark.unit
+    def test_backends_agree(self):
+        """Test that the n-gram classifier and the spaCy backend identify the same languages."""
+        abstracts = [
+            'This paper presents a novel approach to neural networks for image classification tasks.',
+            'Diese Arbeit stellt einen neuen Ansatz für neuronale Netze zur Bildklassifikation vor.',
+            'Cet article présente une nouvelle approche des réseaux de neurones pour la classification.'
+        ]
+
+        ngram = language.detect_languages(abstracts, backend='ngram')
+        spacy_languages = language.detect_languages(abstracts, backend='spacy')
+
+        assert list(ngram['language']) == ['en', 'de', 'fr']
+        assert list(spacy_languages['language']) == ['en', 'de', 'fr']
+        assert (ngram['score'] > 0.99).all()
+
+    @pytest.mark.unit
+    def test_unknown_backend(self):
+        """Test that an unknown backend is rejected."""
+        with pytest.raises(ValueError):
+            language.get_language_identifier('unknown')
+
+    @pytest.mark.unit
+    def test_incomplete_backend(self):
+        """Test that a backend without identify cannot be created."""
+        class IncompleteIdentifier(language.LanguageIdentifier):
+            name = 'incomplete'
+
+        with pytest.raises(TypeError):
+            IncompleteIdentifier()
+
+    @pytest.mark.unit
+    def test_cached_verdicts(self):
+        """Test that cached verdicts are looked up instead of detected again."""
+        class CountingIdentifier(language.LanguageIdentifier):
+            name = 'counting'
+            texts = []
+
+            def identify(self, texts, batch_size=1, n_process=1):
+                CountingIdentifier.texts.extend(texts)
+                for text in texts:
+                    yield ('en', 1.0) if text.startswith('This') else ('es', 1.0)
+
+        language.register_language_backend('counting', CountingIdentifier)
+        abstracts = ['This is an abstract.', 'Este es un resumen.']
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache_file = os.path.join(temp_dir, 'cache', 'language_verdicts.csv')
+
+            first = language.is_english(abstracts, backend='counting', cache_file=cache_file)
+            second = language.is_english(abstracts + ['This is another abstract.'], backend='counting',
+                                         cache_file=cache_file)
+
+            assert list(first) == [True, False]
+            assert list(second) == [True, False, True]
+            assert CountingIdentifier.texts == abstracts + ['This is another abstract.']
+            assert len(language.LanguageVerdictCache(cache_file, 'counting')) == 3
+            assert len(language.LanguageVerdictCache(cache_file, 'ngram')) == 0
+
+
+def strip_plural(word):
+    """Lemmatizer stand-in removing a final 's' (WordNet data is not needed)."""
+    return word[:-1] if word.endswith('s') and len(word) > 3 else word
+
+
+class TestKeywordMatcher:
+    """Test the matching of syntactic filter keywords."""
+
+    @pytest.mark.unit
+    def test_hit_bitmap(self):
+        """Test that every keyword is matched through its terms, on word boundaries and after lemmatization."""
+        terms = keyword_matcher.keyword_terms(['edge computing', 'AI', 'agents'],
+                                              {'AI': ['machine learning', 'artificial intelligence']})
+        matcher = keyword_matcher.KeywordMatcher(terms, lemmatize=strip_plural)
+        abstracts = [
+            'Edge-computing platforms running Machine Learning models.',
+            'Multi-agent systems with artificial intelligence.',
+            'Bridges at the edge of computing clusters.',
+            None,
+            'Agent-based edge computing'
+        ]
+
+        hits = matcher.match(abstracts)
+
+        assert hits.tolist() == [
+            [True, True, False],
+            [False, True, True],
+            [False, False, False],
+            [False, False, False],
+            [True, False, True]
+        ]
+
+    @pytest.mark.unit
+    def test_overlapping_terms(self):
+        """Test that terms inside longer terms of other keywords are also found."""
+        matcher = keyword_matcher.KeywordMatcher({'a': ['edge computing systems'], 'b': ['computing']})
+
+        assert matcher.match(['edge computing systems', 'computing']).tolist() == [[True, True], [False, True]]
+
+    @pytest.mark.unit
+    def test_split_words(self):
+        """Test that every word of a keyword and its synonyms is a term when words are split."""
+        terms = keyword_matcher.keyword_terms(['edge computing'], {'edge computing': ['fog nodes']}, split_words=True)
+
+        assert terms == {'edge computing': ['edge', 'computing', 'fog', 'nodes']}
+
+    @pytest.mark.unit
+    def test_filter_by_keywords(self):
+        """Test that papers with all the keywords (or synonyms) in their abstract are kept."""
+        from analysis import retrieve
+        papers = pd.DataFrame({
+            'title': ['a', 'b', 'c', 'd'],
+            'abstract': ['Edge computing and machine learning.', 'Edge computing only.',
+                         'Machine learning at the edge computing layer.', None]
+        })
+
+        filtered = retrieve.filter_by_keywords(papers, ['edge computing', 'ai'], {'ai': ['machine learning']})
+
+        assert list(filtered['title']) == ['a', 'c']
+        assert list(filtered['id']) == [1, 2]
+
+
+class TestTermIndex:
+    """Test the inverted term index of the preprocessed papers."""
+
+    ABSTRACTS = [
+        'Edge-computing platforms running Machine Learning models.',
+        'Multi-agent systems with artificial intelligence.',
+        'Bridges at the edge of computing clusters.',
+        None,
+        'Agent-based edge computing'
+    ]
+
+    @pytest.mark.unit
+    def test_filter_matches_keyword_matcher(self):
+        """Test that the index keeps the papers that matching the abstracts keeps."""
+        index = term_index.TermIndex.build(self.ABSTRACTS, lemmatize=strip_plural)
+        keywords, synonyms = ['edge computing', 'AI'], {'AI': ['machine learning', 'artificial intelligence']}
+        terms = keyword_matcher.keyword_terms(keywords, synonyms)
+        hits = keyword_matcher.KeywordMatcher(terms, lemmatize=strip_plural).match(self.ABSTRACTS)
+
+        assert index.filter(keywords, synonyms).tolist() == np.flatnonzero(hits.all(axis=1)).tolist()
+        assert index.filter(['edge computing']).tolist() == [0, 4]
+
+    @pytest.mark.unit
+    def test_boolean_query(self):
+        """Test that <AND>/<OR> queries, quoted phrases and prefixes are evaluated on the posting lists."""
+        index = term_index.TermIndex.build(self.ABSTRACTS, lemmatize=strip_plural)
+
+        assert index.query('"edge computing" <OR> (agent <AND> intelligence)').tolist() == [0, 1, 4]
+        assert index.query('edge <AND> comput* <AND> (bridge <OR> platform)').tolist() == [0, 2]
+        with pytest.raises(ValueError):
+            index.query('edge <AND> (computing')
+
+    @pytest.mark.unit
+    def test_stored_next_to_papers_file(self):
+        """Test that the stored index is loaded for its papers file and ignored once the file changes."""
+        with tempfile.TemporaryDirectory() as folder:
+            papers_file = os.path.join(folder, '1_preprocessed_papers.csv')
+            pd.DataFrame({'title': list('abcde'), 'abstract': self.ABSTRACTS}).to_csv(papers_file, index=False)
+            built = term_index.build_index(papers_file)
+
+            index = term_index.open_index(papers_file)
+
+            assert os.path.exists(os.path.join(folder, '1_preprocessed_papers_terms.npz'))
+            assert index.lemmas.tolist() == built.lemmas.tolist()
+            assert index.postings.tolist() == built.postings.tolist()
+            assert index.term('edge computing').tolist() == [0, 4]
+            from analysis import retrieve
+            papers = pd.read_csv(papers_file)
+            assert retrieve.filter_by_keywords(papers, ['edge computing'], {}, index)['title'].tolist() == \
+                retrieve.filter_by_keywords(papers, ['edge computing'], {})['title'].tolist() == ['a', 'e']
+            pd.DataFrame({'title': ['a'], 'abstract': ['edge']}).to_csv(papers_file, index=False)
+            assert term_index.open_index(papers_file) is None
+
+
+class TestBooleanQuery:
+    """Test the compiled boolean queries."""
+
+    SYNONYMS = {'systems engineering': ['systems thinking'], 'ai': ['machine learning']}
+
+    @pytest.mark.unit
+    def test_compile_and_normal_forms(self):
+        """Test that synonyms are expanded, groups flattened and the normal forms computed."""
+        query = boolean_query.compile_query(
+            "'systems engineering' <AND> (ai <OR> ('generative models' <OR> ai)) <AND> edge", self.SYNONYMS)
+
+        assert query.tree == ('<AND>', (('<OR>', ('systems engineering', 'systems thinking')),
+                                        ('<OR>', ('ai', 'machine learning', 'generative models')), 'edge'))
+        assert query.terms == ['systems engineering', 'systems thinking', 'ai', 'machine learning',
+                               'generative models', 'edge']
+        assert query.cnf() == [('systems engineering', 'systems thinking'),
+                               ('ai', 'machine learning', 'generative models'), ('edge',)]
+        assert len(query.dnf()) == 6
+        assert ('systems thinking', 'machine learning', 'edge') in query.dnf()
+        with pytest.raises(ValueError):
+            query.dnf(limit=4)
+        with pytest.raises(ValueError):
+            boolean_query.compile_query("edge <AND> (cloud")
+
+    @pytest.mark.unit
+    def test_api_queries(self):
+        """Test that the API queries are rendered from the compiled query."""
+        from clients.apis.generic import Generic
+        parameters = {'query': "'systems engineering' <AND> ('edge' <OR> 'edge computing')",
+                      'synonyms': self.SYNONYMS}
+
+        assert Generic().default_query(dict(parameters, fields=['ti'])) == (
+            '%28%28ti:%22systems+engineering%22+OR+ti:%22systems+thinking%22%29+AND+'
+            '%28ti:%22edge%22+OR+ti:%22edge+computing%22%29%29')
+        assert Generic().ieeexplore_query(parameters) == [
+            '("systems engineering"OR"systems thinking")AND("edge"OR"edge computing")'
+        ]
+        assert Generic().semantic_scholar_query(parameters) == [
+            'systems+engineering+edge+edge+computing', 'systems+thinking+edge+edge+computing'
+        ]
+        assert 'title:(((systems engineering) OR (systems thinking)) AND (edge OR (edge computing)))' in \
+            Generic().core_query(dict(parameters, fields=['title']))
+
+    @pytest.mark.unit
+    def test_local_evaluation(self):
+        """Test that papers are matched in any field, as by the term index on the same texts."""
+        query = boolean_query.compile_query("'edge computing' <AND> (ai <OR> agents)", self.SYNONYMS)
+        papers = pd.DataFrame({
+            'title': ['Edge computing', 'Agents', 'Cloud', None],
+            'abstract': ['Machine learning at the edge.', 'Multi-agent edge-computing.', 'AI and edge computing', None]
+        })
+
+        assert query.matches(papers, lemmatize=strip_plural).tolist() == [True, True, True, False]
+        assert query.evaluate(papers['abstract'], lemmatize=strip_plural).tolist() == [False, True, True, False]
+        index = term_index.TermIndex.build(papers['abstract'], lemmatize=strip_plural)
+        assert index.query("'edge computing' <AND> (ai <OR> agents)", self.SYNONYMS).tolist() == [1, 2]
+
+
+class TestQueryPlanner:
+    """Test the planning of API queries."""
+
+    @pytest.mark.unit
+    def test_fewest_boolean_queries_within_limit(self):
+        """Test that the OR groups are split in the fewest queries with at most the API terms, covering the query."""
+        groups = [' <OR> '.join(f'term{group}{term}' for term in range(6)) for group in range(5)]
+        query = boolean_query.compile_query(' <AND> '.join('(' + group + ')' for group in groups))
+
+        planned = query_planner.plan_queries(query, 'ieeexplore')
+
+        assert query.size == 30
+        # Splitting one group in 3 chunks and two in 2 chunks leaves 2 + 3 + 3 + 6 + 6 = 20 terms per query
+        assert len(planned) == 12
+        assert all(part.size <= query_planner.PROVIDER_LIMITS['ieeexplore']['max_terms'] for part in planned)
+        covered = {frozenset(clause) for part in planned for clause in part.dnf(limit=10 ** 5)}
+        assert covered == {frozenset(clause) for clause in query.dnf(limit=10 ** 5)}
+        assert query_planner.plan_queries(query, 'arxiv') == [query]
+
+    @pytest.mark.unit
+    def test_plain_text_queries(self):
+        """Test that APIs without boolean syntax get one query per clause, without redundant clauses."""
+        query = boolean_query.compile_query("(edge <OR> fog) <AND> (edge <OR> iot)")
+
+        planned = query_planner.plan_queries(query, 'semantic_scholar')
+
+        assert [part.terms for part in planned] == [['edge'], ['fog', 'iot']]
+        assert query_planner.estimate_requests(len(planned), fields=2, periods=3) == 12
+        assert query_planner.estimate_requests(len(planned), expected_papers=250, page_size=100) == 6
+
+    @pytest.mark.unit
+    def test_plain_text_queries_within_baseline(self):
+        """Test that APIs without boolean syntax never get more queries than alternatives of the first conjunct."""
+        synonyms = {'b': ['b1', 'b2'], 'c': [f'c{number}' for number in range(10)],
+                    'd': [f'd{number}' for number in range(10)]}
+        queries = ["(a <OR> b <OR> e) <AND> (f <OR> g <OR> b) <AND> (h <OR> i <OR> j)", "c <AND> d",
+                   "(edge <OR> fog) <AND> (edge <OR> iot)", "edge <AND> (edge <OR> fog) <AND> (iot <OR> 'smart cities')"]
+
+        for text in queries:
+            query = boolean_query.compile_query(text, synonyms)
+            planned = query_planner.plan_queries(query, 'semantic_scholar')
+
+            assert len(planned) <= len(query.first_alternatives())
+        query = boolean_query.compile_query("c <AND> d", synonyms)
+        assert [part.terms for part in query_planner.plan_queries(query, 'semantic_scholar')] == \
+            [alternative.terms for alternative in query.first_alternatives()]
+
+    @pytest.mark.unit
+    def test_dry_run_plan(self, monkeypatch):
+        """Test that a dry run only sends count requests, and that they are read from the response cache afterwards."""
+        from requests.models import Response
+        from clients.arxiv import ArxivClient
+        from clients.apis.generic import Generic
+        sent = []
+
+        def request(self, query, method, data, headers):
+            sent.append(query)
+            response = Response()
+            response.status_code = 200
+            response._content = b'<opensearch:totalResults xmlns:opensearch="a9">12000</opensearch:totalResults>'
+            return response
+        monkeypatch.setattr(Generic, 'request', request)
+        query = {'edge': "'edge' <AND> 'computing'"}
+        arguments = (query, [], {}, ['title'], [], False, datetime(2020, 1, 1), datetime(2021, 1, 1),
+                     'plan_test', '2024-01-01')
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            monkeypatch.chdir(temp_dir)
+            plan = ArxivClient().plan_papers(*arguments)
+            cached_plan = ArxivClient().plan_papers(*arguments)
+
+        assert len(sent) == 1
+        assert plan['status'] == 'planned'
+        assert plan['expected_papers'] == 12000
+        # 12000 papers in pages of 5000
+        assert plan['requests'] == 3
+        assert (plan['count_requests'], plan['cached_requests']) == (1, 0)
+        assert (cached_plan['count_requests'], cached_plan['cached_requests']) == (0, 1)
+        assert cached_plan['duration'] == plan['duration'] > 0
+
+
+class TestPipelineCache:
+    """Test the content-addressed cache of the pipeline steps."""
+
+    @pytest.mark.unit
+    def test_only_changed_steps_run(self):
+        """Test that a step runs again when its parameters or inputs change, and that earlier outputs are restored."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            runs = []
+
+            def produce(output, text):
+                runs.append(output)
+                if not os.path.exists(os.path.join(temp_dir, output)):
+                    with open(os.path.join(temp_dir, output), 'w') as file:
+                        file.write(text)
+
+            def run_pipeline(score):
+                cache = pipeline_cache.PipelineCache(temp_dir)
+                cache.run_step('filter', [], {'score': score}, ['1_filtered.csv'], produce, '1_filtered.csv',
+                               'papers above ' + str(score))
+                cache.run_step('review', ['filter'], {}, ['2_reviewed.csv'], produce, '2_reviewed.csv', 'decisions')
+
+            run_pipeline(0.8)
+            # Reviewing papers changes the file of the input of the review
+            with open(os.path.join(temp_dir, '1_filtered.csv'), 'a') as file:
+                file.write(' (reviewed)')
+            run_pipeline(0.8)
+            assert open(os.path.join(temp_dir, '2_reviewed.csv')).read() == 'decisions'
+            assert not os.path.exists(os.path.join(temp_dir, pipeline_cache.ARTIFACTS_FOLDER))
+
+            run_pipeline(0.5)
+            assert open(os.path.join(temp_dir, '1_filtered.csv')).read() == 'papers above 0.5'
+            assert len(os.listdir(os.path.join(temp_dir, pipeline_cache.ARTIFACTS_FOLDER))) == 2
+
+            # Going back to the first score restores its outputs, with the review
+            with open(os.path.join(temp_dir, '2_reviewed.csv'), 'w') as file:
+                file.write('other decisions')
+            run_pipeline(0.8)
+            assert open(os.path.join(temp_dir, '1_filtered.csv')).read() == 'papers above 0.8 (reviewed)'
+            assert open(os.path.join(temp_dir, '2_reviewed.csv')).read() == 'decisions'
+
+    @pytest.mark.unit
+    def test_resumed_run_keeps_review_decisions(self):
+        """Test that filling in a raw file of a half-reviewed run keeps the decisions and only reviews new papers."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            raw_folder = os.path.join(temp_dir, 'raw_papers')
+            papers_file = os.path.join(temp_dir, '1_preprocessed_papers.csv')
+            reviewed_file = os.path.join(temp_dir, '2_reviewed_papers.csv')
+            reviewed = []
+
+            def raw(name, numbers):
+                os.makedirs(raw_folder, exist_ok=True)
+                pd.DataFrame({'doi': [f'10.1000/{n}' for n in numbers], 'title': [f'Title {n}' for n in numbers],
+                              'abstract': [f'Abstract {n}' for n in numbers]}).to_csv(
+                    os.path.join(raw_folder, name), index=False)
+
+            def preprocess():
+                if not os.path.exists(papers_file):
+                    papers = pd.concat([pd.read_csv(os.path.join(raw_folder, name))
+                                        for name in sorted(os.listdir(raw_folder))], ignore_index=True)
+                    papers.assign(status='unknown').to_csv(papers_file, index=False)
+
+            def review(decisions):
+                papers = pd.read_csv(papers_file)
+                for position in papers.index[papers['status'] == 'unknown']:
+                    status = decisions.get(papers.loc[position, 'doi'])
+                    if status is not None:
+                        papers.loc[position, 'status'] = status
+                        reviewed.append(papers.loc[position, 'doi'])
+                        if status == 'included':
+                            util.save(reviewed_file, papers.loc[[position]], 'utf-8', 'a+')
+                papers.to_csv(papers_file, index=False)
+
+            def run_pipeline(decisions):
+                cache = pipeline_cache.PipelineCache(temp_dir)
+                cache.run_step('retrieve', [], {}, ['raw_papers'], lambda: None)
+                cache.run_step('preprocess', ['retrieve'], {}, ['1_preprocessed_papers.csv'], preprocess,
+                               reviewed_outputs=['1_preprocessed_papers.csv'])
+                cache.run_step('abstract_review', ['preprocess'], {}, ['2_reviewed_papers.csv'], review, decisions,
+                               kept_outputs=['2_reviewed_papers.csv'])
+
+            raw('query_arxiv.csv', [1, 2])
+            run_pipeline({'10.1000/1': 'included'})
+            # The run is resumed once a failed request is retrieved
+            raw('query_ieeexplore.csv', [3])
+            run_pipeline({'10.1000/2': 'not included', '10.1000/3': 'included'})
+
+            assert reviewed == ['10.1000/1', '10.1000/2', '10.1000/3']
+            assert list(pd.read_csv(papers_file)['status']) == ['included', 'not included', 'included']
+            assert list(pd.read_csv(reviewed_file)['doi']) == ['10.1000/1', '10.1000/3']
+
+
+class TestLazyImports:
+    """Test that the heavy NLP/ML dependencies are only imported when needed."""
+    
+    @pytest.mark.unit
+    def test_pipeline_import_does_not_load_heavy_modules(self):
+        """Test that importing the pipeline and reading parameters does not import spaCy, torch, gensim, NLTK or SciPy."""
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        code = (
+            "import sys, main\n"
+            "from util import util, lazy_imports\n"
+            "util._extract_performance_parameters({'queries': []})\n"
+            "print('loaded:' + ','.join(m for m in lazy_imports.HEAVY_MODULES if m in sys.modules))"
+        )
+        result = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True)
+        
+        assert result.returncode == 0, result.stderr
+        assert result.stdout.strip().splitlines()[-1] == 'loaded:'
+    
+    @pytest.mark.unit
+    def test_accessors_load_on_first_use(self):
+        """Test that accessors return the modules and cache shared instances."""
+        assert lazy_imports.load_module('json') is lazy_imports.load_module('json')
+        assert lazy_imports.whitespace_tokenizer() is lazy_imports.whitespace_tokenizer()
+        assert lazy_imports.whitespace_tokenizer().tokenize('edge  computing') == ['edge', 'computing']
 
 
 class TestFileOperations:
@@ -292,6 +837,73 @@ class TestFileOperations:
             assert loaded_df['col1'].iloc[0] == 4
 
 
+class TestSearchHistory:
+    """Test the search history shared by the runs of a survey."""
+    
+    @staticmethod
+    def _papers(numbers):
+        return pd.DataFrame({
+            'id': range(1, len(numbers) + 1),
+            'doi': [f'10.1000/{n}' for n in numbers],
+            'title': [f'Title {n}' for n in numbers],
+            'abstract': [f'Abstract {n}' for n in numbers],
+            'status': 'unknown'
+        })
+    
+    @pytest.mark.unit
+    def test_rerun_only_keeps_new_papers_and_carries_decisions(self, monkeypatch):
+        """Test that a re-run only processes new papers and keeps previous inclusions."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            monkeypatch.chdir(temp_dir)
+            first_run = './papers/survey/2024_01_01/'
+            second_run = './papers/survey/2024_06_01/'
+            os.makedirs(first_run)
+            os.makedirs(second_run)
+            # Paper 3 is removed by the semantic filter, so it gets no decision
+            self._papers([1, 2, 3]).to_csv(first_run + '1_preprocessed_papers.csv', index=False)
+            self._papers([1, 2]).assign(status=['not included', 'included']).to_csv(
+                first_run + '2_semantic_filtered_papers.csv', index=False)
+            self._papers([2]).to_csv(first_run + '6_final_list_papers.csv', index=False)
+            search_history.finalize_run('survey', '2024-01-01', 1, first_run + '6_final_list_papers.csv',
+                                        ['2_semantic_filtered_papers.csv'])
+            
+            history = search_history.load_history('survey')
+            assert list(history['status']) == ['not included', 'included']
+            
+            self._papers([2, 3, 4]).to_csv(second_run + '1_preprocessed_papers.csv', index=False)
+            moved = search_history.split_previously_seen(second_run + '1_preprocessed_papers.csv', 'survey',
+                                                         '2024-06-01', 1)
+            
+            assert moved == 1
+            assert list(pd.read_csv(second_run + '1_preprocessed_papers.csv')['doi']) == ['10.1000/3', '10.1000/4']
+            
+            self._papers([3, 4]).assign(status=['not included', 'included']).to_csv(
+                second_run + '1_preprocessed_papers.csv', index=False)
+            self._papers([4]).to_csv(second_run + '6_final_list_papers.csv', index=False)
+            search_history.finalize_run('survey', '2024-06-01', 1, second_run + '6_final_list_papers.csv',
+                                        ['1_preprocessed_papers.csv'])
+            
+            final_papers = pd.read_csv(second_run + '6_final_list_papers.csv')
+            assert list(final_papers['doi']) == ['10.1000/4', '10.1000/2']
+            history = search_history.load_history('survey')
+            assert list(history['status']) == ['not included', 'included', 'not included', 'included']
+    
+    @pytest.mark.unit
+    def test_papers_without_decision_are_not_recorded(self, monkeypatch):
+        """Test that papers removed before the manual review are left out of the history."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            monkeypatch.chdir(temp_dir)
+            run = './papers/survey/2024_01_01/'
+            os.makedirs(run)
+            self._papers([1, 2, 3]).to_csv(run + '1_preprocessed_papers.csv', index=False)
+            self._papers([1]).to_csv(run + '6_final_list_papers.csv', index=False)
+            search_history.finalize_run('survey', '2024-01-01', 1, run + '6_final_list_papers.csv')
+            
+            history = search_history.load_history('survey')
+            assert list(history['status']) == ['included']
+            assert (search_history.match_history(self._papers([1, 2, 3]), history) == [0, -1, -1]).all()
+
+
 class TestErrorHandling:
     """Test error handling and recovery."""
     
@@ -0,0 +1,273 @@
+"""Compiled boolean queries in the <AND>/<OR> grammar of util.parser.
+
+A query is compiled once from its parse tree into a normalized tree:
+
+- A term is a string (the quotes of quoted phrases are removed).
+- A group is a tuple (operator, children) with operator AND or OR. Nested groups of
+  the same operator are flattened and repeated children are removed.
+- Terms with synonyms are expanded to the group of the term OR its synonyms.
+
+The same compiled query renders the request of every API (render and
+first_alternatives, used by clients.apis.generic.Generic) and is evaluated locally on
+papers already retrieved (evaluate and matches) or on a term index (fold). Its
+disjunctive and conjunctive normal forms (dnf and cnf) are available for callers
+that reason about clauses.
+"""
+from functools import reduce
+from itertools import product
+
+import numpy as np
+import pandas as pd
+
+from . import parser
+from .keyword_matcher import KeywordMatcher, lemmatize_word
+
+AND = '<AND>'
+OR = '<OR>'
+# Clauses of a normal form before it is considered too large to compute
+MAX_CLAUSES = 4096
+
+
+def _unique(items) -> tuple:
+    """Items without repetitions, in the order of their first appearance."""
+    return tuple(dict.fromkeys(items))
+
+
+def _group(operator: str, children) -> object:
+    """Normalized group: nested groups of the same operator are flattened."""
+    flat = []
+    for child in children:
+        if isinstance(child, tuple) and child[0] == operator:
+            flat.extend(child[1])
+        else:
+            flat.append(child)
+    flat = _unique(flat)
+    return flat[0] if len(flat) == 1 else (operator, flat)
+
+
+def _from_parse_tree(node, synonyms: dict):
+    if isinstance(node, str):
+        term = node.strip()
+        if synonyms and term in synonyms:
+            return _group(OR, [term] + [str(synonym).strip() for synonym in synonyms[term]])
+        return term
+    operands = [_from_parse_tree(operand, synonyms) for operand in node[0::2]]
+    if len(operands) == 1:
+        return operands[0]
+    return _group(AND if node[1] == AND else OR, operands)
+
+
+class BooleanQuery:
+    """Normalized tree of a boolean query (see compile_query)."""
+
+    def __init__(self, tree):
+        self.tree = tree
+
+    def __eq__(self, other):
+        return isinstance(other, BooleanQuery) and self.tree == other.tree
+
+    def __repr__(self):
+        return f"BooleanQuery({self.render(repr, ' AND ', ' OR ')})"
+
+    @property
+    def terms(self) -> list:
+        """Distinct terms of the query, in order of appearance."""
+        return list(_unique(self.fold(lambda term: (term,), lambda parts: sum(parts, ()),
+                                      lambda parts: sum(parts, ()))))
+
+    @property
+    def size(self) -> int:
+        """Number of terms in the query, counting repetitions (e.g. in different groups)."""
+        return self.fold(lambda term: 1, sum, sum)
+
+    def split(self):
+        """Split the largest OR group of the query in two halves.
+
+        Returns:
+            Tuple with two queries whose union is this query, or None when the query
+            has no OR group.
+        """
+        groups = []
+
+        def visit(node, path):
+            if isinstance(node, tuple):
+                if node[0] == OR:
+                    groups.append((len(node[1]), path))
+                for position, child in enumerate(node[1]):
+                    visit(child, path + (position,))
+        visit(self.tree, ())
+        if not groups:
+            return None
+        # Largest group, the outermost one first among groups of the same size
+        _, path = max(groups, key=lambda group: (group[0], -len(group[1])))
+
+        def replace(node, path, children):
+            if not path:
+                return _group(OR, children)
+            operator, current = node
+            current = list(current)
+            current[path[0]] = replace(current[path[0]], path[1:], children)
+            return _group(operator, current)
+        group = self.tree
+        for position in path:
+            group = group[1][position]
+        half = (len(group[1]) + 1) // 2
+        return (BooleanQuery(replace(self.tree, path, group[1][:half])),
+                BooleanQuery(replace(self.tree, path, group[1][half:])))
+
+    def fold(self, term, conjunction, disjunction):
+        """Evaluate the tree bottom up.
+
+        Args:
+            term: Function of a term.
+            conjunction: Function of the list of values of the children of an AND group.
+            disjunction: Function of the list of values of the children of an OR group.
+
+        Returns:
+            The value of the root.
+        """
+        def visit(node):
+            if isinstance(node, str):
+                return term(node)
+            values = [visit(child) for child in node[1]]
+            return conjunction(values) if node[0] == AND else disjunction(values)
+        return visit(self.tree)
+
+    def render(self, term_format, and_operator: str, or_operator: str, open_group: str = '(',
+               close_group: str = ')') -> str:
+        """Text of the query in the syntax of a search API.
+
+        Args:
+            term_format: Function returning the text of a term.
+            and_operator: Text joining the children of an AND group.
+            or_operator: Text joining the children of an OR group.
+            open_group: Text opening a group inside another group.
+            close_group: Text closing a group inside another group.
+        """
+        def visit(node, nested):
+            if isinstance(node, str):
+                return term_format(node)
+            text = (and_operator if node[0] == AND else or_operator).join(visit(child, True) for child in node[1])
+            return open_group + text + close_group if nested else text
+        return visit(self.tree, False)
+
+    def first_alternatives(self) -> list:
+        """Queries whose union is this query, one per alternative of its first conjunct.
+
+        APIs with a limit on the size of a request (e.g. IEEE Xplore) are queried once
+        per alternative.
+        """
+        conjuncts = list(self.tree[1]) if isinstance(self.tree, tuple) and self.tree[0] == AND else [self.tree]
+        first = conjuncts[0]
+        alternatives = list(first[1]) if isinstance(first, tuple) and first[0] == OR else [first]
+        return [BooleanQuery(_group(AND, [alternative] + conjuncts[1:])) for alternative in alternatives]
+
+    def _normal_form(self, outer: str, limit: int) -> list:
+        """Clauses of the normal form whose outer operator is outer (OR for DNF, AND for CNF)."""
+        def visit(node):
+            if isinstance(node, str):
+                return [(node,)]
+            children = [visit(child) for child in node[1]]
+            if node[0] == outer:
+                clauses = [clause for child in children for clause in child]
+            else:
+                size = reduce(lambda total, child: total * len(child), children, 1)
+                if size > limit:
+                    raise ValueError(f"Normal form of the query has more than {limit} clauses")
+                clauses = [_unique(term for clause in combination for term in clause)
+                           for combination in product(*children)]
+            if len(clauses) > limit:
+                raise ValueError(f"Normal form of the query has more than {limit} clauses")
+            # Clauses with the same terms are the same clause
+            return list({frozenset(clause): clause for clause in clauses}.values())
+        return visit(self.tree)
+
+    def dnf(self, limit: int = MAX_CLAUSES) -> list:
+        """Disjunctive normal form: list of clauses (tuples of terms that must all appear), any of which matches.
+
+        Raises:
+            ValueError: If the normal form has more than limit clauses.
+        """
+        return self._normal_form(OR, limit)
+
+    def cnf(self, limit: int = MAX_CLAUSES) -> list:
+        """Conjunctive normal form: list of clauses (tuples of alternative terms), all of which must match.
+
+        Raises:
+            ValueError: If the normal form has more than limit clauses.
+        """
+        return self._normal_form(AND, limit)
+
+    def evaluate(self, texts, lemmatize=lemmatize_word) -> np.ndarray:
+        """Whether every text matches the query.
+
+        All the terms are matched in one pass over the texts (see KeywordMatcher), and
+        the tree is then evaluated on the columns of the hit bitmap.
+
+        Args:
+            texts: Iterable of texts.
+            lemmatize: Function returning the lemma of a lowercase word.
+
+        Returns:
+            Boolean array with one value per text.
+        """
+        terms = self.terms
+        hits = KeywordMatcher({term: [term] for term in terms}, lemmatize=lemmatize).match(texts)
+        return self._evaluate_hits(terms, hits)
+
+    def _evaluate_hits(self, terms: list, hits: np.ndarray) -> np.ndarray:
+        columns = dict(zip(terms, hits.T))
+        return self.fold(columns.get, lambda values: np.logical_and.reduce(values),
+                         lambda values: np.logical_or.reduce(values))
+
+    def matches(self, papers: pd.DataFrame, fields=('title', 'abstract'), lemmatize=lemmatize_word) -> np.ndarray:
+        """Whether every paper matches the query in some of its fields.
+
+        A term matches a paper when it appears in any of the fields, as when an API
+        searches several fields.
+
+        Args:
+            papers: DataFrame of papers.
+            fields: Text columns searched (missing columns are ignored).
+            lemmatize: Function returning the lemma of a lowercase word.
+
+        Returns:
+            Boolean array with one value per paper.
+        """
+        terms = self.terms
+        matcher = KeywordMatcher({term: [term] for term in terms}, lemmatize=lemmatize)
+        hits = np.zeros((len(papers), len(terms)), dtype=bool)
+        for field in fields:
+            if field in papers.columns:
+                hits |= matcher.match(papers[field])
+        return self._evaluate_hits(terms, hits)
+
+
+def conjunction(children) -> BooleanQuery:
+    """Query matching papers that match all the children (terms or trees)."""
+    return BooleanQuery(_group(AND, [child.tree if isinstance(child, BooleanQuery) else child for child in children]))
+
+
+def disjunction(children) -> BooleanQuery:
+    """Query matching papers that match any of the children (terms or trees)."""
+    return BooleanQuery(_group(OR, [child.tree if isinstance(child, BooleanQuery) else child for child in children]))
+
+
+def compile_query(expression: str, synonyms: dict = None) -> BooleanQuery:
+    """Compile a boolean query.
+
+    Args:
+        expression: Query in the <AND>/<OR> grammar of util.parser (as normalized by
+            util.normalize_query_expression).
+        synonyms: Optional dictionary with the synonyms of some terms.
+
+    Returns:
+        The compiled query.
+
+    Raises:
+        ValueError: If the query cannot be parsed.
+    """
+    tree, valid = parser.parse_boolean_expression(expression)
+    if not valid:
+        raise ValueError(f"Invalid boolean query: {expression}")
+    return BooleanQuery(_from_parse_tree(tree, synonyms))
@@ -0,0 +1,245 @@
+"""Hash-indexed deduplication of paper records.
+
+Records are compared through compact 64-bit fingerprints of their normalized DOI,
+title and abstract instead of the full text. A record is a duplicate when any of
+its fingerprints matches an earlier record, and the provenance of every removed
+record (the record that was kept in its place and the key that matched) is kept.
+
+The same engine works in memory on a DataFrame and out-of-core on a CSV file read
+in chunks, where only the fingerprints of the records already seen are held in memory.
+"""
+import numpy as np
+import pandas as pd
+
+# Keys used to detect duplicates, in order of precedence
+DEDUP_KEYS = ['doi', 'title', 'abstract']
+
+PROVENANCE_COLUMNS = ['record', 'kept_record', 'matched_on']
+
+# Characters ignored when comparing titles and abstracts
+_IGNORED_CHARACTERS = str.maketrans('', '', ' \t\n\r\f\v-')
+
+
+def normalize_doi(values: pd.Series) -> pd.Series:
+    """Normalize DOIs for comparison (lower case, no surrounding whitespace).
+
+    Args:
+        values: Series with the raw DOI values.
+
+    Returns:
+        Series with the normalized DOIs; missing and blank DOIs are NaN.
+    """
+    normalized = values.astype('string').str.strip().str.lower()
+    return normalized.mask(normalized == '')
+
+
+def normalize_text(values: pd.Series) -> pd.Series:
+    """Normalize titles and abstracts for comparison.
+
+    Text is lower-cased and hyphens and whitespace (including new lines) are removed,
+    so that the same text with different line breaks or hyphenation matches.
+
+    Args:
+        values: Series with the raw text values.
+
+    Returns:
+        Series with the normalized text; missing and blank values are NaN.
+    """
+    normalized = values.astype('string').str.lower().str.translate(_IGNORED_CHARACTERS)
+    return normalized.mask(normalized == '')
+
+
+_NORMALIZERS = {
+    'doi': normalize_doi,
+    'title': normalize_text,
+    'abstract': normalize_text,
+}
+
+
+def fingerprints(df: pd.DataFrame, keys: list = None) -> dict:
+    """Compute the 64-bit fingerprints of the normalized keys of the records.
+
+    Args:
+        df: DataFrame with the papers.
+        keys: Keys to fingerprint (default DEDUP_KEYS). Keys missing from df are skipped.
+
+    Returns:
+        Dictionary key -> (uint64 fingerprints, boolean mask of records that have the key).
+    """
+    keys = DEDUP_KEYS if keys is None else keys
+    result = {}
+    for key in keys:
+        if key not in df.columns:
+            continue
+        normalized = _NORMALIZERS.get(key, normalize_text)(df[key])
+        valid = normalized.notna().to_numpy()
+        hashes = pd.util.hash_pandas_object(normalized.fillna(''), index=False).to_numpy(dtype=np.uint64)
+        result[key] = (hashes, valid)
+    return result
+
+
+class DeduplicationIndex:
+    """Fingerprints of the records seen so far and the record kept in place of each record.
+
+    Records are identified by the index labels of the DataFrames added to it. The
+    index is updated chunk by chunk, so its memory use depends on the number of
+    records and not on the size of their text.
+    """
+
+    def __init__(self, keys: list = None):
+        self.keys = list(DEDUP_KEYS if keys is None else keys)
+        # Fingerprint -> first record with that fingerprint, per key
+        self.owners = {key: pd.Series(dtype=np.int64, index=pd.Index([], dtype=np.uint64)) for key in self.keys}
+        # Record -> record kept in its place (itself when it was kept)
+        self.winners = np.empty(0, dtype=np.int64)
+        # Record -> index label
+        self.labels = np.empty(0, dtype=np.int64)
+
+    @property
+    def records(self) -> int:
+        return len(self.winners)
+
+    def __len__(self):
+        return self.records
+
+    def add(self, df: pd.DataFrame) -> tuple[np.ndarray, pd.DataFrame]:
+        """Deduplicate the next chunk of records against itself and all previous chunks.
+
+        Args:
+            df: Next chunk of papers.
+
+        Returns:
+            Tuple with the boolean mask of the records of df to keep, and the provenance
+            of the removed ones (columns record, kept_record and matched_on, with index labels).
+        """
+        n = len(df)
+        start = self.records
+        positions = np.arange(start, start + n, dtype=np.int64)
+        # Earliest record sharing a key with each record (itself when none does)
+        pointer = positions.copy()
+        matched_on = np.full(n, '', dtype=object)
+        chunk_fingerprints = fingerprints(df, self.keys)
+        chunk_keys = {}
+        for key in reversed(self.keys):
+            if key not in chunk_fingerprints:
+                continue
+            hashes, valid = chunk_fingerprints[key]
+            codes, uniques = pd.factorize(hashes)
+            first = np.full(len(uniques), n, dtype=np.int64)
+            np.minimum.at(first, codes, np.arange(n, dtype=np.int64))
+            candidate = positions[first[codes]]
+            # Matches against the records of previous chunks take precedence as they are earlier
+            previous = self.owners[key].reindex(hashes).to_numpy()
+            seen = ~np.isnan(previous)
+            candidate[seen] = previous[seen].astype(np.int64)
+            candidate[~valid] = positions[~valid]
+            better = candidate < pointer
+            # Keys are visited in reverse so that ties are reported on the key with precedence
+            better |= (candidate == pointer) & (candidate < positions)
+            pointer[better] = candidate[better]
+            matched_on[better] = key
+            chunk_keys[key] = (hashes, valid, codes, first, seen)
+        # Follow the pointers until they reach a kept record
+        winners = np.concatenate([self.winners, pointer])
+        while True:
+            target = winners[pointer]
+            if np.array_equal(target, pointer):
+                break
+            pointer = target
+            winners[start:] = pointer
+        keep = pointer == positions
+        # Register the new fingerprints with their first record
+        for key, (hashes, valid, codes, first, seen) in chunk_keys.items():
+            new = valid & ~seen
+            if not new.any():
+                continue
+            owners = pd.Series(positions[first[codes][new]], index=pd.Index(hashes[new], dtype=np.uint64))
+            owners = owners[~owners.index.duplicated()]
+            self.owners[key] = pd.concat([self.owners[key], owners])
+        self.winners = winners
+        self.labels = np.concatenate([self.labels, df.index.to_numpy()])
+        provenance = pd.DataFrame({
+            'record': self.labels[positions[~keep]],
+            'kept_record': self.labels[pointer[~keep]],
+            'matched_on': matched_on[~keep],
+        }, columns=PROVENANCE_COLUMNS)
+        return keep, provenance
+
+
+def drop_incomplete(df: pd.DataFrame, required: list) -> pd.DataFrame:
+    """Drop the records with a missing or blank value in any of the required columns.
+
+    Args:
+        df: DataFrame with the papers.
+        required: Columns that must have a value.
+
+    Returns:
+        DataFrame with the complete records.
+    """
+    complete = np.ones(len(df), dtype=bool)
+    for column in required:
+        values = df[column]
+        complete &= (values.notna() & (values.astype('string').str.strip() != '')).to_numpy(dtype=bool, na_value=False)
+    return df[complete]
+
+
+def deduplicate(df: pd.DataFrame, keys: list = None, required: list = None) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Remove duplicate records from a DataFrame.
+
+    Args:
+        df: DataFrame with the papers.
+        keys: Keys used to detect duplicates (default DEDUP_KEYS).
+        required: Columns that must have a value; incomplete records are dropped before
+            deduplication so they never replace a complete one.
+
+    Returns:
+        Tuple with the deduplicated DataFrame (first occurrences, original order) and
+        the provenance of the removed records, where record and kept_record are
+        index labels of df.
+
+    Example:
+        >>> papers, provenance = deduplicate(papers, required=['title', 'abstract'])
+    """
+    if required:
+        df = drop_incomplete(df, required)
+    keep, provenance = DeduplicationIndex(keys).add(df)
+    return df[keep], provenance
+
+
+def deduplicate_csv(input_file: str, output_file: str, chunk_size: int = 100000, keys: list = None,
+                    required: list = None, encoding: str = 'utf-8') -> tuple[int, pd.DataFrame]:
+    """Remove duplicate records from a CSV file without loading it in memory.
+
+    The file is read in chunks of chunk_size records and the kept records are written
+    to output_file as they are found. input_file and output_file must be different.
+
+    Args:
+        input_file: CSV file with the papers.
+        output_file: CSV file where the deduplicated papers are written.
+        chunk_size: Number of records read at a time.
+        keys: Keys used to detect duplicates (default DEDUP_KEYS).
+        required: Columns that must have a value; incomplete records are dropped.
+        encoding: Encoding of both files.
+
+    Returns:
+        Tuple with the number of records written and the provenance of the removed
+        records, where record and kept_record are row positions in input_file.
+    """
+    index = DeduplicationIndex(keys)
+    provenance = []
+    written = 0
+    header = True
+    for chunk in pd.read_csv(input_file, chunksize=chunk_size, encoding=encoding):
+        if required:
+            chunk = drop_incomplete(chunk, required)
+        keep, chunk_provenance = index.add(chunk)
+        chunk[keep].to_csv(output_file, mode='w' if header else 'a', header=header, index=False,
+                           encoding=encoding)
+        header = False
+        written += int(keep.sum())
+        provenance.append(chunk_provenance)
+    if header:
+        # Empty input: keep the columns in the output file
+        pd.read_csv(input_file, nrows=0, encoding=encoding).to_csv(output_file, index=False, encoding=encoding)
+    provenance = pd.concat(provenance, ignore_index=True) if provenance else pd.DataFrame(columns=PROVENANCE_COLUMNS)
+    return written, provenance
@@ -0,0 +1,155 @@
+"""Matching of the keywords of the syntactic filters in paper abstracts.
+
+Every keyword has a list of terms (the keyword itself and its synonyms), and a term
+is a sequence of words matched on word boundaries after lemmatization. The matcher
+compiles the terms of all keywords into one table of word n-gram hashes:
+
+- The abstracts are tokenized together, and each distinct word is lemmatized once.
+  Lemmas are memoized across calls by lemmatize_word.
+- Every n-gram of the abstracts that has the length of some term is hashed and
+  looked up in the table in one vectorized pass. This finds all the terms of all the
+  keywords, including overlapping ones, as a word-level Aho-Corasick automaton would.
+
+The result is a hit bitmap with one row per abstract and one column per keyword.
+"""
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from util import lazy_imports
+
+# Separator between texts when they are tokenized together (a space in the texts, see _non_word_table)
+_TEXT_SEPARATOR = '\x01'
+# Multiplier used to combine the lemma ids of an n-gram (as in near_duplicates)
+_NGRAM_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+@lru_cache(maxsize=None)
+def lemmatize_word(word: str) -> str:
+    """WordNet lemma of a lowercase word (the word itself when WordNet is not available)."""
+    try:
+        return lazy_imports.wordnet_lemmatizer().lemmatize(word)
+    except (LookupError, AttributeError, TypeError, ValueError):
+        return word
+
+
+@lru_cache(maxsize=None)
+def _non_word_table() -> dict:
+    """Translation of every non-word character of the Basic Multilingual Plane to a space.
+
+    Splitting a translated text on whitespace gives the same words as the regex \\w+
+    (for characters in the plane) several times faster.
+    """
+    return {code: ' ' for code in range(0x10000)
+            if not (chr(code).isalnum() or chr(code) == '_' or chr(code).isspace())}
+
+
+def normalize(texts) -> pd.Series:
+    """Lowercase texts with every non-word character as a space (e.g. 'Multi-Agent' is 'multi agent')."""
+    return pd.Series(texts, dtype=object).fillna('').astype(str).str.lower().str.translate(_non_word_table())
+
+
+def tokenize(texts: pd.Series):
+    """Words of normalized texts, tokenized together in one pass.
+
+    Args:
+        texts: Normalized texts (see normalize).
+
+    Returns:
+        Tuple with the code of every word of the texts (in order), the distinct words
+        (indexed by code) and the position of the text of every word.
+    """
+    tokens = (' ' + _TEXT_SEPARATOR + ' ').join(texts.tolist()).split()
+    codes, uniques = pd.factorize(np.array(tokens, dtype=object))
+    separator_codes = np.flatnonzero(uniques == _TEXT_SEPARATOR)
+    is_separator = codes == (separator_codes[0] if len(separator_codes) else -1)
+    # Separator codes are left in the distinct words but never in the codes of the words
+    return codes[~is_separator], uniques, np.cumsum(is_separator)[~is_separator]
+
+
+def keyword_terms(keywords, synonyms, split_words: bool = False) -> dict:
+    """Terms of every keyword of a syntactic filter.
+
+    Args:
+        keywords: Keywords that must all appear in a paper.
+        synonyms: Dictionary with the synonyms of some keywords.
+        split_words: Whether every word of the keyword and its synonyms is a term on its
+            own (e.g. for Springer, whose abstracts are matched word by word).
+
+    Returns:
+        Dictionary with the list of terms of every keyword.
+    """
+    terms = {}
+    for keyword in keywords:
+        keyword_synonyms = [keyword] + list(synonyms.get(keyword, []) if synonyms else [])
+        if split_words:
+            keyword_synonyms = [word for term in keyword_synonyms for word in str(term).split(' ')]
+        terms[keyword] = [str(term) for term in keyword_synonyms if str(term).strip()]
+    return terms
+
+
+def _ngram_hashes(ids: np.ndarray, length: int) -> np.ndarray:
+    """Hash of the n-gram of length words starting at every position of ids."""
+    hashes = np.zeros(len(ids) - length + 1, dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for offset in range(length):
+            hashes = hashes * _NGRAM_MULTIPLIER + ids[offset:len(ids) - length + 1 + offset].astype(np.uint64)
+    return hashes
+
+
+class KeywordMatcher:
+    """Matcher of the terms of several keywords.
+
+    Args:
+        keyword_terms: Dictionary with the terms of every keyword (see keyword_terms).
+        lemmatize: Function returning the lemma of a lowercase word.
+    """
+
+    def __init__(self, keyword_terms: dict, lemmatize=lemmatize_word):
+        self.keywords = list(keyword_terms)
+        self.lemmatize = lemmatize
+        # Lemma -> id; id 0 is for lemmas that are in no term
+        self.vocabulary = {}
+        pairs = []
+        for keyword_index, terms in enumerate(keyword_terms.values()):
+            for term in normalize(terms):
+                ids = [self.vocabulary.setdefault(lemmatize(word), len(self.vocabulary) + 1)
+                       for word in term.split()]
+                if ids:
+                    pairs.append((len(ids), _ngram_hashes(np.array(ids, dtype=np.int64), len(ids))[0], keyword_index))
+        # Term length -> table with the hash of every term and its keyword
+        self.terms = {length: group[['hash', 'keyword']].drop_duplicates()
+                      for length, group in pd.DataFrame(pairs, columns=['length', 'hash', 'keyword'])
+                      .astype({'hash': np.uint64}).groupby('length')}
+
+    def match(self, texts) -> np.ndarray:
+        """Hit bitmap of the keywords in texts.
+
+        Args:
+            texts: Iterable of texts (e.g. the abstract column).
+
+        Returns:
+            Boolean matrix with one row per text and one column per keyword, True when
+            some term of the keyword appears in the text.
+        """
+        texts = normalize(texts)
+        hits = np.zeros((len(texts), len(self.keywords)), dtype=bool)
+        if len(texts) == 0 or not self.terms:
+            return hits
+        codes, words, text_of_word = tokenize(texts)
+        lemma_ids = np.array([self.vocabulary.get(self.lemmatize(word), 0) for word in words], dtype=np.int64)
+        ids = lemma_ids[codes]
+        for length, table in self.terms.items():
+            if length > len(ids):
+                continue
+            hashes = _ngram_hashes(ids, length)
+            # N-grams within one text whose words are all in some term
+            valid = text_of_word[:len(hashes)] == text_of_word[length - 1:]
+            valid &= np.minimum.reduce([ids[offset:len(hashes) + offset] for offset in range(length)]) > 0
+            positions = np.flatnonzero(valid & np.isin(hashes, table['hash'].to_numpy()))
+            if len(positions) == 0:
+                continue
+            found = pd.DataFrame({'text': text_of_word[positions], 'hash': hashes[positions]}).merge(table, on='hash')
+            hits[found['text'].to_numpy(), found['keyword'].to_numpy()] = True
+        return hits
@@ -0,0 +1,391 @@
+"""Language detection of paper abstracts.
+
+The language of a text is identified by a pluggable backend (a LanguageIdentifier
+registered in LANGUAGE_BACKENDS) that yields the most probable language of each text
+as an ISO code and its probability:
+
+- 'ngram' (default): naive Bayes classifier over character 1- to 3-grams, vectorized
+  with NumPy. It uses the n-gram frequencies of 55 languages distributed with langdetect,
+  so no model has to be loaded.
+- 'spacy': abstracts are streamed through a spaCy pipeline with nlp.pipe, in batches and
+  optionally in several processes. The pipeline only keeps the tokenizer of the model
+  and a language detector component (langdetect, the detector behind spacy_langdetect),
+  which sets doc._.language to {'language': <ISO code>, 'score': <probability>}.
+
+Verdicts can be stored in a LanguageVerdictCache keyed by the hash of the text, so
+abstracts already seen by another run, survey or semantic filter are not detected again.
+"""
+import json
+import os
+import re
+from abc import ABC, abstractmethod
+from importlib.util import find_spec
+from os.path import exists
+
+import numpy as np
+import pandas as pd
+
+from . import lazy_imports
+
+LANGUAGE_MODEL = 'en_core_web_sm'
+# Papers are kept when detected as English with at least this probability
+ENGLISH_CONFIDENCE_THRESHOLD = 0.99
+DEFAULT_BATCH_SIZE = 256
+DEFAULT_N_PROCESS = 1
+DEFAULT_BACKEND = 'ngram'
+UNKNOWN_LANGUAGE = 'UNKNOWN'
+# Characters of a text used by the n-gram classifier
+MAX_CHARACTERS = 1000
+CACHE_COLUMNS = ['backend', 'text_hash', 'language', 'score']
+
+_pipeline = None
+_identifiers = {}
+
+
+class LanguageIdentifier(ABC):
+    """Interface of the language identification backends."""
+
+    name = None
+
+    @abstractmethod
+    def identify(self, texts: list, batch_size: int = DEFAULT_BATCH_SIZE, n_process: int = DEFAULT_N_PROCESS):
+        """Identify the language of texts.
+
+        Args:
+            texts: List of texts.
+            batch_size: Number of texts processed at a time.
+            n_process: Number of processes (backends may ignore it).
+
+        Yields:
+            Tuple (language, score) for each text, in order. Texts without letters are
+            reported as UNKNOWN_LANGUAGE with score 0.
+        """
+        pass
+
+
+def language_detector(doc):
+    """spaCy component setting doc._.language with the most probable language of the text."""
+    from langdetect import detect_langs
+    from langdetect.lang_detect_exception import LangDetectException
+    try:
+        best = detect_langs(doc.text)[0]
+        doc._.language = {'language': best.lang, 'score': best.prob}
+    except LangDetectException:
+        # Texts without letters (e.g. empty abstracts)
+        doc._.language = {'language': UNKNOWN_LANGUAGE, 'score': 0.0}
+    return doc
+
+
+def get_language_pipeline():
+    """Return the spaCy pipeline used for language detection (loaded on first use).
+
+    Only the tokenizer of LANGUAGE_MODEL is loaded: its tagger, parser, NER and other
+    components are not needed to detect the language. When the model is not installed
+    a blank English tokenizer is used instead. spaCy is imported and the detector
+    component registered on the first call.
+    """
+    global _pipeline
+    if _pipeline is None:
+        spacy = lazy_imports.spacy()
+        from langdetect import DetectorFactory
+        from spacy.language import Language
+        from spacy.tokens import Doc
+        # Make langdetect deterministic
+        DetectorFactory.seed = 0
+        Doc.set_extension('language', default=None, force=True)
+        if not Language.has_factory('sals_language_detector'):
+            Language.component('sals_language_detector', func=language_detector)
+        try:
+            pipeline = spacy.load(LANGUAGE_MODEL, exclude=['tok2vec', 'tagger', 'parser', 'attribute_ruler',
+                                                           'lemmatizer', 'ner', 'senter'])
+        except OSError:
+            pipeline = spacy.blank('en')
+        for name in list(pipeline.pipe_names):
+            pipeline.remove_pipe(name)
+        pipeline.add_pipe('sals_language_detector', last=True)
+        _pipeline = pipeline
+    return _pipeline
+
+
+class SpacyLanguageIdentifier(LanguageIdentifier):
+    """Language identification with langdetect inside a spaCy pipeline."""
+
+    name = 'spacy'
+
+    def identify(self, texts: list, batch_size: int = DEFAULT_BATCH_SIZE, n_process: int = DEFAULT_N_PROCESS):
+        docs = get_language_pipeline().pipe(texts, batch_size=max(1, batch_size), n_process=max(1, n_process))
+        for doc in docs:
+            yield doc._.language['language'], float(doc._.language['score'])
+
+
+# Runs of characters that are not letters (digits, punctuation, whitespace)
+_NON_LETTERS = re.compile(r'[\W\d_]+')
+_SPACE = ord(' ')
+
+
+def _ngram_key(codes: list) -> int:
+    """Key of an n-gram (up to 3 characters) from its code points."""
+    key = 0
+    for position, code in enumerate(codes):
+        key |= code << (21 * position)
+    return key
+
+
+def default_profiles_folder() -> str:
+    """Folder with the language profiles distributed with langdetect."""
+    return os.path.join(os.path.dirname(find_spec('langdetect').origin), 'profiles')
+
+
+class NgramLanguageIdentifier(LanguageIdentifier):
+    """Naive Bayes language identification over character 1- to 3-grams.
+
+    Texts are lower-cased, every run of characters that are not letters becomes a space,
+    and the n-grams that do not contain an inner space are scored against the n-gram
+    probabilities of every language profile. N-grams missing from a profile get half of
+    the lowest probability of its n-grams of the same length.
+    """
+
+    name = 'ngram'
+
+    def __init__(self, profiles_folder: str = None, max_characters: int = MAX_CHARACTERS):
+        self.max_characters = max_characters
+        profiles_folder = default_profiles_folder() if profiles_folder is None else profiles_folder
+        self.languages, self.keys, self.log_probabilities = self._load_profiles(profiles_folder)
+        self._index = pd.Index(self.keys)
+
+    @staticmethod
+    def _load_profiles(profiles_folder: str) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Load the language profiles.
+
+        Returns:
+            Tuple with the languages, the sorted n-gram keys and the matrix of log
+            probabilities (one row per n-gram key, one column per language).
+        """
+        languages = []
+        probabilities = []
+        floors = []
+        for file_name in sorted(os.listdir(profiles_folder)):
+            with open(os.path.join(profiles_folder, file_name), encoding='utf-8') as f:
+                profile = json.load(f)
+            totals = profile['n_words']
+            language = {}
+            for ngram, count in profile['freq'].items():
+                ngram = ngram.lower()
+                if ngram.strip() == '' or len(ngram) > 3:
+                    continue
+                key = _ngram_key([ord(character) for character in ngram])
+                language[key] = language.get(key, 0.0) + count / totals[len(ngram) - 1]
+            floor = np.zeros(3)
+            for key, probability in language.items():
+                length = 1 if key < (1 << 21) else 2 if key < (1 << 42) else 3
+                floor[length - 1] = probability if floor[length - 1] == 0 else min(floor[length - 1], probability)
+            languages.append(profile['name'])
+            probabilities.append(language)
+            floors.append(np.where(floor > 0, floor, 1e-9) / 2)
+        keys = np.array(sorted(set().union(*probabilities)), dtype=np.uint64)
+        lengths = np.where(keys < (1 << 21), 0, np.where(keys < (1 << 42), 1, 2))
+        log_probabilities = np.empty((len(keys), len(languages)), dtype=np.float32)
+        for column, language in enumerate(probabilities):
+            values = floors[column][lengths]
+            values[np.searchsorted(keys, np.fromiter(language.keys(), dtype=np.uint64, count=len(language)))] = \
+                np.fromiter(language.values(), dtype=float, count=len(language))
+            log_probabilities[:, column] = np.log(values)
+        return np.array(languages), keys, log_probabilities
+
+    def _ngrams(self, texts: list) -> tuple[np.ndarray, np.ndarray]:
+        """Keys of the n-grams of texts (grouped by text) and the position of the text of each n-gram."""
+        cleaned = [' ' + _NON_LETTERS.sub(' ', text[:self.max_characters].lower()).strip() + ' ' for text in texts]
+        lengths = np.fromiter(map(len, cleaned), dtype=np.int64, count=len(cleaned))
+        codes = np.frombuffer((''.join(cleaned) + '  ').encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+        space = codes == _SPACE
+        # The 1-, 2- and 3-gram starting at every character, in the order of the characters.
+        # Texts are padded with spaces, so n-grams spanning two texts always have an inner space.
+        keys = np.stack([codes[:-2],
+                         codes[:-2] | (codes[1:-1] << np.uint64(21)),
+                         codes[:-2] | (codes[1:-1] << np.uint64(21)) | (codes[2:] << np.uint64(42))], axis=1)
+        valid = np.stack([~space[:-2], ~(space[:-2] & space[1:-1]), ~space[1:-1]], axis=1)
+        documents = np.broadcast_to(np.repeat(np.arange(len(cleaned)), lengths)[:, None], valid.shape)
+        return keys[valid], documents[valid]
+
+    def log_likelihoods(self, texts: list) -> tuple[np.ndarray, np.ndarray]:
+        """Log likelihood of every text under every language.
+
+        Returns:
+            Tuple with the matrix of log likelihoods (one row per text, one column per
+            language) and the number of known n-grams of each text.
+        """
+        keys, documents = self._ngrams(texts)
+        positions = self._index.get_indexer(keys)
+        known = positions >= 0
+        positions, documents = positions[known], documents[known]
+        from scipy import sparse
+        # Counts of the n-grams of every text; n-grams are grouped by text, so the sparse
+        # matrix is built directly and repeated n-grams are summed by the product
+        counts = np.bincount(documents, minlength=len(texts))
+        matrix = sparse.csr_matrix((np.ones(len(positions), dtype=np.float32), positions, np.r_[0, np.cumsum(counts)]),
+                                   shape=(len(texts), len(self.keys)))
+        return np.asarray(matrix @ self.log_probabilities, dtype=np.float64), counts
+
+    def identify(self, texts: list, batch_size: int = DEFAULT_BATCH_SIZE, n_process: int = DEFAULT_N_PROCESS):
+        batch_size = max(1, batch_size)
+        for start in range(0, len(texts), batch_size):
+            scores, counts = self.log_likelihoods(texts[start:start + batch_size])
+            best = scores.argmax(axis=1)
+            # Posterior probability of the best language with a uniform prior
+            probabilities = 1.0 / np.exp(scores - scores[np.arange(len(scores)), best][:, None]).sum(axis=1)
+            for language, probability, count in zip(self.languages[best], probabilities, counts):
+                if count == 0:
+                    yield UNKNOWN_LANGUAGE, 0.0
+                else:
+                    yield str(language), float(probability)
+
+
+LANGUAGE_BACKENDS = {
+    NgramLanguageIdentifier.name: NgramLanguageIdentifier,
+    SpacyLanguageIdentifier.name: SpacyLanguageIdentifier,
+}
+
+
+def register_language_backend(name: str, identifier_class) -> None:
+    """Register a language identification backend.
+
+    Args:
+        name: Name used to select the backend (the 'language_backend' performance parameter).
+        identifier_class: LanguageIdentifier subclass, instantiated without arguments on first use.
+    """
+    LANGUAGE_BACKENDS[name] = identifier_class
+    _identifiers.pop(name, None)
+
+
+def get_language_identifier(backend: str = DEFAULT_BACKEND) -> LanguageIdentifier:
+    """Return the language identifier of a backend (created on first use).
+
+    Raises:
+        ValueError: If the backend is not registered.
+    """
+    if backend not in LANGUAGE_BACKENDS:
+        raise ValueError(f"Unknown language backend '{backend}', expected one of {sorted(LANGUAGE_BACKENDS)}")
+    if backend not in _identifiers:
+        _identifiers[backend] = LANGUAGE_BACKENDS[backend]()
+    return _identifiers[backend]
+
+
+def clean_texts(texts) -> list:
+    """Texts as a list of strings (missing values, e.g. papers without abstract, are empty)."""
+    return ['' if text is None or (isinstance(text, float) and np.isnan(text)) else str(text) for text in texts]
+
+
+def text_hashes(texts: list) -> np.ndarray:
+    """64-bit hashes of texts (as signed integers)."""
+    return pd.util.hash_pandas_object(pd.Series(texts, dtype=object), index=False).to_numpy().view(np.int64)
+
+
+class LanguageVerdictCache:
+    """Language verdicts of a backend stored in a CSV file, keyed by the hash of the text.
+
+    The file is shared by the backends (CACHE_COLUMNS) and new verdicts are appended to it.
+    """
+
+    def __init__(self, file_name: str, backend: str):
+        self.file_name = file_name
+        self.backend = backend
+        verdicts = pd.DataFrame(columns=CACHE_COLUMNS)
+        if exists(file_name):
+            verdicts = pd.read_csv(file_name, dtype={'backend': str, 'text_hash': np.int64, 'language': str})
+            verdicts = verdicts.loc[verdicts['backend'] == backend]
+        verdicts = verdicts.drop_duplicates('text_hash', keep='last')
+        self.verdicts = self._by_hash(verdicts)
+
+    @staticmethod
+    def _by_hash(verdicts: pd.DataFrame) -> pd.DataFrame:
+        # A plain int64 index: pandas may store a few hashes as a RangeIndex, which
+        # overflows when it is reindexed with other 64-bit hashes
+        index = pd.Index(verdicts['text_hash'].to_numpy(dtype=np.int64), name='text_hash')
+        return verdicts[['language', 'score']].set_axis(index)
+
+    def __len__(self):
+        return len(self.verdicts)
+
+    def lookup(self, hashes: np.ndarray) -> pd.DataFrame:
+        """Verdicts of the texts with the given hashes (language is NaN for unknown texts)."""
+        return self.verdicts.reindex(hashes)
+
+    def add(self, hashes: np.ndarray, languages: list, scores: list) -> None:
+        """Store the verdicts of new texts."""
+        if len(hashes) == 0:
+            return
+        new = pd.DataFrame({'backend': self.backend, 'text_hash': hashes, 'language': languages, 'score': scores},
+                           columns=CACHE_COLUMNS)
+        new = new.drop_duplicates('text_hash', keep='last')
+        folder = os.path.dirname(self.file_name)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        new.to_csv(self.file_name, mode='a', header=not exists(self.file_name), index=False, encoding='utf-8')
+        verdicts = pd.concat([self.verdicts.reset_index(), new])
+        self.verdicts = self._by_hash(verdicts.drop_duplicates('text_hash', keep='last'))
+
+
+def detect_languages(texts, batch_size: int = DEFAULT_BATCH_SIZE, n_process: int = DEFAULT_N_PROCESS,
+                     progress=None, backend: str = DEFAULT_BACKEND, cache_file: str = None) -> pd.DataFrame:
+    """Detect the language of texts.
+
+    Args:
+        texts: Iterable of texts (missing values are treated as empty texts).
+        batch_size: Number of texts processed at a time by the backend.
+        n_process: Number of processes used by the backend (nlp.pipe for 'spacy').
+        progress: Optional callable wrapping the stream of verdicts of the texts that are
+            not cached (e.g. a tqdm factory taking the iterable and the total).
+        backend: Name of the language identification backend.
+        cache_file: Optional CSV file with the cached verdicts; only texts without a
+            cached verdict of the backend are detected and their verdicts are added to it.
+
+    Returns:
+        DataFrame with one row per text and columns language and score.
+    """
+    texts = clean_texts(texts)
+    identifier = get_language_identifier(backend)
+    languages = pd.DataFrame({'language': pd.Series([None] * len(texts), dtype=object),
+                              'score': np.zeros(len(texts), dtype=float)})
+    pending = np.ones(len(texts), dtype=bool)
+    if cache_file:
+        cache = LanguageVerdictCache(cache_file, identifier.name)
+        hashes = text_hashes(texts)
+        cached = cache.lookup(hashes)
+        pending = cached['language'].isna().to_numpy()
+        languages.loc[~pending, 'language'] = cached['language'].to_numpy()[~pending]
+        languages.loc[~pending, 'score'] = cached['score'].to_numpy(dtype=float)[~pending]
+    positions = np.flatnonzero(pending)
+    verdicts = identifier.identify([texts[position] for position in positions], batch_size=batch_size,
+                                   n_process=n_process)
+    if progress is not None:
+        verdicts = progress(verdicts, len(positions))
+    verdicts = list(verdicts)
+    if len(positions) > 0:
+        languages.loc[positions, 'language'] = [language for language, _ in verdicts]
+        languages.loc[positions, 'score'] = [score for _, score in verdicts]
+        if cache_file:
+            cache.add(hashes[positions], languages['language'].to_numpy()[positions],
+                      languages['score'].to_numpy()[positions])
+    return languages
+
+
+def is_english(texts, batch_size: int = DEFAULT_BATCH_SIZE, n_process: int = DEFAULT_N_PROCESS,
+               threshold: float = ENGLISH_CONFIDENCE_THRESHOLD, progress=None, backend: str = DEFAULT_BACKEND,
+               cache_file: str = None) -> np.ndarray:
+    """Return which texts are written in English with a probability of at least threshold.
+
+    Args:
+        texts: Iterable of texts.
+        batch_size: Number of texts processed at a time by the backend.
+        n_process: Number of processes used by the backend.
+        threshold: Minimum probability of English.
+        progress: Optional progress wrapper, see detect_languages.
+        backend: Name of the language identification backend.
+        cache_file: Optional CSV file with the cached verdicts, see detect_languages.
+
+    Returns:
+        Boolean array with one value per text.
+    """
+    languages = detect_languages(texts, batch_size=batch_size, n_process=n_process, progress=progress,
+                                 backend=backend, cache_file=cache_file)
+    return ((languages['language'] == 'en') & (languages['score'] >= threshold)).to_numpy(dtype=bool)
@@ -0,0 +1,58 @@
+"""Lazy access to the heavy NLP/ML dependencies.
+
+spaCy, sentence-transformers (and torch), gensim and NLTK take seconds to import,
+and SciPy (prioritization of the manual reviews) about half a second.
+They are only imported by the accessor functions of this module, the first time a
+pipeline step needs them, so starting main.py, reading a parameters file or resuming
+the pipeline at the manual review does not pay for them.
+"""
+import importlib
+from functools import lru_cache
+
+# Modules that must not be imported when the SaLS modules are imported
+HEAVY_MODULES = ['spacy', 'sentence_transformers', 'torch', 'gensim', 'nltk', 'scipy']
+
+
+@lru_cache(maxsize=None)
+def load_module(name: str):
+    """Import a module on first use.
+
+    Args:
+        name: Full name of the module (e.g. 'gensim.parsing.preprocessing').
+
+    Returns:
+        The imported module.
+    """
+    return importlib.import_module(name)
+
+
+def spacy():
+    """Return the spacy module."""
+    return load_module('spacy')
+
+
+def sentence_transformers():
+    """Return the sentence_transformers module (SentenceTransformer, util.semantic_search...)."""
+    return load_module('sentence_transformers')
+
+
+def simple_preprocess(doc: str, **kwargs) -> list:
+    """gensim.utils.simple_preprocess."""
+    return load_module('gensim.utils').simple_preprocess(doc, **kwargs)
+
+
+def strip_tags(doc: str) -> str:
+    """gensim.parsing.preprocessing.strip_tags."""
+    return load_module('gensim.parsing.preprocessing').strip_tags(doc)
+
+
+@lru_cache(maxsize=None)
+def wordnet_lemmatizer():
+    """Return the shared NLTK WordNetLemmatizer."""
+    return load_module('nltk.stem.wordnet').WordNetLemmatizer()
+
+
+@lru_cache(maxsize=None)
+def whitespace_tokenizer():
+    """Return the shared NLTK WhitespaceTokenizer."""
+    return load_module('nltk.tokenize').WhitespaceTokenizer()
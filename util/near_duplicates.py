@@ -0,0 +1,293 @@
+"""Near-duplicate detection of paper records with MinHash and LSH.
+
+The same paper often arrives from several databases with slightly different titles
+and abstracts (e.g. preprint and camera-ready versions), which exact deduplication
+does not catch. Each record gets a MinHash signature of the word shingles of its
+title and abstract. Locality-sensitive hashing over bands of the signatures finds
+candidate pairs without comparing all records with each other, and candidates whose
+estimated Jaccard similarity reaches the threshold are clustered together.
+
+Clusters are merged into one record, preferring records with a DOI, and the missing
+fields of the kept record are filled in from the other members of its cluster.
+"""
+import re
+import string
+
+import numpy as np
+import pandas as pd
+
+PROVENANCE_COLUMNS = ['record', 'kept_record', 'similarity']
+
+_DOI_PATTERN = r'^(?:https?://(?:dx\.)?doi\.org/|doi:)?10\.\d{4,9}/\S+$'
+# Separator between texts when they are tokenized together
+_TEXT_SEPARATOR = '\x01'
+_PUNCTUATION = str.maketrans({character: ' ' for character in string.punctuation + _TEXT_SEPARATOR})
+# Multiplier used to combine the token hashes of a shingle
+_SHINGLE_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+# Maximum number of hash values computed at once (bounds the memory of minhash_signatures)
+_BLOCK_SIZE = 4000000
+
+
+def has_doi(values: pd.Series) -> np.ndarray:
+    """Return which values are DOIs (and not e.g. arXiv or Semantic Scholar identifiers).
+
+    Args:
+        values: Series with the values of the doi column.
+
+    Returns:
+        Boolean array, True for the values that are DOIs.
+    """
+    return values.astype('string').str.strip().str.match(_DOI_PATTERN, flags=re.IGNORECASE) \
+        .to_numpy(dtype=bool, na_value=False)
+
+
+def _shingle_hashes(texts: pd.Series, shingle_size: int) -> tuple[np.ndarray, np.ndarray]:
+    """Hash the word shingles of every text.
+
+    Returns:
+        Tuple with the shingle hashes of all texts (grouped by text) and the number of
+        shingles of each text. Texts with fewer words than shingle_size have one shingle.
+    """
+    lowered = texts.fillna('').astype(str).str.lower().str.translate(_PUNCTUATION)
+    # Tokenizing all texts in one split is much faster than one split per text
+    words = np.array((' ' + _TEXT_SEPARATOR + ' ').join(lowered.tolist()).split(), dtype=object)
+    codes, uniques = pd.factorize(words)
+    separators = np.nonzero(np.asarray(uniques, dtype=object) == _TEXT_SEPARATOR)[0]
+    is_separator = codes == separators[0] if len(separators) > 0 else np.zeros(len(codes), dtype=bool)
+    boundaries = np.r_[-1, np.nonzero(is_separator)[0], len(codes)]
+    lengths = np.diff(boundaries) - 1
+    total = int(lengths.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.uint64), np.zeros(len(texts), dtype=np.int64)
+    token_hashes = pd.util.hash_array(np.asarray(uniques, dtype=object))[codes[~is_separator]]
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    owner = np.repeat(np.arange(len(lengths)), lengths)
+    offset = np.arange(total, dtype=np.int64) - starts[owner]
+    counts = np.where(lengths > 0, np.maximum(lengths - shingle_size + 1, 1), 0)
+    first = offset < counts[owner]
+    # Number of words in each shingle (less than shingle_size for short texts)
+    width = np.minimum(shingle_size, lengths[owner] - offset)[first]
+    positions = np.nonzero(first)[0]
+    with np.errstate(over='ignore'):
+        hashes = token_hashes[positions]
+        for j in range(1, shingle_size):
+            inside = j < width
+            hashes[inside] = hashes[inside] * _SHINGLE_MULTIPLIER + token_hashes[positions[inside] + j]
+    return hashes, counts
+
+
+def minhash_signatures(texts: pd.Series, num_perm: int = 128, shingle_size: int = 3, seed: int = 1) -> np.ndarray:
+    """Compute the MinHash signatures of texts.
+
+    The permutations are multiply-shift hashes of the 64-bit shingle hashes, so the
+    signature values are 32-bit.
+
+    Args:
+        texts: Series with the texts.
+        num_perm: Number of permutations (length of the signatures).
+        shingle_size: Number of words per shingle.
+        seed: Seed of the permutations; signatures are only comparable with the same seed.
+
+    Returns:
+        Array of shape (len(texts), num_perm). Texts without words have a signature
+        filled with the maximum uint32 value.
+    """
+    hashes, counts = _shingle_hashes(texts, shingle_size)
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, np.iinfo(np.uint64).max, size=num_perm, dtype=np.uint64) | np.uint64(1)
+    b = rng.integers(0, np.iinfo(np.uint64).max, size=num_perm, dtype=np.uint64)
+    signatures = np.full((len(counts), num_perm), np.iinfo(np.uint32).max, dtype=np.uint32)
+    non_empty = np.nonzero(counts)[0]
+    if len(non_empty) == 0:
+        return signatures
+    ends = np.cumsum(counts[non_empty])
+    starts = ends - counts[non_empty]
+    # Blocks of whole texts with at most _BLOCK_SIZE hash values
+    block_texts = max(1, _BLOCK_SIZE // num_perm)
+    start = 0
+    while start < len(non_empty):
+        stop = int(np.searchsorted(ends, starts[start] + block_texts, side='right'))
+        stop = max(stop, start + 1)
+        block = hashes[starts[start]:ends[stop - 1]]
+        # (a * x + b) >> 32 computed in place to avoid temporary arrays
+        permuted = np.multiply(a[:, None], block[None, :])
+        permuted += b[:, None]
+        permuted >>= np.uint64(32)
+        minimums = np.minimum.reduceat(permuted, starts[start:stop] - starts[start], axis=1)
+        signatures[non_empty[start:stop]] = minimums.T.astype(np.uint32)
+        start = stop
+    return signatures
+
+
+def lsh_parameters(threshold: float, num_perm: int, recall: float = 0.95) -> tuple[int, int]:
+    """Choose the number of bands and rows per band for a similarity threshold.
+
+    Pairs with Jaccard similarity s become candidates with probability 1 - (1 - s^r)^b.
+    Candidates are verified with their estimated similarity afterwards, so the bands
+    are chosen to miss few pairs at the threshold: the most rows per band (fewest
+    candidates) for which pairs at the threshold are found with at least the given recall.
+
+    Args:
+        threshold: Jaccard similarity threshold.
+        num_perm: Number of permutations of the signatures.
+        recall: Minimum probability of finding a pair with similarity equal to the threshold.
+
+    Returns:
+        Tuple (bands, rows) with bands * rows <= num_perm.
+    """
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        if 1.0 - (1.0 - threshold ** rows) ** bands < recall:
+            break
+        best = (bands, rows)
+    return best
+
+
+def cluster_signatures(signatures: np.ndarray, threshold: float, valid: np.ndarray = None) -> tuple[np.ndarray, np.ndarray]:
+    """Cluster records whose estimated Jaccard similarity reaches the threshold.
+
+    Records that fall in the same LSH bucket of any band are compared with the first
+    record of the bucket, and pairs above the threshold are joined. Clusters are the
+    connected components of these pairs.
+
+    Args:
+        signatures: MinHash signatures of the records.
+        threshold: Jaccard similarity threshold.
+        valid: Boolean mask of the records to cluster (default all).
+
+    Returns:
+        Tuple with the cluster of every record (position of its first record) and the
+        estimated similarity of every record with the record its cluster was joined through
+        (1.0 for records alone in their cluster).
+    """
+    n, num_perm = signatures.shape
+    labels = np.arange(n, dtype=np.int64)
+    similarity = np.ones(n)
+    if valid is None:
+        valid = np.ones(n, dtype=bool)
+    candidates = np.nonzero(valid)[0]
+    if len(candidates) < 2:
+        return labels, similarity
+    bands, rows = lsh_parameters(threshold, num_perm)
+    left, right, scores = [], [], []
+    for band in range(bands):
+        band_signatures = pd.DataFrame(signatures[candidates, band * rows:(band + 1) * rows])
+        buckets = pd.util.hash_pandas_object(band_signatures, index=False).to_numpy()
+        codes, uniques = pd.factorize(buckets)
+        first = np.full(len(uniques), len(candidates), dtype=np.int64)
+        np.minimum.at(first, codes, np.arange(len(candidates), dtype=np.int64))
+        heads = first[codes]
+        members = np.nonzero(heads != np.arange(len(candidates)))[0]
+        if len(members) == 0:
+            continue
+        member_records = candidates[members]
+        head_records = candidates[heads[members]]
+        estimated = (signatures[member_records] == signatures[head_records]).mean(axis=1)
+        accepted = estimated >= threshold
+        left.append(head_records[accepted])
+        right.append(member_records[accepted])
+        scores.append(estimated[accepted])
+    if not left:
+        return labels, similarity
+    left = np.concatenate(left)
+    right = np.concatenate(right)
+    scores = np.concatenate(scores)
+    # Each record keeps the best similarity it was joined with
+    order = np.argsort(scores, kind='stable')
+    similarity[right[order]] = scores[order]
+    # Connected components by propagating the smallest position
+    while True:
+        smallest = np.minimum(labels[left], labels[right])
+        updated = labels.copy()
+        np.minimum.at(updated, left, smallest)
+        np.minimum.at(updated, right, smallest)
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            break
+        labels = updated
+    return labels, similarity
+
+
+def find_near_duplicates(df: pd.DataFrame, threshold: float = 0.8, num_perm: int = 128, shingle_size: int = 3,
+                         columns: list = None, seed: int = 1) -> tuple[np.ndarray, np.ndarray]:
+    """Cluster the near-duplicate records of a DataFrame.
+
+    Args:
+        df: DataFrame with the papers.
+        threshold: Jaccard similarity of the shingles above which two records are near duplicates.
+        num_perm: Number of MinHash permutations; more permutations give better estimates.
+        shingle_size: Number of words per shingle.
+        columns: Text columns compared (default title and abstract).
+        seed: Seed of the MinHash permutations.
+
+    Returns:
+        Tuple with the cluster of every record (position of its first record in df) and
+        its estimated similarity, as returned by cluster_signatures.
+    """
+    columns = ['title', 'abstract'] if columns is None else columns
+    texts = df[columns[0]].fillna('').astype(str)
+    for column in columns[1:]:
+        texts = texts + ' ' + df[column].fillna('').astype(str)
+    signatures = minhash_signatures(texts, num_perm=num_perm, shingle_size=shingle_size, seed=seed)
+    valid = texts.str.strip().to_numpy(dtype=object) != ''
+    return cluster_signatures(signatures, threshold, valid=valid)
+
+
+def merge_near_duplicates(df: pd.DataFrame, threshold: float = 0.8, num_perm: int = 128, shingle_size: int = 3,
+                          priority: pd.Series = None, columns: list = None) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Merge the near-duplicate records of a DataFrame.
+
+    One record is kept per cluster: the one with the highest priority, then records
+    with a DOI, then the first one. Its missing fields are filled in from the other
+    members of the cluster in the same order.
+
+    Args:
+        df: DataFrame with the papers.
+        threshold: Jaccard similarity of the shingles above which two records are near duplicates.
+        num_perm: Number of MinHash permutations.
+        shingle_size: Number of words per shingle.
+        priority: Optional numeric Series aligned with df; records with a higher value are kept first
+            (e.g. papers already screened).
+        columns: Text columns compared (default title and abstract).
+
+    Returns:
+        Tuple with the merged DataFrame (kept records in their original order) and the
+        provenance of the merged records (columns record, kept_record and similarity,
+        with index labels of df).
+
+    Example:
+        >>> papers, provenance = merge_near_duplicates(papers, threshold=0.8)
+    """
+    if len(df) < 2:
+        return df, pd.DataFrame(columns=PROVENANCE_COLUMNS)
+    clusters, similarity = find_near_duplicates(df, threshold=threshold, num_perm=num_perm,
+                                                shingle_size=shingle_size, columns=columns)
+    positions = np.arange(len(df))
+    if np.array_equal(clusters, positions):
+        return df, pd.DataFrame(columns=PROVENANCE_COLUMNS)
+    rank = pd.DataFrame({
+        'cluster': clusters,
+        'priority': 0 if priority is None else np.asarray(priority, dtype=float),
+        'doi': has_doi(df['doi']) if 'doi' in df.columns else False,
+        'position': positions,
+    }).sort_values(['cluster', 'priority', 'doi', 'position'], ascending=[True, False, False, True])
+    order = rank['position'].to_numpy()
+    sorted_clusters = rank['cluster'].to_numpy()
+    # The first record of each cluster in rank order is kept
+    is_head = np.r_[True, sorted_clusters[1:] != sorted_clusters[:-1]]
+    heads = order[is_head]
+    kept = np.empty(len(df), dtype=np.int64)
+    kept[order] = order[np.maximum.accumulate(np.where(is_head, np.arange(len(order)), 0))]
+    # First non-missing value of every column in rank order
+    merged = df.iloc[order].groupby(sorted_clusters, sort=False).first()
+    merged.index = df.index[heads]
+    merged = merged.iloc[np.argsort(heads, kind='stable')]
+    duplicated = np.nonzero(kept != positions)[0]
+    provenance = pd.DataFrame({
+        'record': df.index[duplicated],
+        'kept_record': df.index[kept[duplicated]],
+        'similarity': similarity[duplicated],
+    }, columns=PROVENANCE_COLUMNS)
+    return merged, provenance
@@ -0,0 +1,243 @@
+"""Content-addressed cache of the outputs of the pipeline steps.
+
+Every step of the pipeline (see main.main) declares its inputs (the steps whose
+outputs it reads), the parameters its outputs depend on (e.g. the semantic filters
+for the semantic filtering step) and its outputs (files or folders of the run folder,
+./papers/<folder>/<search_date>/). The key of a step is the hash of its name, its
+parameters and the content hashes of the outputs of its inputs. Before a step runs:
+
+- Outputs produced with the same key are reused (the step functions skip the work
+  whose output file exists).
+- Outputs produced with another key (e.g. before the score of a semantic filter
+  changed) are moved to the artifact store of the run folder (artifacts/<key>/), and
+  the outputs of the new key are moved back from the store if they were produced
+  before (e.g. when the score is changed back). Otherwise the step runs again.
+
+Changing a parameter therefore runs its step and the steps after it whose inputs
+changed, and unchanged steps are reused. Files are hashed when a step produces them:
+the manual review steps store their decisions in the file of their input, and
+reviewing papers does not invalidate the steps after it. Folders (the raw papers) are
+hashed after every run, since the retrieval fills in the files of failed requests.
+The keys and hashes are kept in the manifest of the run folder (pipeline.json).
+
+Manual decisions survive a change of the inputs (e.g. a resumed run filling in a
+failed raw file):
+
+- Reviewed outputs (files whose status column a later review step fills in) get the
+  decisions of their previous version copied to the same papers when they are
+  produced again.
+- Kept outputs (the files the review steps append the included papers to) stay in
+  the run folder, so the review step runs again only on the papers without decision.
+"""
+import hashlib
+import json
+import os
+import shutil
+
+import pandas as pd
+
+from . import search_history
+from .logging_standards import LogCategory
+from .util import logger, save, DEFAULT_ENCODING
+
+MANIFEST_FILE = 'pipeline.json'
+ARTIFACTS_FOLDER = 'artifacts'
+UNKNOWN = 'unknown'
+_CHUNK_SIZE = 1 << 20
+
+
+def _hash_text(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def content_hash(path: str) -> str:
+    """SHA-256 of a file, or of the relative paths and contents of the files of a folder."""
+    digest = hashlib.sha256()
+    if os.path.isdir(path):
+        for root, folders, files in os.walk(path):
+            folders.sort()
+            for name in sorted(files):
+                file_path = os.path.join(root, name)
+                digest.update(os.path.relpath(file_path, path).replace(os.sep, '/').encode('utf-8'))
+                digest.update(content_hash(file_path).encode('ascii'))
+        return digest.hexdigest()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def carry_decisions(previous_file: str, papers_file: str) -> int:
+    """Copy the decisions of a previous version of a papers file to the same papers without decision.
+
+    Papers are matched by DOI, title or abstract (see search_history.match_papers).
+
+    Returns:
+        Number of decisions copied.
+    """
+    try:
+        previous = pd.read_csv(previous_file)
+        papers = pd.read_csv(papers_file)
+    except (pd.errors.EmptyDataError, pd.errors.ParserError, OSError) as e:
+        logger.warning(LogCategory.FILE, "pipeline_cache", "carry_decisions",
+                       f"Decisions of {previous_file} not carried: {type(e).__name__}: {str(e)}")
+        return 0
+    if 'status' not in previous.columns or 'status' not in papers.columns:
+        return 0
+    decided = previous.loc[previous['status'] != UNKNOWN]
+    matches = search_history.match_papers(papers, decided)
+    carried = (matches >= 0) & (papers['status'] == UNKNOWN).to_numpy()
+    if carried.any():
+        papers.loc[carried, 'status'] = decided['status'].to_numpy()[matches[carried]]
+        save(papers_file, papers, DEFAULT_ENCODING, 'w')
+    return int(carried.sum())
+
+
+class PipelineCache:
+    """Outputs of the steps of the pipeline in a run folder.
+
+    Args:
+        run_folder: Folder of the outputs of the run (./papers/<folder>/<search_date>/).
+        enabled: Whether outputs are cached by key (otherwise steps only check their
+            output files, as they do on their own).
+    """
+
+    def __init__(self, run_folder: str, enabled: bool = True):
+        self.run_folder = run_folder
+        self.enabled = enabled
+        self.manifest_file = os.path.join(run_folder, MANIFEST_FILE)
+        # Key of the outputs of every step in the run folder, and hashes of the outputs of every key
+        self.manifest = {'steps': {}, 'outputs': {}}
+        if enabled and os.path.exists(self.manifest_file):
+            try:
+                with open(self.manifest_file, 'r', encoding='utf-8') as file:
+                    self.manifest = json.load(file)
+            except (OSError, ValueError) as e:
+                logger.warning(LogCategory.FILE, "pipeline_cache", "__init__",
+                               f"Pipeline manifest {self.manifest_file} ignored: {type(e).__name__}: {str(e)}")
+
+    def _path(self, output: str, key: str = None) -> str:
+        if key is None:
+            return os.path.join(self.run_folder, output)
+        return os.path.join(self.run_folder, ARTIFACTS_FOLDER, key, output)
+
+    def step_key(self, name: str, inputs, parameters: dict) -> str:
+        """Key of a step: hash of its name, its parameters and the outputs of its inputs."""
+        input_hashes = {step: self.manifest['outputs'].get(self.manifest['steps'].get(step), {}) for step in inputs}
+        return _hash_text(name, parameters, input_hashes)
+
+    def _move(self, outputs, from_key, to_key) -> list:
+        """Move the outputs that exist between the run folder (key None) and the store."""
+        moved = []
+        for output in outputs:
+            source, target = self._path(output, from_key), self._path(output, to_key)
+            if not os.path.exists(source):
+                continue
+            if os.path.isdir(target):
+                shutil.rmtree(target)
+            elif os.path.exists(target):
+                os.remove(target)
+            os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+            shutil.move(source, target)
+            moved.append(output)
+        return moved
+
+    def _prepare(self, name: str, key: str, outputs, kept_outputs=()):
+        """Put the outputs of key in the run folder (when they were produced before).
+
+        Returns:
+            Key of the outputs moved to the store, or None.
+        """
+        current = self.manifest['steps'].get(name)
+        if current == key:
+            return None
+        existing = [output for output in outputs if os.path.exists(self._path(output))]
+        if current is None:
+            if existing:
+                # Outputs of a run without manifest are taken as produced with the current parameters
+                logger.info(LogCategory.PIPELINE, "pipeline_cache", "run_step",
+                            f"Using the existing outputs of step {name}: {', '.join(existing)}")
+            return None
+        kept = [output for output in existing if output in kept_outputs]
+        if kept:
+            logger.info(LogCategory.PIPELINE, "pipeline_cache", "run_step",
+                        f"Inputs or parameters of step {name} changed; keeping the decisions in {', '.join(kept)}")
+        stashed = self._move([output for output in existing if output not in kept_outputs], None, current)
+        if stashed:
+            logger.info(LogCategory.PIPELINE, "pipeline_cache", "run_step",
+                        f"Inputs or parameters of step {name} changed; previous outputs moved to "
+                        f"{ARTIFACTS_FOLDER}/{current[:12]}")
+        del self.manifest['steps'][name]
+        if key in self.manifest['outputs'] and os.path.isdir(self._path('', key)):
+            restored = self._move([output for output in outputs if output not in kept_outputs], key, None)
+            shutil.rmtree(self._path('', key), ignore_errors=True)
+            if restored:
+                self.manifest['steps'][name] = key
+                logger.info(LogCategory.PIPELINE, "pipeline_cache", "run_step",
+                            f"Outputs of step {name} restored from {ARTIFACTS_FOLDER}/{key[:12]}")
+        return current if stashed else None
+
+    def _carry(self, name: str, reviewed_outputs, previous_key: str) -> None:
+        """Copy the decisions of the reviewed outputs moved to the store to their new version."""
+        for output in reviewed_outputs:
+            previous_file = self._path(output, previous_key)
+            if os.path.isfile(previous_file) and os.path.isfile(self._path(output)):
+                carried = carry_decisions(previous_file, self._path(output))
+                if carried:
+                    logger.info(LogCategory.PIPELINE, "pipeline_cache", "run_step",
+                                f"{carried} decisions of the previous outputs of step {name} carried to {output}")
+
+    def _record(self, name: str, key: str, outputs, existed: dict) -> None:
+        hashes = dict(self.manifest['outputs'].get(key, {}))
+        for output in outputs:
+            path = self._path(output)
+            if not os.path.exists(path):
+                hashes.pop(output, None)
+            elif os.path.isdir(path) or not existed[output] or output not in hashes:
+                hashes[output] = content_hash(path)
+        if hashes:
+            self.manifest['steps'][name] = key
+            self.manifest['outputs'][key] = hashes
+        self._save()
+
+    def _save(self) -> None:
+        try:
+            os.makedirs(self.run_folder, exist_ok=True)
+            temp_file = self.manifest_file + '.tmp'
+            with open(temp_file, 'w', encoding='utf-8') as file:
+                json.dump(self.manifest, file, indent=1, sort_keys=True)
+            os.replace(temp_file, self.manifest_file)
+        except OSError as e:
+            logger.warning(LogCategory.FILE, "pipeline_cache", "_save",
+                           f"Pipeline manifest {self.manifest_file} not saved: {type(e).__name__}: {str(e)}")
+
+    def run_step(self, name: str, inputs, parameters: dict, outputs, function, *args,
+                 reviewed_outputs=(), kept_outputs=(), **kwargs):
+        """Run a step of the pipeline with the outputs of its key.
+
+        Args:
+            name: Name of the step (unique in the pipeline).
+            inputs: Names of the steps whose outputs the step reads.
+            parameters: Parameters the outputs of the step depend on (JSON serializable
+                or with a meaningful str, e.g. dates).
+            outputs: Files or folders written by the step, relative to the run folder.
+            function: Function running the step.
+            *args, **kwargs: Arguments of function.
+            reviewed_outputs: Outputs whose status column holds the decisions of a later
+                review step; they are carried to the outputs produced again.
+            kept_outputs: Outputs left in the run folder when the key changes (the files
+                review steps add their decisions to).
+
+        Returns:
+            Result of function.
+        """
+        if not self.enabled:
+            return function(*args, **kwargs)
+        key = self.step_key(name, inputs, parameters)
+        previous_key = self._prepare(name, key, outputs, kept_outputs)
+        existed = {output: os.path.exists(self._path(output)) for output in outputs}
+        result = function(*args, **kwargs)
+        if previous_key is not None:
+            self._carry(name, reviewed_outputs, previous_key)
+        self._record(name, key, outputs, existed)
+        return result
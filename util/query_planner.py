@@ -0,0 +1,139 @@
+"""Planning of the requests of a compiled boolean query to every search API.
+
+Every API gets the fewest queries that together cover the boolean query (with its
+synonyms expanded) within the limits of one request of that API:
+
+- APIs with boolean syntax get the whole query when it has no more terms than the
+  API accepts in one request. Otherwise, the OR groups of the query (an AND of OR
+  groups once synonyms are expanded) are split in chunks: the number of chunks of
+  every group is chosen to minimize the number of queries (the product of the
+  numbers of chunks) with every query within the limit. Queries of other shapes
+  have their largest OR group split in halves until they fit.
+- APIs without boolean syntax (Semantic Scholar searches plain text) get one query
+  per clause of the disjunctive normal form. Clauses with all the terms of another
+  clause are left out, since the papers they find are found by the shorter clause.
+  The clauses multiply with the synonyms, so when there are more clauses than
+  alternatives of the first conjunct, every alternative gets one query with all its
+  terms instead (every query also costs a count request).
+
+The number of requests of a plan is estimated before anything is sent.
+"""
+from itertools import product
+from math import ceil
+
+from .boolean_query import AND, OR, BooleanQuery, conjunction, disjunction
+
+# Limits of one request of every API; other APIs get the whole query in one request
+PROVIDER_LIMITS = {
+    'ieeexplore': {'boolean': True, 'max_terms': 20},
+    'semantic_scholar': {'boolean': False, 'max_terms': None},
+}
+DEFAULT_LIMITS = {'boolean': True, 'max_terms': None}
+
+
+def plan_queries(query: BooleanQuery, database: str) -> list:
+    """Queries sent to an API for a boolean query.
+
+    Args:
+        query: Compiled boolean query.
+        database: Name of the API (e.g. 'ieeexplore').
+
+    Returns:
+        List of queries whose union is the query (for APIs without boolean syntax, a
+        list of conjunctions, never more than the alternatives of the first conjunct).
+    """
+    limits = PROVIDER_LIMITS.get(database, DEFAULT_LIMITS)
+    if not limits['boolean']:
+        # One query with all the terms per alternative of the first conjunct
+        alternatives = [conjunction(alternative.terms) for alternative in query.first_alternatives()]
+        try:
+            clauses = [set(clause) for clause in query.dnf()]
+        except ValueError:
+            return alternatives
+        planned = [conjunction(clause) for clause in query.dnf() if not any(other < set(clause) for other in clauses)]
+        return planned if len(planned) <= len(alternatives) else alternatives
+    max_terms = limits['max_terms']
+    if max_terms is None or query.size <= max_terms:
+        return [query]
+    return _split_groups(query, max_terms) or _split_halves(query, max_terms)
+
+
+def _chunks(children: tuple, sizes: list, capacity: int) -> list:
+    """Consecutive children packed in chunks of at most capacity terms."""
+    chunks, chunk, terms = [], [], 0
+    for child, size in zip(children, sizes):
+        if chunk and terms + size > capacity:
+            chunks.append(chunk)
+            chunk, terms = [], 0
+        chunk.append(child)
+        terms += size
+    return chunks + [chunk]
+
+
+def _split_groups(query: BooleanQuery, max_terms: int):
+    """Fewest queries splitting the OR groups of the conjuncts of a query (None when they cannot fit)."""
+    tree = query.tree
+    conjuncts = list(tree[1]) if isinstance(tree, tuple) and tree[0] == AND else [tree]
+    # Ways of splitting every conjunct: (terms of its largest chunk, chunks)
+    options = []
+    for conjunct in conjuncts:
+        if isinstance(conjunct, tuple) and conjunct[0] == OR:
+            sizes = [BooleanQuery(child).size for child in conjunct[1]]
+            # The smallest capacity giving each number of chunks
+            splits = {}
+            for capacity in range(max(sizes), sum(sizes) + 1):
+                chunks = _chunks(conjunct[1], sizes, capacity)
+                splits.setdefault(len(chunks), (capacity, chunks))
+            options.append(list(splits.values()))
+        else:
+            options.append([(BooleanQuery(conjunct).size, [[conjunct]])])
+    # Terms per query -> (number of queries, chunks of every conjunct) with the fewest queries
+    best = {0: (1, [])}
+    for conjunct_options in options:
+        following = {}
+        for terms, (queries, choices) in best.items():
+            for size, chunks in conjunct_options:
+                if terms + size <= max_terms and (terms + size not in following or
+                                                  queries * len(chunks) < following[terms + size][0]):
+                    following[terms + size] = (queries * len(chunks), choices + [chunks])
+        best = following
+    if not best:
+        return None
+    _, choices = min(best.values(), key=lambda option: option[0])
+    return [conjunction(disjunction(chunk) for chunk in combination) for combination in product(*choices)]
+
+
+def _split_halves(query: BooleanQuery, max_terms: int) -> list:
+    """Queries splitting the largest OR group in halves until they fit (or have no OR group)."""
+    pending, planned = [query], []
+    while pending:
+        current = pending.pop(0)
+        halves = current.split() if current.size > max_terms else None
+        if halves is None:
+            planned.append(current)
+        else:
+            pending = list(halves) + pending
+    return planned
+
+
+def estimate_requests(queries: int, fields: int = 1, types: int = 1, periods: int = 1,
+                      expected_papers: int = None, page_size: int = None) -> int:
+    """Number of requests of a plan.
+
+    Args:
+        queries: Number of planned queries.
+        fields: Fields searched in separate requests.
+        types: Publication types searched in separate requests.
+        periods: Date ranges searched in separate requests.
+        expected_papers: Papers expected for every query, field, type and period
+            (None to count only the requests that probe the number of papers).
+        page_size: Papers per request.
+
+    Returns:
+        The estimated number of requests.
+    """
+    requests = queries * fields * types * periods
+    if expected_papers is not None and page_size:
+        # The probe returns the first page
+        requests = requests * max(1, ceil(expected_papers / page_size))
+    return requests
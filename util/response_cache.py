@@ -0,0 +1,75 @@
+"""On-disk cache of the count requests of the database clients.
+
+Before retrieving papers, every client requests the number of papers of its queries
+(a count probe). The successful responses of these probes are stored in the folder of
+the search date (./papers/<folder>/<search_date>/responses/), one JSON file per
+request named by the hash of the request, so planning a search (python main.py
+<parameters> --plan) and then running it requests every count only once. Entries
+older than the response_cache_hours performance parameter are requested again.
+"""
+import hashlib
+import json
+import os
+import time
+
+from requests.models import Response
+
+from .logging_standards import LogCategory
+from .util import logger
+
+
+def request_key(*parts) -> str:
+    """Hash of the parts of a request (e.g. database, URL, method and data)."""
+    text = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """Successful API responses stored in a folder.
+
+    Args:
+        folder: Folder of the cached responses (created on the first store).
+        max_age: Seconds after which a cached response is ignored (0 keeps them forever).
+    """
+
+    def __init__(self, folder: str, max_age: float = 0):
+        self.folder = folder
+        self.max_age = max_age
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.folder, key + '.json')
+
+    def get(self, key: str):
+        """Return the cached response of a request (None when missing or expired)."""
+        file_name = self._file(key)
+        if not os.path.exists(file_name):
+            return None
+        try:
+            with open(file_name, 'r', encoding='utf-8') as file:
+                stored = json.load(file)
+        except (OSError, ValueError) as e:
+            logger.debug(LogCategory.FILE, "response_cache", "get",
+                         f"Cached response {file_name} ignored: {type(e).__name__}: {str(e)}")
+            return None
+        if self.max_age > 0 and time.time() - stored['time'] > self.max_age:
+            return None
+        response = Response()
+        response.status_code = stored['status_code']
+        response.url = stored['url']
+        response.encoding = 'utf-8'
+        response._content = stored['text'].encode('utf-8')
+        return response
+
+    def put(self, key: str, response) -> None:
+        """Store a successful response of a request (other responses are not cached)."""
+        if getattr(response, 'status_code', None) != 200:
+            return
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            with open(self._file(key), 'w', encoding='utf-8') as file:
+                json.dump({'time': time.time(), 'status_code': response.status_code,
+                           'url': str(getattr(response, 'url', '') or ''), 'text': response.text}, file)
+        except (OSError, TypeError, ValueError) as e:
+            # The request is sent again next time
+            logger.warning(LogCategory.FILE, "response_cache", "put",
+                           f"Response not cached in {self.folder}: {type(e).__name__}: {str(e)}")
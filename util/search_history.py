@@ -0,0 +1,298 @@
+"""Search history shared by the runs of a survey (search_date folders of a folder_name).
+
+The fingerprints of the papers of every finished run are stored in
+./papers/<folder_name>/search_history.csv together with the decision taken on them
+('included' or 'not included'). Only papers with a manual decision are recorded:
+papers removed by the syntactic or semantic filters were never reviewed, so they are
+processed again by later runs (e.g. after the filters are widened).
+
+When a survey is re-run with a new search_date, papers already seen in a previous run
+are moved out of the preprocessed papers, so the semantic filter and the manual
+reviews only process new papers, and papers included in a previous run are carried
+forward to the final list.
+"""
+from os.path import exists
+
+import numpy as np
+import pandas as pd
+
+from . import dedup
+from .error_standards import (
+    ErrorHandler, create_error_context, ErrorSeverity, ErrorCategory,
+    get_standard_error_info
+)
+from .logging_standards import LogCategory
+from .util import logger, save, DEFAULT_ENCODING
+
+HISTORY_FILE_NAME = 'search_history.csv'
+FINGERPRINT_COLUMNS = [key + '_fingerprint' for key in dedup.DEDUP_KEYS]
+HISTORY_COLUMNS = FINGERPRINT_COLUMNS + ['search_date', 'status']
+
+
+def history_file(folder_name: str) -> str:
+    """Return the path of the search history of a survey."""
+    return './papers/' + folder_name + '/' + HISTORY_FILE_NAME
+
+
+def previously_seen_file(folder_name: str, search_date: str, step: int) -> str:
+    """Return the path of the papers of a run that were seen in previous runs."""
+    return './papers/' + folder_name + '/' + str(search_date).replace('-', '_') + '/' + str(step) + \
+        '_previously_seen_papers.csv'
+
+
+def _fingerprint_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Fingerprints of the papers as signed 64-bit integers (0 when the key is missing)."""
+    columns = {}
+    for key, (hashes, valid) in dedup.fingerprints(df).items():
+        columns[key + '_fingerprint'] = np.where(valid, hashes, np.uint64(0)).view(np.int64)
+    return pd.DataFrame(columns, index=df.index, columns=FINGERPRINT_COLUMNS).fillna(0).astype(np.int64)
+
+
+def load_history(folder_name: str, exclude_search_date: str = None) -> pd.DataFrame:
+    """Load the search history of a survey.
+
+    Args:
+        folder_name: Name of the survey folder.
+        exclude_search_date: Optional run left out (e.g. the current one when it is re-run).
+
+    Returns:
+        DataFrame with HISTORY_COLUMNS (empty when there is no history yet).
+    """
+    file_name = history_file(folder_name)
+    if not exists(file_name):
+        return pd.DataFrame(columns=HISTORY_COLUMNS)
+    history = pd.read_csv(file_name, dtype={column: np.int64 for column in FINGERPRINT_COLUMNS})
+    if exclude_search_date is not None:
+        history = history.loc[history['search_date'].astype(str) != str(exclude_search_date)]
+    return history.reset_index(drop=True)
+
+
+def match_history(df: pd.DataFrame, history: pd.DataFrame) -> np.ndarray:
+    """Find the papers of df already in the history.
+
+    A paper matches when any of its DOI, title or abstract fingerprints is in the
+    history. When several history entries match, the most recent one is used.
+
+    Args:
+        df: DataFrame with the papers.
+        history: Search history as returned by load_history.
+
+    Returns:
+        Array with the position in history of the entry matched by each paper, -1 for new papers.
+    """
+    matches = np.full(len(df), -1, dtype=np.int64)
+    if len(df) == 0 or len(history) == 0:
+        return matches
+    fingerprints = _fingerprint_frame(df)
+    for column in reversed(FINGERPRINT_COLUMNS):
+        known = history[column].to_numpy(dtype=np.int64)
+        # Last entry of every fingerprint (entries are appended run after run)
+        owners = pd.Series(np.arange(len(history)), index=known)
+        owners = owners[(owners.index != 0) & ~owners.index.duplicated(keep='last')]
+        values = fingerprints[column].to_numpy()
+        found = owners.reindex(values).to_numpy()
+        matched = (values != 0) & ~np.isnan(found)
+        matches[matched] = found[matched].astype(np.int64)
+    return matches
+
+
+def split_previously_seen(file_name: str, folder_name: str, search_date: str, step: int) -> int:
+    """Move the papers of a run that were seen in previous runs out of its papers file.
+
+    The moved papers are saved in the previously seen papers file of the run with the
+    date and decision of the run where they were seen (previous_search_date and
+    previous_status columns).
+
+    Args:
+        file_name: Papers file of the run (e.g. the preprocessed papers).
+        folder_name: Name of the survey folder.
+        search_date: Search date of the run.
+        step: Pipeline step used to name the previously seen papers file.
+
+    Returns:
+        Number of papers moved.
+    """
+    try:
+        history = load_history(folder_name, exclude_search_date=search_date)
+        if len(history) == 0:
+            return 0
+        papers = pd.read_csv(file_name)
+        matches = match_history(papers, history)
+        seen = matches >= 0
+        if not seen.any():
+            return 0
+        previous = papers.loc[seen].copy()
+        previous['previous_search_date'] = history['search_date'].to_numpy()[matches[seen]]
+        previous['previous_status'] = history['status'].to_numpy()[matches[seen]]
+        save(previously_seen_file(folder_name, search_date, step), previous, DEFAULT_ENCODING, 'w')
+        save(file_name, papers.loc[~seen], DEFAULT_ENCODING, 'w')
+        logger.info(
+            LogCategory.DATA,
+            "search_history",
+            "split_previously_seen",
+            f"{int(seen.sum())} papers were seen in previous runs "
+            f"({int((previous['previous_status'] == 'included').sum())} included), {int((~seen).sum())} new papers"
+        )
+        return int(seen.sum())
+    except (pd.errors.EmptyDataError, pd.errors.ParserError, FileNotFoundError) as e:
+        context = create_error_context(
+            module="search_history",
+            function="split_previously_seen",
+            operation="file_reading",
+            severity=ErrorSeverity.WARNING,
+            category=ErrorCategory.FILE
+        )
+
+        error_info = get_standard_error_info("file_not_found")
+        error_handler = ErrorHandler(logger)
+        error_msg = error_handler.handle_error(
+            error=e,
+            context=context,
+            error_type="FileReadingError",
+            error_description=f"Error reading papers or search history: {type(e).__name__}: {str(e)}",
+            recovery_suggestion=error_info["recovery"],
+            next_steps=error_info["next_steps"]
+        )
+        return 0
+    except Exception as ex:
+        context = create_error_context(
+            module="search_history",
+            function="split_previously_seen",
+            operation="history_matching",
+            severity=ErrorSeverity.WARNING,
+            category=ErrorCategory.DATA
+        )
+
+        error_info = get_standard_error_info("data_validation_failed")
+        error_handler = ErrorHandler(logger)
+        error_msg = error_handler.handle_error(
+            error=ex,
+            context=context,
+            error_type="HistoryMatchingError",
+            error_description=f"Unexpected error matching papers with the search history: {type(ex).__name__}: {str(ex)}",
+            recovery_suggestion=error_info["recovery"],
+            next_steps=error_info["next_steps"]
+        )
+        return 0
+
+
+def match_papers(df: pd.DataFrame, papers: pd.DataFrame) -> np.ndarray:
+    """Find the papers of df in another DataFrame of papers, by DOI, title or abstract fingerprint.
+
+    Returns:
+        Array with the position in papers of the paper matched by each paper of df, -1
+        when there is none.
+    """
+    if len(papers) == 0:
+        return np.full(len(df), -1, dtype=np.int64)
+    return match_history(df, _fingerprint_frame(papers.reset_index(drop=True)))
+
+
+def _matches(df: pd.DataFrame, frames: list) -> np.ndarray:
+    """Whether every paper of df is in any of the frames of papers."""
+    frames = [frame for frame in frames if len(frame) > 0]
+    if len(df) == 0 or not frames:
+        return np.zeros(len(df), dtype=bool)
+    return match_papers(df, pd.concat(frames, ignore_index=True)) >= 0
+
+
+def finalize_run(folder_name: str, search_date: str, preprocess_step: int, final_file: str,
+                 reviewed_files: list = None) -> None:
+    """Carry forward previous decisions to the final list of a run and record the run in the history.
+
+    Papers included in previous runs are appended to the final list. The new papers of
+    the run are recorded as 'included' when they are in the final list and as
+    'not included' when they were reviewed manually but are not in it. New papers
+    without a decision (e.g. removed by the semantic filter) are not recorded.
+    Finalizing a run again replaces its previous record.
+
+    Args:
+        folder_name: Name of the survey folder.
+        search_date: Search date of the run.
+        preprocess_step: Pipeline step of the preprocessed papers of the run.
+        final_file: Final list of papers of the run.
+        reviewed_files: Papers files of the manual reviews of the run, relative to its
+            folder (their status column holds the decisions, 'unknown' when there is none).
+    """
+    try:
+        run_folder = './papers/' + folder_name + '/' + str(search_date).replace('-', '_') + '/'
+        preprocessed_file = run_folder + str(preprocess_step) + '_preprocessed_papers.csv'
+        final_papers = pd.read_csv(final_file) if exists(final_file) else pd.DataFrame()
+        new_papers = pd.read_csv(preprocessed_file) if exists(preprocessed_file) else pd.DataFrame()
+
+        seen_file = previously_seen_file(folder_name, search_date, preprocess_step)
+        if exists(seen_file):
+            previous = pd.read_csv(seen_file)
+            carried = previous.loc[previous['previous_status'] == 'included']
+            if len(carried) > 0:
+                final_papers, _ = dedup.deduplicate(pd.concat([final_papers, carried], ignore_index=True))
+                final_papers['id'] = list(range(1, len(final_papers) + 1))
+                save(final_file, final_papers, DEFAULT_ENCODING, 'w')
+                logger.info(
+                    LogCategory.DATA,
+                    "search_history",
+                    "finalize_run",
+                    f"Carried forward {len(carried)} papers included in previous runs to {final_file}"
+                )
+
+        # Record the decisions on the new papers of the run
+        included = _matches(new_papers, [final_papers])
+        reviewed = []
+        for reviewed_file in reviewed_files or []:
+            if exists(run_folder + reviewed_file):
+                papers = pd.read_csv(run_folder + reviewed_file)
+                if 'status' in papers.columns:
+                    reviewed.append(papers.loc[papers['status'] != 'unknown'])
+        decided = included | _matches(new_papers, reviewed)
+        run_history = _fingerprint_frame(new_papers.loc[decided]) if decided.any() \
+            else pd.DataFrame(columns=FINGERPRINT_COLUMNS)
+        run_history['search_date'] = str(search_date)
+        run_history['status'] = np.where(included[decided], 'included', 'not included')
+        history = pd.concat([load_history(folder_name, exclude_search_date=search_date), run_history],
+                            ignore_index=True)
+        save(history_file(folder_name), history[HISTORY_COLUMNS], DEFAULT_ENCODING, 'w')
+        logger.info(
+            LogCategory.DATA,
+            "search_history",
+            "finalize_run",
+            f"Recorded {len(run_history)} reviewed papers of the run in the search history "
+            f"({int(included.sum())} included), {len(new_papers) - len(run_history)} papers without decision left out"
+        )
+    except (pd.errors.EmptyDataError, pd.errors.ParserError, FileNotFoundError) as e:
+        context = create_error_context(
+            module="search_history",
+            function="finalize_run",
+            operation="file_reading",
+            severity=ErrorSeverity.WARNING,
+            category=ErrorCategory.FILE
+        )
+
+        error_info = get_standard_error_info("file_not_found")
+        error_handler = ErrorHandler(logger)
+        error_msg = error_handler.handle_error(
+            error=e,
+            context=context,
+            error_type="FileReadingError",
+            error_description=f"Error reading the files of the run: {type(e).__name__}: {str(e)}",
+            recovery_suggestion=error_info["recovery"],
+            next_steps=error_info["next_steps"]
+        )
+    except Exception as ex:
+        context = create_error_context(
+            module="search_history",
+            function="finalize_run",
+            operation="history_update",
+            severity=ErrorSeverity.WARNING,
+            category=ErrorCategory.DATA
+        )
+
+        error_info = get_standard_error_info("data_validation_failed")
+        error_handler = ErrorHandler(logger)
+        error_msg = error_handler.handle_error(
+            error=ex,
+            context=context,
+            error_type="HistoryUpdateError",
+            error_description=f"Unexpected error updating the search history: {type(ex).__name__}: {str(ex)}",
+            recovery_suggestion=error_info["recovery"],
+            next_steps=error_info["next_steps"]
+        )
@@ -0,0 +1,220 @@
+"""Inverted term index of the abstracts of a papers file.
+
+The index maps every lemma of the abstracts to the sorted rows of the papers that
+contain it (its posting list), so syntactic filters and boolean queries in the
+<AND>/<OR> grammar of util.parser are evaluated by intersecting and merging posting
+lists instead of lemmatizing and scanning every abstract again:
+
+- A term of one word is its posting list.
+- A term of several words is the intersection of the lists of its words; the
+  candidate abstracts are then checked for the words in sequence.
+- A term ending in '*' matches every lemma with that prefix.
+- <AND> intersects and <OR> merges the rows of its operands.
+
+Abstracts are tokenized and lemmatized as by the keyword matcher, so the index finds
+the same papers as filtering them with it. It is built at the end of preprocessing
+and stored next to the papers file (<step>_preprocessed_papers_terms.npz) with the
+size and modification time of the file; it is ignored once the file changes.
+"""
+import os
+import time
+from functools import reduce
+
+import numpy as np
+import pandas as pd
+
+from . import boolean_query
+from .keyword_matcher import KeywordMatcher, lemmatize_word, normalize, tokenize
+from .logging_standards import LogCategory
+from .util import logger
+
+INDEX_SUFFIX = '_terms.npz'
+
+
+def index_file(papers_file: str) -> str:
+    """Return the path of the term index of a papers file."""
+    return os.path.splitext(papers_file)[0] + INDEX_SUFFIX
+
+
+def _signature(papers_file: str) -> np.ndarray:
+    """Size and modification time of a papers file."""
+    stat = os.stat(papers_file)
+    return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+
+class TermIndex:
+    """Posting lists of the lemmas of a list of abstracts.
+
+    Args:
+        lemmas: Sorted lemmas.
+        offsets: Start of the posting list of every lemma in postings, plus its end.
+        postings: Concatenated posting lists (sorted rows of every lemma).
+        rows: Number of abstracts.
+        abstracts: Abstracts, or a callable loading them, to check terms of several words.
+        lemmatize: Function returning the lemma of a lowercase word.
+    """
+
+    def __init__(self, lemmas: np.ndarray, offsets: np.ndarray, postings: np.ndarray, rows: int,
+                 abstracts=None, lemmatize=lemmatize_word):
+        self.lemmas = lemmas
+        self.offsets = offsets
+        self.postings = postings
+        self.rows = rows
+        self.lemmatize = lemmatize
+        self._abstracts = abstracts
+
+    @classmethod
+    def build(cls, abstracts, lemmatize=lemmatize_word) -> 'TermIndex':
+        """Index a list of abstracts (the rows of the index are their positions)."""
+        abstracts = pd.Series(abstracts, dtype=object).reset_index(drop=True)
+        codes, words, text_of_word = tokenize(normalize(abstracts))
+        lemma_codes, lemmas = pd.factorize(np.array([lemmatize(word) for word in words], dtype=object), sort=True)
+        # Distinct (lemma, row) pairs, sorted by lemma and then by row
+        rows = max(len(abstracts), 1)
+        pairs = np.sort(lemma_codes[codes].astype(np.int64) * rows + text_of_word)
+        pairs = pairs[np.diff(pairs, prepend=-1) != 0]
+        counts = np.bincount(pairs // rows, minlength=len(lemmas))
+        # Lemmas of no word (e.g. of the separator between texts) are left out
+        present = counts > 0
+        return cls(np.asarray(lemmas, dtype=str)[present], np.concatenate([[0], np.cumsum(counts[present])]),
+                   (pairs % rows).astype(np.uint32), len(abstracts), abstracts, lemmatize)
+
+    def save(self, file_name: str, signature: np.ndarray) -> None:
+        """Store the index with the signature of its papers file.
+
+        Posting lists are stored as the gaps between their consecutive rows, which
+        compress well.
+        """
+        starts = self.offsets[:-1]
+        gaps = np.diff(self.postings, prepend=np.uint32(0))
+        gaps[starts] = self.postings[starts]
+        np.savez_compressed(file_name, lemmas=self.lemmas, offsets=self.offsets, gaps=gaps,
+                            rows=np.int64(self.rows), signature=signature)
+
+    @classmethod
+    def load(cls, file_name: str, abstracts=None, lemmatize=lemmatize_word):
+        """Load a stored index.
+
+        Returns:
+            Tuple with the index and the signature of its papers file.
+        """
+        with np.load(file_name) as stored:
+            offsets, gaps = stored['offsets'], stored['gaps'].astype(np.int64)
+            # Running sums of the gaps, restarted at the start of every posting list
+            cumulative = np.cumsum(gaps)
+            starts = offsets[:-1]
+            postings = cumulative - np.repeat(cumulative[starts] - gaps[starts], np.diff(offsets))
+            index = cls(stored['lemmas'], offsets, postings.astype(np.uint32), int(stored['rows']),
+                        abstracts, lemmatize)
+            return index, stored['signature']
+
+    def abstracts(self) -> pd.Series:
+        if callable(self._abstracts):
+            self._abstracts = self._abstracts()
+        return self._abstracts
+
+    def _postings(self, position: int) -> np.ndarray:
+        return self.postings[self.offsets[position]:self.offsets[position + 1]]
+
+    def lemma(self, lemma: str) -> np.ndarray:
+        """Rows with a lemma."""
+        position = np.searchsorted(self.lemmas, lemma)
+        if position < len(self.lemmas) and self.lemmas[position] == lemma:
+            return self._postings(position)
+        return np.empty(0, dtype=np.uint32)
+
+    def prefix(self, prefix: str) -> np.ndarray:
+        """Rows with a lemma starting with prefix."""
+        first, last = np.searchsorted(self.lemmas, [prefix, prefix + '\U0010ffff'])
+        return np.unique(self.postings[self.offsets[first]:self.offsets[last]])
+
+    def term(self, term: str) -> np.ndarray:
+        """Rows whose abstract contains a term (a word or phrase, optionally ending in '*')."""
+        term = str(term).strip()
+        is_prefix = term.endswith('*')
+        words = normalize([term.rstrip('*')])[0].split()
+        if not words:
+            return np.empty(0, dtype=np.uint32)
+        lemmas = [self.lemmatize(word) for word in words]
+        rows = [self.lemma(lemma) for lemma in (lemmas[:-1] if is_prefix else lemmas)]
+        if is_prefix:
+            rows.append(self.prefix(words[-1]))
+        rows = reduce(lambda left, right: np.intersect1d(left, right, assume_unique=True), rows)
+        if len(words) > 1 and not is_prefix and len(rows) > 0 and self._abstracts is not None:
+            # The words of a phrase must appear in sequence
+            matcher = KeywordMatcher({term: [term]}, lemmatize=self.lemmatize)
+            rows = rows[matcher.match(self.abstracts().iloc[rows])[:, 0]]
+        return rows
+
+    def keyword(self, keyword: str, synonyms: dict = None) -> np.ndarray:
+        """Rows whose abstract contains a keyword or one of its synonyms."""
+        terms = [keyword] + list((synonyms or {}).get(keyword, []))
+        return reduce(np.union1d, [self.term(term) for term in terms]).astype(np.uint32)
+
+    def filter(self, keywords, synonyms: dict = None) -> np.ndarray:
+        """Rows whose abstract contains every keyword (or one of its synonyms), as filter_by_keywords."""
+        rows = np.arange(self.rows, dtype=np.uint32)
+        for keyword in keywords:
+            rows = np.intersect1d(rows, self.keyword(keyword, synonyms), assume_unique=True)
+        return rows
+
+    def query(self, expression: str, synonyms: dict = None) -> np.ndarray:
+        """Rows whose abstract matches a boolean query.
+
+        Args:
+            expression: Query in the <AND>/<OR> grammar of util.parser.
+            synonyms: Optional dictionary with the synonyms of some terms.
+
+        Returns:
+            Sorted rows of the matching abstracts.
+
+        Raises:
+            ValueError: If the query cannot be parsed.
+        """
+        return boolean_query.compile_query(expression, synonyms).fold(
+            self.term,
+            lambda rows: reduce(lambda left, right: np.intersect1d(left, right, assume_unique=True), rows),
+            lambda rows: reduce(np.union1d, rows).astype(np.uint32))
+
+
+def build_index(papers_file: str) -> TermIndex:
+    """Index the abstracts of a papers file and store the index next to it.
+
+    Args:
+        papers_file: Path of a CSV file of papers with an abstract column.
+
+    Returns:
+        The index (its rows are the rows of the file).
+    """
+    start = time.perf_counter()
+    abstracts = pd.read_csv(papers_file, usecols=['abstract'])['abstract']
+    index = TermIndex.build(abstracts)
+    try:
+        index.save(index_file(papers_file), _signature(papers_file))
+    except OSError as e:
+        # Filtering without the index scans the abstracts instead
+        logger.warning(
+            LogCategory.FILE,
+            "term_index",
+            "build_index",
+            f"Term index of {papers_file} not stored: {type(e).__name__}: {str(e)}"
+        )
+    logger.info(
+        LogCategory.DATA,
+        "term_index",
+        "build_index",
+        f"Indexed {len(index.lemmas)} terms of {index.rows} abstracts in {time.perf_counter() - start:.2f}s"
+    )
+    return index
+
+
+def open_index(papers_file: str):
+    """Return the stored term index of a papers file (None when it is missing or out of date)."""
+    file_name = index_file(papers_file)
+    if not os.path.exists(file_name) or not os.path.exists(papers_file):
+        return None
+    index, signature = TermIndex.load(
+        file_name, abstracts=lambda: pd.read_csv(papers_file, usecols=['abstract'])['abstract'])
+    if not np.array_equal(signature, _signature(papers_file)):
+        return None
+    return index
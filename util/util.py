@@ -9,13 +9,13 @@ from os.path import exists
 # Third-party imports
 import numpy as np
 import pandas as pd
-import spacy
 import yaml
-from spacy_langdetect import LanguageDetector
-from spacy.language import Language
 from tqdm import tqdm
 
 # Local imports
+from . import dedup
+from . import language
+from . import near_duplicates
 from . import parser as par
 from .error_standards import (
     ErrorHandler, create_error_context, ErrorSeverity, ErrorCategory,
@@ -107,6 +107,39 @@ VALID_DATABASES = [
     'arxiv', 'springer', 'ieeexplore', 'scopus', 'core', 'semantic_scholar',
     'crossref', 'europe_pmc', 'pubmed', 'openalex'
 ]
+# Optional execution tuning read from the 'performance' section of the parameters file
+DEFAULT_PERFORMANCE_PARAMETERS = {
+    'preprocess_workers': 1,
+    'dedup_chunk_size': 0,
+    'language_batch_size': 256,
+    'language_n_process': 1,
+    'language_backend': 'ngram',
+    'language_cache_file': './papers/language_verdicts.csv',
+    'warmup_embedding_model': False,
+    'embedding_store_folder': './papers/embeddings',
+    'embedding_store_dtype': 'float32',
+    'semantic_chunk_size': 4096,
+    'embedding_workers': 1,
+    'embedding_batch_size': 32,
+    'semantic_index_probes': 0,
+    'term_index': True,
+    'response_cache_hours': 24,
+    'step_cache': True,
+    'streaming': False,
+    'stream_queue_size': 4,
+    'screening_prefetch': 8,
+    'screening_priority': 'relevance',
+    'screening_retrain_every': 10,
+}
+# Optional duplicate handling read from the 'deduplication' section of the parameters file
+DEFAULT_DEDUPLICATION_PARAMETERS = {
+    'near_duplicate_threshold': 0.0,
+    'num_perm': 128,
+    'shingle_size': 3,
+    'cross_run': False,
+}
+# Columns identifying the removed and kept papers in the provenance of remove_repeated
+PROVENANCE_PAPER_COLUMNS = ['database', 'query_name', 'doi', 'title']
 
 
 def _apply_word_replacements_outside_quotes(text: str) -> str:
@@ -235,8 +268,9 @@ def normalize_query_expression(expression: str) -> str:
 # Legacy variable - kept for backward compatibility
 fr = DEFAULT_ENCODING
 
-# Initialize spaCy for language detection
-nlp = spacy.load('en_core_web_sm')
+# Performance and deduplication parameters of the current run (set by read_parameters)
+_performance_parameters = dict(DEFAULT_PERFORMANCE_PARAMETERS)
+_deduplication_parameters = dict(DEFAULT_DEDUPLICATION_PARAMETERS)
 
 
 # =============================================================================
@@ -620,7 +654,31 @@ def _validate_configuration(parameters: dict, parameters_file_name: str) -> tupl
                 'severity': 'warning',
                 'default': 'empty list'
             })
-        
+
+        if 'performance' in parameters and not isinstance(parameters['performance'], dict):
+            warnings.append(f"Configuration warning: 'performance' must be a mapping in {parameters_file_name}")
+            recovery_suggestions.append({
+                'issue': f'performance is {type(parameters["performance"]).__name__}',
+                'fix': 'Format performance as key: value pairs',
+                'example': '''performance:
+  preprocess_workers: 4
+''',
+                'severity': 'warning',
+                'default': 'default performance parameters'
+            })
+
+        if 'deduplication' in parameters and not isinstance(parameters['deduplication'], dict):
+            warnings.append(f"Configuration warning: 'deduplication' must be a mapping in {parameters_file_name}")
+            recovery_suggestions.append({
+                'issue': f'deduplication is {type(parameters["deduplication"]).__name__}',
+                'fix': 'Format deduplication as key: value pairs',
+                'example': '''deduplication:
+  near_duplicate_threshold: 0.8
+''',
+                'severity': 'warning',
+                'default': 'default deduplication parameters'
+            })
+
         # Determine overall validation result
         if critical_errors:
             # Critical errors prevent pipeline execution
@@ -794,6 +852,73 @@ def _apply_configuration_fallbacks(parameters: dict, parameters_file_name: str,
 # =============================================================================
 # These functions handle the main configuration loading and processing workflow.
 
+def _extract_section_parameters(parameters: dict, section_name: str, defaults: dict) -> dict:
+    """Merge an optional section of the parameters file with its default parameters.
+
+    Unknown keys are ignored and values that cannot be converted to the type of the
+    default value fall back to the default, so a bad entry never stops the pipeline.
+
+    Args:
+        parameters: Configuration parameters dictionary.
+        section_name: Name of the optional section (e.g. 'performance').
+        defaults: Default value of every parameter of the section.
+
+    Returns:
+        Dictionary with one value for every key in defaults.
+    """
+    values = dict(defaults)
+    section = parameters.get(section_name) if isinstance(parameters, dict) else None
+    if not isinstance(section, dict):
+        return values
+    for key, value in section.items():
+        if key not in defaults:
+            logger.warning(f"Unknown {section_name} parameter '{key}' ignored")
+            continue
+        default = defaults[key]
+        try:
+            if isinstance(default, bool):
+                values[key] = value if isinstance(value, bool) else str(value).lower() in ['true', 'yes', '1']
+            elif isinstance(default, int):
+                values[key] = int(value)
+            elif isinstance(default, float):
+                values[key] = float(value)
+            else:
+                values[key] = value
+        except (ValueError, TypeError) as e:
+            logger.warning(f"Invalid value for {section_name} parameter '{key}': {value}. Using default {default}. "
+                           f"{type(e).__name__}: {str(e)}")
+    return values
+
+
+def _extract_performance_parameters(parameters: dict) -> dict:
+    """Merge the optional 'performance' section with DEFAULT_PERFORMANCE_PARAMETERS."""
+    return _extract_section_parameters(parameters, 'performance', DEFAULT_PERFORMANCE_PARAMETERS)
+
+
+def get_performance_parameters() -> dict:
+    """Return the performance parameters of the current run.
+
+    The values come from the 'performance' section of the last parameters file read
+    by read_parameters, or DEFAULT_PERFORMANCE_PARAMETERS if none was read.
+
+    Returns:
+        Copy of the current performance parameters dictionary.
+    """
+    return dict(_performance_parameters)
+
+
+def get_deduplication_parameters() -> dict:
+    """Return the deduplication parameters of the current run.
+
+    The values come from the 'deduplication' section of the last parameters file read
+    by read_parameters, or DEFAULT_DEDUPLICATION_PARAMETERS if none was read.
+
+    Returns:
+        Copy of the current deduplication parameters dictionary.
+    """
+    return dict(_deduplication_parameters)
+
+
 def read_parameters(parameters_file_name: str) -> tuple[list, list, list, list, list, dict, list, bool, datetime, datetime, str, str]:
     """Read and validate configuration parameters from a YAML file.
     
@@ -840,7 +965,12 @@ def read_parameters(parameters_file_name: str) -> tuple[list, list, list, list,
         - Missing search_date → defaults to current date
         - Missing folder_name → defaults to filename-based name
         - Missing filters → defaults to empty lists
+
+        The optional 'performance' and 'deduplication' sections are not part of the
+        returned tuple. They are merged with their defaults and exposed via
+        get_performance_parameters() and get_deduplication_parameters().
     """
+    global _performance_parameters, _deduplication_parameters
     try:
         # Refresh compat logger to use the current SaLS logger if available
         try:
@@ -1122,6 +1252,19 @@ def read_parameters(parameters_file_name: str) -> tuple[list, list, list, list,
             logger.warning(f"Error processing folder name: {type(ex).__name__}: {str(ex)}")
             folder_name = parameters_file_name.replace('.yaml', '')
 
+        # Safe extraction of performance parameters (kept as module state, not part of the returned tuple)
+        try:
+            _performance_parameters = _extract_performance_parameters(parameters)
+        except Exception as ex:
+            logger.warning(f"Error processing performance parameters: {type(ex).__name__}: {str(ex)}")
+            _performance_parameters = dict(DEFAULT_PERFORMANCE_PARAMETERS)
+        try:
+            _deduplication_parameters = _extract_section_parameters(parameters, 'deduplication',
+                                                                    DEFAULT_DEDUPLICATION_PARAMETERS)
+        except Exception as ex:
+            logger.warning(f"Error processing deduplication parameters: {type(ex).__name__}: {str(ex)}")
+            _deduplication_parameters = dict(DEFAULT_DEDUPLICATION_PARAMETERS)
+
         return queries, syntactic_filters, semantic_filters, fields, types, synonyms, databases, dates, start_date, \
             end_date, search_date, folder_name
             
@@ -1599,19 +1742,24 @@ def merge_papers(step: int, merge_step_1: int, merge_step_2: int, folder_name: s
 # These functions handle data cleaning, deduplication, and quality filtering
 # for research papers data.
 
-def remove_repeated(file: str) -> None:
+def remove_repeated(file: str, provenance_file: str = None) -> None:
     """Remove duplicate papers from a CSV file based on multiple criteria.
     
-    This function performs comprehensive deduplication of research papers based on
-    DOI, title, and abstract content. It handles various edge cases including
-    missing DOIs, empty abstracts, and different text formats. The deduplication
-    process is designed to maintain data quality while removing obvious duplicates.
+    This function performs deduplication of research papers based on DOI, title,
+    and abstract content. Instead of comparing the full text, each paper gets a
+    64-bit fingerprint of its normalized DOI, title and abstract, and a paper is
+    removed when any of its fingerprints matches an earlier paper.
     
-    The function processes the file in-place, reading the CSV, performing deduplication,
-    and then saving the cleaned data back to the same file.
+    The function processes the file in-place. When the 'dedup_chunk_size' performance
+    parameter is greater than 0 the file is processed in chunks of that many papers
+    instead of being loaded in memory.
     
     Args:
         file: Path to the CSV file containing papers to deduplicate.
+        provenance_file: Optional path of a CSV file where the removed papers are
+            recorded together with the paper kept in their place and the matching key
+            (papers are identified by PROVENANCE_PAPER_COLUMNS, since the rows of the
+            file change).
             
     Returns:
         None
@@ -1625,16 +1773,36 @@ def remove_repeated(file: str) -> None:
         >>> # File deduplicated in-place
         
     Note:
-        Deduplication is performed in the following order:
-        1. DOI-based deduplication (case-insensitive)
-        2. Title-based deduplication (normalized, case-insensitive)
-        3. Abstract-based deduplication (normalized, case-insensitive)
-        
-        Empty abstracts and titles are filtered out during processing.
-        The function handles various text normalization (hyphens, newlines, spaces).
+        Papers without title or abstract are removed before deduplication.
+        DOIs are compared case-insensitively and missing DOIs never match.
+        Titles and abstracts are compared case-insensitively, ignoring hyphens,
+        spaces and new lines. When the 'near_duplicate_threshold' deduplication
+        parameter is greater than 0, papers with near-duplicate titles and abstracts
+        are merged as well (see util.near_duplicates).
         All operations are logged for transparency and debugging.
     """
     try:
+        chunk_size = get_performance_parameters()['dedup_chunk_size']
+        if chunk_size > 0:
+            # Out-of-core deduplication for files that do not fit in memory
+            temporary_file = file + '.dedup'
+            number_papers, provenance = dedup.deduplicate_csv(file, temporary_file, chunk_size=chunk_size,
+                                                              required=['title', 'abstract'], encoding=fr)
+            if provenance_file is not None:
+                # Records are row positions of the file before deduplication
+                provenance = _describe_provenance(
+                    provenance, pd.read_csv(file, usecols=lambda column: column in PROVENANCE_PAPER_COLUMNS))
+            os.replace(temporary_file, file)
+            if get_deduplication_parameters()['near_duplicate_threshold'] > 0:
+                logger.info(
+                    LogCategory.DATA,
+                    "util",
+                    "remove_repeated",
+                    "Near-duplicate merging is skipped when deduplicating in chunks (dedup_chunk_size > 0)"
+                )
+            _log_deduplication(provenance, number_papers, provenance_file)
+            return
+
         # Read the file with error handling
         try:
             df = pd.read_csv(file)
@@ -1681,64 +1849,16 @@ def remove_repeated(file: str) -> None:
             
             return
 
+        papers = df
+        provenance = None
         try:
-            # Process DOI deduplication
-            df['doi'] = df['doi'].str.lower()
-            df['doi'].replace(r'\s+', np.nan, regex=True)
-            nan_doi = df.loc[df['doi'] == np.nan]
-            df = df.drop_duplicates('doi')
-            df = pd.concat([df, nan_doi])
-        except (KeyError, ValueError, TypeError) as e:
-            context = create_error_context(
-                module="util",
-                function="remove_repeated",
-                operation="doi_deduplication",
-                severity=ErrorSeverity.WARNING,
-                category=ErrorCategory.DATA
-            )
-            
-            error_info = get_standard_error_info("data_validation_failed")
-            error_handler = ErrorHandler(logger)
-            error_msg = error_handler.handle_error(
-                error=e,
-                context=context,
-                error_type="DOIDeduplicationError",
-                error_description=f"Error processing DOI deduplication: {type(e).__name__}: {str(e)}",
-                recovery_suggestion=error_info["recovery"],
-                next_steps=error_info["next_steps"]
-            )
-        except Exception as ex:
-            context = create_error_context(
-                module="util",
-                function="remove_repeated",
-                operation="doi_deduplication",
-                severity=ErrorSeverity.WARNING,
-                category=ErrorCategory.DATA
-            )
-            
-            error_info = get_standard_error_info("data_validation_failed")
-            error_handler = ErrorHandler(logger)
-            error_msg = error_handler.handle_error(
-                error=ex,
-                context=context,
-                error_type="DOIDeduplicationError",
-                error_description=f"Unexpected error processing DOI deduplication: {type(ex).__name__}: {str(ex)}",
-                recovery_suggestion=error_info["recovery"],
-                next_steps=error_info["next_steps"]
-            )
-
-        try:
-            # Process title deduplication
-            df['title_lower'] = df['title'].str.lower()
-            df['title_lower'] = df['title_lower'].str.replace('-', ' ')
-            df['title_lower'] = df['title_lower'].str.replace('\n', '')
-            df['title_lower'] = df['title_lower'].str.replace(' ', '')
-            df = df.drop_duplicates('title_lower')
+            # Deduplicate on the fingerprints of DOI, title and abstract
+            df, provenance = dedup.deduplicate(df, required=['title', 'abstract'])
         except (KeyError, ValueError, TypeError) as e:
             context = create_error_context(
                 module="util",
                 function="remove_repeated",
-                operation="title_deduplication",
+                operation="deduplication",
                 severity=ErrorSeverity.WARNING,
                 category=ErrorCategory.DATA
             )
@@ -1748,8 +1868,8 @@ def remove_repeated(file: str) -> None:
             error_msg = error_handler.handle_error(
                 error=e,
                 context=context,
-                error_type="TitleDeduplicationError",
-                error_description=f"Error processing title deduplication: {type(e).__name__}: {str(e)}",
+                error_type="DeduplicationError",
+                error_description=f"Error processing deduplication: {type(e).__name__}: {str(e)}",
                 recovery_suggestion=error_info["recovery"],
                 next_steps=error_info["next_steps"]
             )
@@ -1757,7 +1877,7 @@ def remove_repeated(file: str) -> None:
             context = create_error_context(
                 module="util",
                 function="remove_repeated",
-                operation="title_deduplication",
+                operation="deduplication",
                 severity=ErrorSeverity.WARNING,
                 category=ErrorCategory.DATA
             )
@@ -1767,153 +1887,68 @@ def remove_repeated(file: str) -> None:
             error_msg = error_handler.handle_error(
                 error=ex,
                 context=context,
-                error_type="TitleDeduplicationError",
-                error_description=f"Unexpected error processing title deduplication: {type(ex).__name__}: {str(ex)}",
+                error_type="DeduplicationError",
+                error_description=f"Unexpected error processing deduplication: {type(ex).__name__}: {str(ex)}",
                 recovery_suggestion=error_info["recovery"],
                 next_steps=error_info["next_steps"]
             )
 
-        try:
-            # Clean empty abstracts and titles
-            df.loc[:, 'abstract'] = df['abstract'].replace('', float("NaN"))
-            df.dropna(subset=['abstract'], inplace=True)
-            df.loc[:, 'title'] = df['title'].replace('', float("NaN"))
-            df.dropna(subset=['title'], inplace=True)
-        except (KeyError, ValueError, TypeError) as e:
-            context = create_error_context(
-                module="util",
-                function="remove_repeated",
-                operation="empty_values_cleaning",
-                severity=ErrorSeverity.WARNING,
-                category=ErrorCategory.DATA
-            )
-            
-            error_info = get_standard_error_info("data_validation_failed")
-            error_handler = ErrorHandler(logger)
-            error_msg = error_handler.handle_error(
-                error=e,
-                context=context,
-                error_type="EmptyValuesCleaningError",
-                error_description=f"Error cleaning empty values: {type(e).__name__}: {str(e)}",
-                recovery_suggestion=error_info["recovery"],
-                next_steps=error_info["next_steps"]
-            )
-        except Exception as ex:
-            context = create_error_context(
-                module="util",
-                function="remove_repeated",
-                operation="empty_values_cleaning",
-                severity=ErrorSeverity.WARNING,
-                category=ErrorCategory.DATA
-            )
-            
-            error_info = get_standard_error_info("data_validation_failed")
-            error_handler = ErrorHandler(logger)
-            error_msg = error_handler.handle_error(
-                error=ex,
-                context=context,
-                error_type="EmptyValuesCleaningError",
-                error_description=f"Unexpected error cleaning empty values: {type(ex).__name__}: {str(ex)}",
-                recovery_suggestion=error_info["recovery"],
-                next_steps=error_info["next_steps"]
-            )
-
-        try:
-            # Process abstract deduplication
-            df['abstract_lower'] = df['abstract'].str.lower()
-            df['abstract_lower'] = df['abstract_lower'].str.replace('-', ' ')
-            df['abstract_lower'] = df['abstract_lower'].str.replace('\n', '')
-            df['abstract_lower'] = df['abstract_lower'].str.replace(' ', '')
-            df = df.drop_duplicates('abstract_lower')
-        except (KeyError, ValueError, TypeError) as e:
-            context = create_error_context(
-                module="util",
-                function="remove_repeated",
-                operation="abstract_deduplication",
-                severity=ErrorSeverity.WARNING,
-                category=ErrorCategory.DATA
-            )
-            
-            error_info = get_standard_error_info("data_validation_failed")
-            error_handler = ErrorHandler(logger)
-            error_msg = error_handler.handle_error(
-                error=e,
-                context=context,
-                error_type="AbstractDeduplicationError",
-                error_description=f"Error processing abstract deduplication: {type(e).__name__}: {str(e)}",
-                recovery_suggestion=error_info["recovery"],
-                next_steps=error_info["next_steps"]
-            )
-        except Exception as ex:
-            context = create_error_context(
-                module="util",
-                function="remove_repeated",
-                operation="abstract_deduplication",
-                severity=ErrorSeverity.WARNING,
-                category=ErrorCategory.DATA
-            )
-            
-            error_info = get_standard_error_info("data_validation_failed")
-            error_handler = ErrorHandler(logger)
-            error_msg = error_handler.handle_error(
-                error=ex,
-                context=context,
-                error_type="AbstractDeduplicationError",
-                error_description=f"Unexpected error processing abstract deduplication: {type(ex).__name__}: {str(ex)}",
-                recovery_suggestion=error_info["recovery"],
-                next_steps=error_info["next_steps"]
-            )
-
-        try:
-            # Clean up temporary columns
-            df = df.drop(['abstract_lower', 'title_lower'], axis=1)
-        except (KeyError, ValueError, TypeError) as e:
-            context = create_error_context(
-                module="util",
-                function="remove_repeated",
-                operation="temporary_columns_cleanup",
-                severity=ErrorSeverity.WARNING,
-                category=ErrorCategory.DATA
-            )
-            
-            error_info = get_standard_error_info("data_validation_failed")
-            error_handler = ErrorHandler(logger)
-            error_msg = error_handler.handle_error(
-                error=e,
-                context=context,
-                error_type="TemporaryColumnsCleanupError",
-                error_description=f"Error cleaning up temporary columns: {type(e).__name__}: {str(e)}",
-                recovery_suggestion=error_info["recovery"],
-                next_steps=error_info["next_steps"]
-            )
-        except Exception as ex:
-            context = create_error_context(
-                module="util",
-                function="remove_repeated",
-                operation="temporary_columns_cleanup",
-                severity=ErrorSeverity.WARNING,
-                category=ErrorCategory.DATA
-            )
-            
-            error_info = get_standard_error_info("data_validation_failed")
-            error_handler = ErrorHandler(logger)
-            error_msg = error_handler.handle_error(
-                error=ex,
-                context=context,
-                error_type="TemporaryColumnsCleanupError",
-                error_description=f"Unexpected error cleaning up temporary columns: {type(ex).__name__}: {str(ex)}",
-                recovery_suggestion=error_info["recovery"],
-                next_steps=error_info["next_steps"]
-            )
+        near_duplicate_threshold = get_deduplication_parameters()['near_duplicate_threshold']
+        if near_duplicate_threshold > 0:
+            try:
+                # Merge papers whose title and abstract are near duplicates (e.g. preprint and published version)
+                deduplication_parameters = get_deduplication_parameters()
+                df, near_provenance = near_duplicates.merge_near_duplicates(
+                    df, threshold=near_duplicate_threshold, num_perm=deduplication_parameters['num_perm'],
+                    shingle_size=deduplication_parameters['shingle_size'])
+                near_provenance['matched_on'] = 'near_duplicate'
+                provenance = pd.concat([provenance, near_provenance], ignore_index=True) \
+                    if provenance is not None else near_provenance
+            except (KeyError, ValueError, TypeError) as e:
+                context = create_error_context(
+                    module="util",
+                    function="remove_repeated",
+                    operation="near_duplicate_merging",
+                    severity=ErrorSeverity.WARNING,
+                    category=ErrorCategory.DATA
+                )
+                
+                error_info = get_standard_error_info("data_validation_failed")
+                error_handler = ErrorHandler(logger)
+                error_msg = error_handler.handle_error(
+                    error=e,
+                    context=context,
+                    error_type="NearDuplicateMergingError",
+                    error_description=f"Error merging near-duplicate papers: {type(e).__name__}: {str(e)}",
+                    recovery_suggestion=error_info["recovery"],
+                    next_steps=error_info["next_steps"]
+                )
+            except Exception as ex:
+                context = create_error_context(
+                    module="util",
+                    function="remove_repeated",
+                    operation="near_duplicate_merging",
+                    severity=ErrorSeverity.WARNING,
+                    category=ErrorCategory.DATA
+                )
+                
+                error_info = get_standard_error_info("data_validation_failed")
+                error_handler = ErrorHandler(logger)
+                error_msg = error_handler.handle_error(
+                    error=ex,
+                    context=context,
+                    error_type="NearDuplicateMergingError",
+                    error_description=f"Unexpected error merging near-duplicate papers: {type(ex).__name__}: {str(ex)}",
+                    recovery_suggestion=error_info["recovery"],
+                    next_steps=error_info["next_steps"]
+                )
 
         try:
-            logger.info(
-                LogCategory.DATA,
-                "util",
-                "remove_repeated",
-                f"Number of papers: {len(df)}"
-            )
+            if provenance_file is not None:
+                # Records are index labels of the papers before deduplication
+                provenance = _describe_provenance(provenance, papers)
             save(file, df, fr, 'w')
+            _log_deduplication(provenance, len(df), provenance_file)
         except Exception as save_ex:
             context = create_error_context(
                 module="util",
@@ -1955,6 +1990,48 @@ def remove_repeated(file: str) -> None:
         )
 
 
+def _describe_provenance(provenance: pd.DataFrame, papers: pd.DataFrame) -> pd.DataFrame:
+    """Provenance of remove_repeated with the removed and kept papers identified by their columns.
+
+    Args:
+        provenance: Provenance with the labels of the removed (record) and kept
+            (kept_record) papers in papers, or None.
+        papers: Papers before deduplication.
+
+    Returns:
+        DataFrame with the PROVENANCE_PAPER_COLUMNS of the removed papers, the same
+        columns of the kept papers (prefixed with 'kept_') and the matching key.
+    """
+    columns = [column for column in PROVENANCE_PAPER_COLUMNS if column in papers.columns]
+    if provenance is None:
+        provenance = pd.DataFrame(columns=dedup.PROVENANCE_COLUMNS)
+    removed = papers.loc[provenance['record'], columns].reset_index(drop=True)
+    kept = papers.loc[provenance['kept_record'], columns].reset_index(drop=True).add_prefix('kept_')
+    details = provenance.drop(columns=['record', 'kept_record']).reset_index(drop=True)
+    return pd.concat([removed, kept, details], axis=1)
+
+
+def _log_deduplication(provenance: pd.DataFrame, number_papers: int, provenance_file: str = None) -> None:
+    """Log the result of remove_repeated and optionally save the provenance of the removed papers."""
+    if provenance is not None and len(provenance) > 0:
+        matches = provenance['matched_on'].value_counts()
+        logger.info(
+            LogCategory.DATA,
+            "util",
+            "remove_repeated",
+            f"Removed {len(provenance)} repeated papers (" +
+            ", ".join(f"{key}: {int(count)}" for key, count in matches.items()) + ")"
+        )
+    if provenance is not None and provenance_file is not None:
+        save(provenance_file, provenance, fr, 'w')
+    logger.info(
+        LogCategory.DATA,
+        "util",
+        "remove_repeated",
+        f"Number of papers: {number_papers}"
+    )
+
+
 def clean_papers(file: str) -> None:
     """Clean and filter research papers based on content quality and language.
     
@@ -1988,9 +2065,14 @@ def clean_papers(file: str) -> None:
         1. Content validation (non-empty abstracts/titles)
         2. Survey/review paper filtering (title-based)
         3. Thesis paper filtering (abstract-based)
-        4. Language detection using spaCy (English only)
+        4. Language detection (English only)
         5. Language confidence scoring (threshold: 0.99)
         
+        The language is identified by the backend set in the 'language_backend' performance
+        parameter (character n-gram classifier by default, or 'spacy'), in batches of
+        'language_batch_size' abstracts. Verdicts are cached by abstract hash in the
+        'language_cache_file' performance parameter, so abstracts already checked by a
+        previous run or semantic filter are not detected again.
         Progress is displayed using tqdm for long operations.
         Non-English papers are marked and then filtered out.
         All operations are logged for transparency and debugging.
@@ -2179,7 +2261,6 @@ def clean_papers(file: str) -> None:
             not_included = 0
             df.loc[:, 'language'] = 'english'
             total_papers = len(df.index)
-            current_paper = 0
             
             if total_papers == 0:
                 logger.warning(
@@ -2190,62 +2271,24 @@ def clean_papers(file: str) -> None:
                 )
                 return
                 
-            pbar = tqdm(total=len(df.index))
-            
-            for index, row in df.iterrows():
-                try:
-                    current_paper = current_paper + 1
-                    
-                    # Language detection with error handling
-                    try:
-                        doc = nlp(row['abstract'])
-                        detect_language = doc.lang_
-                        
-                        if detect_language != 'en':
-                            row['language'] = 'not english'
-                            not_included = not_included + 1
-                                
-                    except (AttributeError, KeyError, TypeError) as e:
-                        logger.debug(
-                            LogCategory.DATA,
-                            "util",
-                            "clean_papers",
-                            f"Error in language detection for paper {index}: {type(e).__name__}: {str(e)}"
-                        )
-                        row['language'] = 'not english'
-                        not_included = not_included + 1
-                    except Exception as ex:
-                        logger.debug(
-                            LogCategory.DATA,
-                            "util",
-                            "clean_papers",
-                            f"Unexpected error in language detection for paper {index}: {type(ex).__name__}: {str(ex)}"
-                        )
-                        row['language'] = 'not english'
-                        not_included = not_included + 1
-                        
-                    df.loc[index] = row
-                    pbar.update(1)
-                    
-                except (KeyError, ValueError, TypeError, IndexError) as e:
-                    logger.debug(
-                        LogCategory.DATA,
-                        "util",
-                        "clean_papers",
-                        f"Error processing paper at index {index}: {type(e).__name__}: {str(e)}"
-                    )
-                    continue
-                except Exception as ex:
-                    logger.debug(
-                        LogCategory.DATA,
-                        "util",
-                        "clean_papers",
-                        f"Unexpected error processing paper at index {index}: {type(ex).__name__}: {str(ex)}"
-                    )
-                    continue
-                    
-            pbar.close()
+            performance_parameters = get_performance_parameters()
+            english = language.is_english(
+                df['abstract'].tolist(),
+                batch_size=performance_parameters['language_batch_size'],
+                n_process=performance_parameters['language_n_process'],
+                progress=lambda verdicts, total: tqdm(verdicts, total=total),
+                backend=performance_parameters['language_backend'],
+                cache_file=performance_parameters['language_cache_file']
+            )
+            df.loc[:, 'language'] = np.where(english, 'english', 'not english')
+            not_included = int((~english).sum())
             print('', end="\r")
+            logger.info(
+                LogCategory.DATA,
+                "util",
+                "clean_papers",
+                f"Papers not written in English: {not_included}"
+            )
             
         except Exception as ex:
             context = create_error_context(